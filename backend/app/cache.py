@@ -0,0 +1,173 @@
+# D:\globus-market\backend\app\cache.py
+
+import os
+import threading
+import time
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from app import models
+from app.database import upsert_insert
+
+# Простой кэш в памяти процесса для данных каталога, которые часто читаются
+# и редко меняются (дерево категорий, снимок витрины и т.п.).
+# Каждый воркер uvicorn держит свою копию. Любая запись в товары, остатки или категории
+# поднимает версию "catalog" в таблице cache_versions (bump_catalog_version) в той же транзакции;
+# воркеры сверяют версию не чаще раза в CATALOG_VERSION_CHECK_INTERVAL секунд и при изменении
+# строят значения заново. Воркер, сделавший запись, сбрасывает свою копию сразу после commit.
+CATALOG_VERSION_CHECK_INTERVAL = float(os.getenv("CATALOG_VERSION_CHECK_INTERVAL", "5"))
+CATALOG_VERSION_NAME = "catalog"
+
+_lock = threading.Lock()
+_catalog_cache = {}  # ключ -> (версия каталога, значение)
+# (версия каталога, время её изменения, время последней сверки версии)
+_catalog_version_state = (None, None, 0.0)
+
+
+def get_catalog_state(db: Session) -> tuple:
+    """
+    Текущие (версия каталога, время последнего изменения каталога).
+    В БД обращаемся не чаще раза в CATALOG_VERSION_CHECK_INTERVAL секунд.
+    """
+    global _catalog_version_state
+    version, updated_at, checked_at = _catalog_version_state
+    now = time.monotonic()
+    if version is not None and now - checked_at < CATALOG_VERSION_CHECK_INTERVAL:
+        return version, updated_at
+
+    version, updated_at = read_cache_version_state(db, CATALOG_VERSION_NAME)
+    _catalog_version_state = (version, updated_at, now)
+    return version, updated_at
+
+
+def get_catalog_version(db: Session) -> int:
+    return get_catalog_state(db)[0]
+
+
+def get_catalog_cached(db: Session, key: str, builder):
+    """
+    Возвращает значение из кэша каталога по ключу.
+    Если значения нет или оно построено для старой версии каталога - строит его через builder() и сохраняет.
+    """
+    # Версию читаем ДО построения значения: данные будут не старше версии, под которой сохраняются
+    version = get_catalog_version(db)
+    entry = _catalog_cache.get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+
+    value = builder()
+    with _lock:
+        if any(cached_version != version for cached_version, _ in _catalog_cache.values()):
+            _catalog_cache.clear()  # значения старых версий больше не понадобятся
+        _catalog_cache[key] = (version, value)
+    return value
+
+
+def bump_catalog_version(db: Session):
+    """
+    Отмечает изменение каталога (товары, остатки, категории). Вызывать в той же транзакции, что и само изменение.
+    После commit этой сессии локальная копия кэша сбросится автоматически (см. _reset_catalog_after_commit).
+    """
+    bump_cache_version(db, CATALOG_VERSION_NAME)
+    db.info["catalog_changed"] = True
+
+
+def invalidate_catalog():
+    """Сбрасывает локальную копию кэша каталога: следующий запрос сверит версию с БД."""
+    global _catalog_version_state
+    with _lock:
+        _catalog_cache.clear()
+    _catalog_version_state = (None, None, 0.0)
+
+
+@event.listens_for(Session, "after_commit")
+def _reset_catalog_after_commit(session):
+    if session.info.pop("catalog_changed", False):
+        invalidate_catalog()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_catalog_change(session):
+    session.info.pop("catalog_changed", None)
+
+
+# --- Кэш настроек (AppSettings) ---
+# Настройки меняются несколько раз в месяц, а читаются на каждом запросе каталога и при каждом заказе.
+# Держим их в памяти; чтобы изменения из другого воркера подхватывались, не чаще раза
+# в SETTINGS_VERSION_CHECK_INTERVAL секунд сверяем версию в таблице cache_versions.
+SETTINGS_VERSION_CHECK_INTERVAL = float(os.getenv("SETTINGS_VERSION_CHECK_INTERVAL", "5"))
+SETTINGS_VERSION_NAME = "settings"
+
+# (значения настроек, их версия, время изменения версии, время последней сверки версии)
+_settings_state = (None, None, None, 0.0)
+
+
+def read_cache_version_state(db: Session, name: str) -> tuple:
+    """(версия, время последнего изменения) из cache_versions. Для ещё не менявшихся данных - (0, None)."""
+    row = db.query(models.CacheVersion.version, models.CacheVersion.updated_at).filter(models.CacheVersion.name == name).first()
+    if row is None:
+        return 0, None
+    return row.version or 0, row.updated_at
+
+
+def bump_cache_version(db: Session, name: str):
+    """Увеличивает версию данных. Вызывать в той же транзакции, что и само изменение (до commit)."""
+    insert = upsert_insert(db.get_bind())
+    statement = insert(models.CacheVersion).values(name=name, version=1, updated_at=func.now())
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[models.CacheVersion.name],
+        set_={"version": models.CacheVersion.version + 1, "updated_at": func.now()}
+    ))
+
+
+def get_settings(db: Session) -> dict:
+    """Возвращает все настройки в виде словаря {key: value} из памяти, при необходимости перечитывая их из БД."""
+    global _settings_state
+    values, version, _, checked_at = _settings_state
+    now = time.monotonic()
+    if values is not None and now - checked_at < SETTINGS_VERSION_CHECK_INTERVAL:
+        return values
+
+    current_version, updated_at = read_cache_version_state(db, SETTINGS_VERSION_NAME)
+    if values is None or current_version != version:
+        values = {setting.key: setting.value for setting in db.query(models.AppSettings).all()}
+    _settings_state = (values, current_version, updated_at, now)
+    return values
+
+
+def get_setting_bool(db: Session, key: str, default: bool) -> bool:
+    value = get_settings(db).get(key)
+    return default if value is None else value == "true"
+
+
+# Настройки, которые можно показывать на витрине (контакты)
+PUBLIC_SETTING_KEYS = (
+    "contact_whatsapp",
+    "contact_instagram_1",
+    "contact_instagram_2",
+    "contact_instagram_3",
+    "contact_telegram",
+    "contact_whatsapp_display",
+)
+
+
+def public_settings(db: Session) -> dict:
+    settings = get_settings(db)
+    return {key: settings[key] for key in PUBLIC_SETTING_KEYS if key in settings}
+
+
+def get_settings_state(db: Session) -> tuple:
+    """(версия, время изменения) настроек, под которыми сейчас лежит локальная копия (см. get_settings)."""
+    get_settings(db)
+    return _settings_state[1], _settings_state[2]
+
+
+def get_settings_version(db: Session) -> int:
+    return get_settings_state(db)[0]
+
+
+def invalidate_settings():
+    """Сбрасывает локальную копию настроек (версию в БД поднимает bump_cache_version)."""
+    global _settings_state
+    _settings_state = (None, None, None, 0.0)
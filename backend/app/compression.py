@@ -0,0 +1,136 @@
+# D:\globus-market\backend\app\compression.py
+#
+# Сжатие ответов на лету: brotli (если установлен пакет brotli) или gzip - что принимает клиент.
+# Сжимается только текст (JSON, HTML, JS, CSS...) и только ответы от COMPRESSION_MINIMUM_SIZE байт:
+# маленький ответ после сжатия почти не уменьшается, а CPU тратится.
+# Уже сжатое не трогаем: статику с заранее сжатыми .br/.gz (app/static_files.py),
+# ZIP-выгрузку накладных, PDF/Excel и картинки.
+
+import os
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from app.static_files import accepted_encodings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024"))
+GZIP_COMPRESS_LEVEL = int(os.getenv("GZIP_COMPRESS_LEVEL", "6"))
+# На лету - среднее качество: сжимает лучше gzip за сопоставимое время (11 - только для build_static.py)
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+COMPRESSIBLE_MEDIA_TYPES = (
+    "text/", "application/json", "application/javascript", "application/xml",
+    "application/manifest+json", "image/svg+xml",
+)
+
+
+def choose_encoding(request_headers: Headers) -> Optional[str]:
+    """Кодировка сжатия для запроса: 'br', 'gzip' или None, если клиент не принимает ни одну из доступных."""
+    accepted = accepted_encodings(request_headers)
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def _make_compressor(encoding: str):
+    """Возвращает (compress(bytes) -> bytes, finish() -> bytes)."""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        return compressor.process, compressor.finish
+    compressor = zlib.compressobj(GZIP_COMPRESS_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # 16+ - формат gzip
+    return compressor.compress, compressor.flush
+
+
+class _CompressingSend:
+    """
+    Обёртка над send одного ответа. Решение "сжимать или нет" принимается на первом куске тела:
+    к этому моменту известны заголовки и, для обычного (не потокового) ответа, его размер.
+    """
+
+    def __init__(self, send, encoding: str, minimum_size: int):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start_message = None
+        self.compress = None
+        self.finish = None
+
+    def should_compress(self, headers: MutableHeaders, body: bytes, more_body: bool) -> bool:
+        if "content-encoding" in headers:
+            return False
+        if not headers.get("content-type", "").startswith(COMPRESSIBLE_MEDIA_TYPES):
+            return False
+        # У потокового ответа размер заранее неизвестен - сжимаем
+        return more_body or len(body) >= self.minimum_size
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            # Заголовки отправим вместе с первым куском тела, когда станет ясно, сжимаем ли
+            self.start_message = message
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.start_message is not None:
+            start, self.start_message = self.start_message, None
+            headers = MutableHeaders(raw=start["headers"])
+            if not self.should_compress(headers, body, more_body):
+                await self.send(start)
+                await self.send(message)
+                return
+
+            self.compress, self.finish = _make_compressor(self.encoding)
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            # Сжатые байты отличаются от исходных - сильный ETag становится слабым
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = f"W/{etag}"
+            if more_body:
+                del headers["content-length"]
+                await self.send(start)
+                await self.send({"type": "http.response.body", "body": self.compress(body), "more_body": True})
+            else:
+                data = self.compress(body) + self.finish()
+                headers["Content-Length"] = str(len(data))
+                await self.send(start)
+                await self.send({"type": "http.response.body", "body": data})
+            return
+
+        if self.compress is None:
+            await self.send(message)
+            return
+        data = self.compress(body)
+        if not more_body:
+            data += self.finish()
+        await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+
+class CompressionMiddleware:
+    """ASGI-мидлварь сжатия ответов. Подключение: app.add_middleware(CompressionMiddleware)."""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressingSend(send, encoding, self.minimum_size))
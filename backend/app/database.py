@@ -1,12 +1,194 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.engine import make_url
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.schema import CreateColumn
+from datetime import datetime, timezone
 import os
+import threading
+import time
 
 # Эта строка читает переменную окружения, которую мы задали на Render
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-# Для PostgreSQL убираем connect_args
-engine = create_engine(DATABASE_URL)
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    return default if value is None else value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# --- Настройки пула соединений (переменные окружения) ---
+# DB_POOL_SIZE / DB_MAX_OVERFLOW - постоянные и "сверхлимитные" соединения одного воркера;
+# DB_MAX_CONNECTIONS - общий бюджет соединений сервера БД, делится на WEB_CONCURRENCY воркеров
+# и ограничивает pool_size + max_overflow, чтобы все воркеры вместе не превысили лимит базы.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # хостинг рвёт простаивающие соединения
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", True)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))  # 0 - без ограничения
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+DB_MAX_CONNECTIONS = os.getenv("DB_MAX_CONNECTIONS")
+
+# --- Асинхронный режим (DB_ASYNC=1) ---
+# Горячие публичные маршруты (GET /products, GET /categories, POST /orders, см. app/routers/async_public.py)
+# работают через AsyncSession на асинхронном драйвере прямо в event loop, не занимая общий пул потоков.
+# Остальное приложение остаётся синхронным. Драйвер нужен только в этом режиме:
+# pip install asyncpg (PostgreSQL) или pip install aiosqlite (SQLite).
+DB_ASYNC = _env_bool("DB_ASYNC", False)
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "postgres": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+if DB_MAX_CONNECTIONS:
+    per_worker_budget = max(1, int(DB_MAX_CONNECTIONS) // WEB_CONCURRENCY)
+    if DB_ASYNC:
+        # У воркера два пула (синхронный и асинхронный) - делим его бюджет между ними
+        per_worker_budget = max(1, per_worker_budget // 2)
+    DB_POOL_SIZE = min(DB_POOL_SIZE, per_worker_budget)
+    DB_MAX_OVERFLOW = min(DB_MAX_OVERFLOW, per_worker_budget - DB_POOL_SIZE)
+
+
+# --- Метрики пула ---
+_pool_stats_lock = threading.Lock()
+_pool_stats = {
+    "checkouts": 0,
+    "checkout_failures": 0,
+    "wait_seconds_total": 0.0,
+    "wait_seconds_max": 0.0,
+    "last_failure": None,
+}
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool, который считает выдачи соединений, время ожидания свободного соединения и отказы по таймауту."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception as e:
+            with _pool_stats_lock:
+                _pool_stats["checkout_failures"] += 1
+                _pool_stats["last_failure"] = f"{datetime.now(timezone.utc).isoformat()}: {e}"
+            raise
+        waited = time.perf_counter() - started
+        with _pool_stats_lock:
+            _pool_stats["checkouts"] += 1
+            _pool_stats["wait_seconds_total"] += waited
+            _pool_stats["wait_seconds_max"] = max(_pool_stats["wait_seconds_max"], waited)
+        return connection
+
+
+def _engine_options(url: str) -> dict:
+    if url.startswith("sqlite") and ":memory:" in url:
+        return {}  # in-memory SQLite живёт в одном соединении - пул не нужен
+
+    options = {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if url.startswith("postgresql") and DB_STATEMENT_TIMEOUT_MS > 0:
+        options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    return options
+
+
+def async_database_url(url: str):
+    """URL синхронного драйвера -> URL асинхронного: postgresql://... -> postgresql+asyncpg://..."""
+    parsed = make_url(url)
+    dialect = parsed.drivername.split("+")[0]
+    if dialect not in ASYNC_DRIVERS:
+        raise ValueError(f"DB_ASYNC: нет асинхронного драйвера для {parsed.drivername}")
+    parsed = parsed.set(drivername=ASYNC_DRIVERS[dialect])
+    if parsed.drivername == "postgresql+asyncpg" and "sslmode" in parsed.query:
+        # asyncpg не знает параметр libpq sslmode, у него это ssl
+        parsed = parsed.update_query_dict({"ssl": parsed.query["sslmode"]}).difference_update_query(["sslmode"])
+    return parsed
+
+
+def _async_engine_options(url: str) -> dict:
+    if url.startswith("sqlite") and ":memory:" in url:
+        return {}
+
+    options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if url.startswith("postgres") and DB_STATEMENT_TIMEOUT_MS > 0:
+        options["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+    return options
+
+
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-Base = declarative_base()
\ No newline at end of file
+async_engine = None
+AsyncSessionLocal = None
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    async_engine = create_async_engine(async_database_url(DATABASE_URL), **_async_engine_options(DATABASE_URL))
+    # expire_on_commit=False: после commit объекты не должны перечитываться неявно - в async это ошибка
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+Base = declarative_base()
+
+
+def add_missing_columns(engine):
+    """
+    Добавляет в уже существующие таблицы колонки, которые появились в моделях позже.
+    create_all() создаёт только отсутствующие таблицы, а у нас нет миграций,
+    поэтому новые колонки в моделях должны быть nullable (или иметь server_default).
+    """
+    existing_tables = set(inspect(engine).get_table_names())
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {column["name"] for column in inspect(conn).get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    column_ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                    conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column_ddl}")
+
+
+def upsert_insert(bind):
+    """Возвращает insert() текущей СУБД - с поддержкой on_conflict_do_update (PostgreSQL и SQLite)."""
+    if bind.dialect.name == "postgresql":
+        return postgresql.insert
+    return sqlite.insert
+
+
+def get_pool_metrics() -> dict:
+    """Текущее состояние пула соединений и накопленные метрики (для админки/мониторинга)."""
+    pool = engine.pool
+    with _pool_stats_lock:
+        stats = dict(_pool_stats)
+    metrics = {
+        "pool_class": type(pool).__name__,
+        "status": pool.status(),
+        "checkouts": stats["checkouts"],
+        "checkout_failures": stats["checkout_failures"],
+        "wait_seconds_avg": stats["wait_seconds_total"] / stats["checkouts"] if stats["checkouts"] else 0.0,
+        "wait_seconds_max": stats["wait_seconds_max"],
+        "last_failure": stats["last_failure"],
+    }
+    if isinstance(pool, QueuePool):
+        metrics.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "max_overflow": DB_MAX_OVERFLOW,
+            "timeout": pool.timeout(),
+        })
+    if async_engine is not None:
+        metrics["async_pool_status"] = async_engine.pool.status()
+    return metrics
@@ -1,10 +1,18 @@
 # D:\globus-market\backend\app\dependencies.py
 
-from app.database import SessionLocal
+from app.database import SessionLocal, AsyncSessionLocal
 
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db():
+    """Асинхронная сессия БД. Только в режиме DB_ASYNC=1 (см. app/database.py)."""
+    if AsyncSessionLocal is None:
+        raise RuntimeError("Асинхронная сессия доступна только при DB_ASYNC=1")
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,85 @@
+# D:\globus-market\backend\app\http_cache.py
+#
+# Условные GET-запросы (ETag / Last-Modified -> 304 Not Modified) для ответов API.
+# Валидатор считается без построения ответа (по версии каталога/настроек или по одному агрегатному запросу),
+# поэтому повторный запрос браузера или прокси обходится без выборки и сериализации данных.
+
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Request, Response
+
+from app.static_files import etag_matches
+
+# Браузер и прокси хранят ответ, но перед использованием каждый раз сверяют его с сервером
+PUBLIC_REVALIDATE = "public, no-cache"
+# Данные админки - только в браузере самого администратора
+PRIVATE_REVALIDATE = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    """
+    Слабый ETag из частей валидатора (версии, параметры запроса...).
+    Слабый - потому что одно и то же содержимое может уйти и сжатым, и несжатым.
+    """
+    digest = hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()[:32]
+    return f'W/"{digest}"'
+
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite возвращает время без часового пояса, но func.now() там - это UTC
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def latest(*values):
+    """Самое позднее из известных времён изменения (None - время неизвестно)."""
+    known = [_as_utc(value) for value in values if value is not None]
+    return max(known) if known else None
+
+
+class ConditionalGet:
+    """
+    Валидаторы ответа. Использование в эндпоинте:
+
+        conditional = ConditionalGet(etag, last_modified, PUBLIC_REVALIDATE)
+        if conditional.is_fresh(request):
+            return conditional.not_modified()
+        conditional.apply(response)
+    """
+
+    def __init__(self, etag: str, last_modified=None, cache_control: str = PUBLIC_REVALIDATE):
+        self.etag = etag
+        # В HTTP-датах нет долей секунды
+        self.last_modified = _as_utc(last_modified).replace(microsecond=0) if last_modified else None
+        self.cache_control = cache_control
+
+    @property
+    def headers(self) -> dict:
+        headers = {"ETag": self.etag, "Cache-Control": self.cache_control}
+        if self.last_modified is not None:
+            headers["Last-Modified"] = format_datetime(self.last_modified, usegmt=True)
+        return headers
+
+    def is_fresh(self, request: Request) -> bool:
+        # Если есть If-None-Match, If-Modified-Since не учитывается (RFC 9110, 13.1.3)
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            return etag_matches(if_none_match, self.etag)
+
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since is None or self.last_modified is None:
+            return False
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return self.last_modified <= _as_utc(since)
+
+    def not_modified(self) -> Response:
+        return Response(status_code=304, headers=self.headers)
+
+    def apply(self, response: Response):
+        response.headers.update(self.headers)
@@ -0,0 +1,80 @@
+# D:\globus-market\backend\app\images.py
+#
+# Обработка изображений товаров: декодирование, уменьшение до нескольких размеров
+# и кодирование в WebP. Работа тяжёлая для CPU, поэтому выполняется в отдельном
+# ограниченном пуле потоков (Pillow отпускает GIL на декодировании/ресайзе/кодировании).
+
+import hashlib
+import io
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+IMAGE_DIR = BASE_DIR / "static" / "images"
+IMAGE_URL_PREFIX = "/static/images"
+
+# Размеры (по большей стороне), которые нужны витрине, карточкам и накладным
+IMAGE_SIZES = (160, 400, 800)
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+
+image_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image")
+
+
+def _safe_name(value: str) -> str:
+    return re.sub(r"[^0-9A-Za-z._-]", "_", value) or "product"
+
+
+def process_product_image(data: bytes, sku: str) -> dict:
+    """
+    Декодирует загруженное изображение и сохраняет его уменьшенные копии в WebP.
+    Имена файлов содержат хэш содержимого, поэтому их можно кэшировать "навсегда".
+    Возвращает словарь {"160": "/static/images/...-160.webp", ...}.
+    """
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    base_name = f"{_safe_name(sku)}-{digest}"
+
+    try:
+        image = Image.open(io.BytesIO(data))
+    except UnidentifiedImageError:
+        raise ValueError("Файл не является изображением")
+    image = ImageOps.exif_transpose(image)  # учитываем поворот с телефона
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "A" in image.getbands() or image.mode == "P" else "RGB")
+
+    os.makedirs(IMAGE_DIR, exist_ok=True)
+    variants = {}
+    # От большего к меньшему: каждый следующий размер уменьшаем из предыдущего, это быстрее
+    for size in sorted(IMAGE_SIZES, reverse=True):
+        image.thumbnail((size, size))
+        filename = f"{base_name}-{size}.webp"
+        tmp_path = IMAGE_DIR / f".{filename}.tmp"
+        image.save(tmp_path, "webp")
+        os.replace(tmp_path, IMAGE_DIR / filename)
+        variants[str(size)] = f"{IMAGE_URL_PREFIX}/{filename}"
+    return variants
+
+
+def remove_image_variants(variants: dict, keep: dict):
+    """Удаляет файлы старых вариантов изображения, которые не используются в новом наборе."""
+    keep_urls = set((keep or {}).values())
+    for url in (variants or {}).values():
+        if url in keep_urls or not url.startswith(f"{IMAGE_URL_PREFIX}/"):
+            continue
+        try:
+            os.remove(IMAGE_DIR / url[len(IMAGE_URL_PREFIX) + 1:])
+        except OSError:
+            pass
+
+
+def pick_image_url(image_url, image_variants, min_size: int):
+    """Выбирает самый маленький вариант изображения не меньше min_size пикселей (или исходный image_url)."""
+    if image_variants:
+        suitable = sorted(int(size) for size in image_variants if int(size) >= min_size)
+        if suitable:
+            return image_variants[str(suitable[0])]
+        return image_variants[str(max(int(size) for size in image_variants))]
+    return image_url
@@ -0,0 +1,262 @@
+# D:\globus-market\backend\app\inventory.py
+#
+# Изменение остатков товаров (заказы, возвраты, ревизия склада) с записью в журнал stock_movements
+# и учёт количества товара в незавершённых заказах (таблица reserved_stock).
+
+from sqlalchemy import Integer, bindparam, case, column, delete, func, insert, update, values
+from sqlalchemy.orm import Session
+
+from app import models
+from app.cache import bump_catalog_version
+from app.database import upsert_insert
+
+# Сколько строк обрабатываем одним запросом (ограничение на число параметров в SQLite и размер запроса)
+STOCK_UPDATE_CHUNK_SIZE = 1000
+
+# --- Причины движения остатков (stock_movements.reason) ---
+MOVEMENT_ORDER_COMPLETED = "order_completed"
+MOVEMENT_ORDER_RETURNED = "order_returned"
+MOVEMENT_REVISION = "revision"
+MOVEMENT_IMPORT = "import"
+MOVEMENT_MANUAL = "manual_edit"
+MOVEMENT_PRODUCT_CREATED = "product_created"
+
+
+def _chunks(items: list, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def record_stock_movements(db: Session, movements: list):
+    """
+    Добавляет записи в журнал движения остатков одним пакетным INSERT.
+    movements - словари с ключами product_id, delta, stock_after, reason и (необязательно) order_id.
+    """
+    movements = [movement for movement in movements if movement["delta"]]
+    if movements:
+        db.execute(insert(models.StockMovement.__table__), [
+            {"order_id": None, **movement} for movement in movements
+        ])
+
+
+def change_stock(db: Session, deltas: dict, reason: str, order_id=None, check_available: bool = False) -> list:
+    """
+    Изменяет остатки на deltas {product_id: +/-количество} одним UPDATE ... RETURNING
+    (без чтения и блокировки товаров по одному) и записывает движения в журнал.
+
+    check_available=True - списание выполняется только для товаров, где остатка хватает
+    (условие stock + delta >= 0 прямо в UPDATE). Возвращает id товаров, которые не удалось изменить
+    (не найдены или не хватает остатка). Если список не пуст, вызывающий код должен откатить транзакцию:
+    остальные товары этим же запросом уже изменены, а в журнал ничего не записано.
+    """
+    deltas = {product_id: delta for product_id, delta in deltas.items() if delta}
+    if not deltas:
+        return []
+
+    products = models.Product.__table__
+    delta_expression = case(deltas, value=products.c.id, else_=0)
+    statement = (
+        update(products)
+        .where(products.c.id.in_(sorted(deltas)))
+        .values(stock=products.c.stock + delta_expression, updated_at=func.now())
+    )
+    if check_available:
+        statement = statement.where(products.c.stock + delta_expression >= 0)
+    new_stock = {row.id: row.stock for row in db.execute(statement.returning(products.c.id, products.c.stock))}
+
+    failed = [product_id for product_id in deltas if product_id not in new_stock]
+    if failed and check_available:
+        return failed
+
+    record_stock_movements(db, [
+        {"product_id": product_id, "delta": deltas[product_id], "stock_after": stock, "reason": reason, "order_id": order_id}
+        for product_id, stock in new_stock.items()
+    ])
+    if new_stock:
+        bump_catalog_version(db)  # остатки показываются на витрине
+    return failed
+
+
+def _update_stock_rows(db: Session, rows: list):
+    """
+    Записывает новые остатки одним запросом на пачку:
+    в PostgreSQL - UPDATE ... FROM (VALUES ...), в остальных СУБД - executemany одного UPDATE.
+    """
+    products = models.Product.__table__
+    if db.get_bind().dialect.name == "postgresql":
+        for chunk in _chunks(rows, STOCK_UPDATE_CHUNK_SIZE):
+            new_values = values(
+                column("id", Integer), column("stock", Integer), name="new_stock"
+            ).data([(row["id"], row["stock"]) for row in chunk])
+            db.execute(
+                update(products)
+                .where(products.c.id == new_values.c.id)
+                .values(stock=new_values.c.stock, updated_at=func.now())
+            )
+        return
+
+    statement = (
+        update(products)
+        .where(products.c.id == bindparam("row_id"))
+        .values(stock=bindparam("new_stock"), updated_at=func.now())
+    )
+    for chunk in _chunks(rows, STOCK_UPDATE_CHUNK_SIZE):
+        db.execute(statement, [{"row_id": row["id"], "new_stock": row["stock"]} for row in chunk])
+
+
+def apply_stock_updates(db: Session, updates) -> dict:
+    """
+    Применяет список изменений остатков (schemas.StockUpdate) без загрузки товаров по одному.
+
+    Оптимистичная блокировка: если у строки указан expected_updated_at, а товар с тех пор
+    изменился (другая ревизия, редактирование, заказ), остаток НЕ перезаписывается -
+    товар попадает в conflicts. Строки товаров блокируются (FOR UPDATE) на время проверки и записи.
+    Возвращает {"updated": [id], "conflicts": [...], "not_found": [id]}. commit делает вызывающий код.
+    """
+    # Если товар встречается несколько раз - действует последнее значение
+    requested = {item.product_id: item for item in updates}
+
+    current = {}
+    for chunk in _chunks(list(requested), STOCK_UPDATE_CHUNK_SIZE):
+        rows = db.query(
+            models.Product.id, models.Product.sku, models.Product.stock, models.Product.updated_at
+        ).filter(models.Product.id.in_(chunk)).order_by(models.Product.id).with_for_update().all()
+        current.update({row.id: row for row in rows})
+
+    to_update, conflicts, not_found = [], [], []
+    for product_id, item in requested.items():
+        row = current.get(product_id)
+        if row is None:
+            not_found.append(product_id)
+        elif item.expected_updated_at is not None and row.updated_at != item.expected_updated_at:
+            conflicts.append({
+                "product_id": product_id,
+                "sku": row.sku,
+                "current_stock": row.stock,
+                "updated_at": row.updated_at,
+            })
+        elif row.stock != item.new_stock:
+            to_update.append({"id": product_id, "stock": item.new_stock})
+
+    if to_update:
+        _update_stock_rows(db, to_update)
+        record_stock_movements(db, [
+            {"product_id": row["id"], "delta": row["stock"] - (current[row["id"]].stock or 0),
+             "stock_after": row["stock"], "reason": MOVEMENT_REVISION}
+            for row in to_update
+        ])
+        bump_catalog_version(db)
+
+    return {
+        "updated": [row["id"] for row in to_update],
+        "conflicts": conflicts,
+        "not_found": not_found,
+    }
+
+
+# --- Товар в незавершённых заказах (reserved_stock) ---
+# Статус заказа -> колонка reserved_stock. Заказы в других статусах товар не резервируют.
+RESERVED_STATUS_COLUMNS = {"new": "new_qty", "processed": "processed_qty"}
+
+
+def reserved_quantities(order, skip_items=()) -> dict:
+    """
+    Сколько товара резервирует заказ в его текущем статусе: {(product_id, колонка): количество}.
+    skip_items - позиции, которые уже помечены на удаление, но ещё есть в order.items.
+    """
+    reserved_column = RESERVED_STATUS_COLUMNS.get(order.status)
+    result = {}
+    if reserved_column is None:
+        return result
+    for item in order.items:
+        if item in skip_items:
+            continue
+        key = (item.product_id, reserved_column)
+        result[key] = result.get(key, 0) + (item.quantity or 0)
+    return result
+
+
+def apply_reserved_change(db: Session, before: dict, after: dict):
+    """
+    Переносит в reserved_stock разницу между резервом заказа до и после изменения
+    (словари из reserved_quantities). Одним UPSERT в той же транзакции, что и само изменение заказа.
+    """
+    deltas = {}
+    for key in set(before) | set(after):
+        delta = after.get(key, 0) - before.get(key, 0)
+        if delta:
+            product_id, reserved_column = key
+            deltas.setdefault(product_id, {"new_qty": 0, "processed_qty": 0})[reserved_column] += delta
+    if not deltas:
+        return
+
+    table = models.ReservedStock.__table__
+    insert_statement = upsert_insert(db.get_bind())(table).values([
+        {"product_id": product_id, **deltas[product_id]} for product_id in sorted(deltas)
+    ])
+    db.execute(insert_statement.on_conflict_do_update(
+        index_elements=[table.c.product_id],
+        set_={
+            "new_qty": table.c.new_qty + insert_statement.excluded.new_qty,
+            "processed_qty": table.c.processed_qty + insert_statement.excluded.processed_qty,
+        },
+    ))
+
+
+def _reserved_from_orders_query(db: Session):
+    """Резерв, посчитанный заново по всем незавершённым заказам (эталон для проверки и пересборки)."""
+    return db.query(
+        models.OrderItem.product_id,
+        func.sum(case((models.Order.status == "new", models.OrderItem.quantity), else_=0)).label("new_qty"),
+        func.sum(case((models.Order.status == "processed", models.OrderItem.quantity), else_=0)).label("processed_qty"),
+    ).join(models.Order).filter(
+        models.Order.status.in_(list(RESERVED_STATUS_COLUMNS))
+    ).group_by(models.OrderItem.product_id)
+
+
+def verify_reserved_stock(db: Session) -> list:
+    """Сравнивает reserved_stock с пересчётом по заказам. Возвращает список расхождений."""
+    expected = {row.product_id: (row.new_qty or 0, row.processed_qty or 0) for row in _reserved_from_orders_query(db)}
+    stored = {
+        row.product_id: (row.new_qty, row.processed_qty)
+        for row in db.query(models.ReservedStock.product_id, models.ReservedStock.new_qty, models.ReservedStock.processed_qty)
+    }
+    mismatches = []
+    for product_id in sorted(set(expected) | set(stored)):
+        expected_value = expected.get(product_id, (0, 0))
+        stored_value = stored.get(product_id, (0, 0))
+        if expected_value != stored_value:
+            mismatches.append({"product_id": product_id, "expected": expected_value, "stored": stored_value})
+    return mismatches
+
+
+def _reserved_rows_from_orders(db: Session) -> list:
+    return [
+        {"product_id": row.product_id, "new_qty": row.new_qty or 0, "processed_qty": row.processed_qty or 0}
+        for row in _reserved_from_orders_query(db)
+    ]
+
+
+def rebuild_reserved_stock(db: Session):
+    """Полностью пересобирает reserved_stock по незавершённым заказам. commit делает вызывающий код."""
+    db.execute(delete(models.ReservedStock))
+    rows = _reserved_rows_from_orders(db)
+    if rows:
+        db.execute(insert(models.ReservedStock.__table__), rows)
+
+
+def ensure_reserved_stock(engine):
+    """
+    При первом запуске после появления таблицы reserved_stock заполняет её по текущим заказам.
+    Вызывается при старте каждого воркера: несколько воркеров могут одновременно увидеть пустую таблицу,
+    поэтому строки вставляются с ON CONFLICT DO NOTHING - второй воркер просто ничего не добавит,
+    вместо ошибки первичного ключа на старте.
+    """
+    with Session(engine) as db:
+        if db.query(models.ReservedStock.product_id).first() is not None:
+            return
+        rows = _reserved_rows_from_orders(db)
+        if rows:
+            statement = upsert_insert(engine)(models.ReservedStock.__table__).values(rows)
+            db.execute(statement.on_conflict_do_nothing(index_elements=["product_id"]))
+            db.commit()
@@ -0,0 +1,143 @@
+# D:\globus-market\backend\app\invoice_export.py
+#
+# Выгрузка накладных за период одним ZIP-архивом.
+# Архив собирается "на лету": заказы читаются пачками, файлы накладных копируются в архив кусками,
+# и готовые байты сразу уходят клиенту. Ни весь архив, ни список всех заказов в памяти не держатся.
+# Недостающие (или устаревшие) накладные дорисовываются в общем пуле процессов накладных
+# не больше чем по одной пачке за раз и сохраняются как обычно.
+
+import logging
+import os
+import zipfile
+from datetime import date
+from functools import partial
+from typing import Optional
+
+from app import models
+from app.database import SessionLocal
+from app.invoices import build_invoice_data, render_invoice_files, invoice_file_path, INVOICE_FORMATS
+from app.routers.orders import (
+    get_invoice_executor, stale_invoice_formats, _on_invoice_rendered,
+    with_order_details, filter_by_date_range,
+)
+
+logger = logging.getLogger(__name__)
+
+# Сколько заказов читаем из БД (и сколько накладных можем одновременно поставить в пул) за раз
+INVOICE_EXPORT_BATCH_SIZE = int(os.getenv("INVOICE_EXPORT_BATCH_SIZE", "50"))
+# Размер куска, которым файл накладной копируется в архив
+INVOICE_EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+class _ChunkBuffer:
+    """
+    Файловый объект только для записи: zipfile пишет в него, генератор забирает накопленное (drain).
+    У объекта нет seek/tell, поэтому zipfile пишет размеры файлов после данных (data descriptor).
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> list:
+        """Забирает накопленные байты: [bytes] или [], если ничего не записано (пустые куски клиенту не шлём)."""
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return [data] if data else []
+
+
+def parse_export_formats(value: str) -> tuple:
+    """'pdf,xlsx' -> ('pdf', 'xlsx'). Бросает ValueError при неизвестном формате."""
+    formats = tuple(dict.fromkeys(part.strip().lower() for part in value.split(",") if part.strip()))
+    if not formats or any(file_format not in INVOICE_FORMATS for file_format in formats):
+        raise ValueError(value)
+    return formats
+
+
+def _orders_query(db, date_from: date, date_to: date, status: Optional[str]):
+    query = db.query(models.Order)
+    if status:
+        query = query.filter(models.Order.status == status)
+    else:
+        # Как и в списке заказов: по умолчанию удалённые не выгружаем
+        query = query.filter(models.Order.status != "deleted")
+    return filter_by_date_range(query, models.Order.created_at, date_from, date_to)
+
+
+def _render_missing(batch: list, formats: tuple) -> dict:
+    """
+    Ставит в пул накладных недостающие форматы заказов пачки.
+    Возвращает {id заказа: future}. Результат сохраняется в заказ тем же колбэком, что и при обычном формировании.
+    """
+    futures = {}
+    for order in batch:
+        stale = {
+            file_format: content_hash
+            for file_format, content_hash in stale_invoice_formats(order).items()
+            if file_format in formats
+        }
+        if not stale:
+            continue
+        future = get_invoice_executor().submit(render_invoice_files, build_invoice_data(order), stale)
+        future.add_done_callback(partial(_on_invoice_rendered, order.id, stale))
+        futures[order.id] = future
+    return futures
+
+
+def iter_invoice_zip(date_from: date, date_to: date, status: Optional[str], formats: tuple):
+    """Генератор байтов ZIP-архива с накладными заказов за период (для StreamingResponse)."""
+    buffer = _ChunkBuffer()
+    errors = []
+    db = SessionLocal()
+    try:
+        with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_STORED) as archive:
+            last_id = 0
+            while True:
+                # Keyset-пагинация по id: каждая пачка - отдельные запросы, память не растёт с размером периода
+                batch = with_order_details(
+                    _orders_query(db, date_from, date_to, status).filter(models.Order.id > last_id)
+                ).order_by(models.Order.id).limit(INVOICE_EXPORT_BATCH_SIZE).all()
+                if not batch:
+                    break
+                last_id = batch[-1].id
+                futures = _render_missing(batch, formats)
+
+                for order in batch:
+                    paths = {file_format: getattr(order, f"invoice_path_{file_format}") for file_format in formats}
+                    future = futures.get(order.id)
+                    if future is not None:
+                        try:
+                            paths.update(future.result())
+                        except Exception as e:
+                            logger.error("Выгрузка: не удалось сформировать накладную заказа %s: %s", order.id, e)
+                            errors.append(f"{order.order_number}: не удалось сформировать накладную")
+                            continue
+
+                    folder = order.created_at.strftime("%Y-%m")
+                    for file_format in formats:
+                        entry = zipfile.ZipInfo(f"{folder}/order_{order.order_number}.{file_format}", order.created_at.timetuple()[:6])
+                        try:
+                            with open(invoice_file_path(paths[file_format]), "rb") as source, archive.open(entry, "w") as target:
+                                while True:
+                                    chunk = source.read(INVOICE_EXPORT_CHUNK_SIZE)
+                                    if not chunk:
+                                        break
+                                    target.write(chunk)
+                                    yield from buffer.drain()
+                        except OSError as e:
+                            logger.error("Выгрузка: нет файла накладной заказа %s: %s", order.id, e)
+                            errors.append(f"{order.order_number}: нет файла {file_format}")
+
+                db.expunge_all()
+
+            if errors:
+                archive.writestr("errors.txt", "\n".join(errors) + "\n")
+        yield from buffer.drain()
+    finally:
+        db.close()
@@ -0,0 +1,329 @@
+# D:\globus-market\backend\app\invoices.py
+#
+# Формирование накладных (PDF и Excel).
+# Модуль намеренно не работает с БД: на вход получает готовый словарь с данными заказа
+# (см. build_invoice_data), поэтому рендер можно выполнять в отдельном процессе.
+
+import hashlib
+import io
+import json
+import os
+from functools import lru_cache, partial
+from pathlib import Path
+
+# Импорты для PDF и Excel
+from reportlab.platypus import Table, TableStyle, Paragraph, Image as PlatypusImage
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib import colors
+from reportlab.lib.units import cm
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfbase import pdfmetrics
+from openpyxl import Workbook
+from openpyxl.styles import Alignment, Border, Side
+from PIL import Image as PILImage
+
+from app.images import pick_image_url
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+INVOICE_DIR = BASE_DIR / "invoices"
+FONT_PATH = BASE_DIR / "DejaVuSans.ttf"
+pdfmetrics.registerFont(TTFont('DejaVuSans', str(FONT_PATH)))
+pdfmetrics.registerFont(TTFont('DejaVuSans-Oblique', str(BASE_DIR / "DejaVuSans-Oblique.ttf")))
+
+# Фото в накладной 2x2 см - для печати хватает варианта от 160 px
+INVOICE_IMAGE_MIN_SIZE = 160
+
+# --- Статусы формирования накладной (поле Order.invoice_status) ---
+INVOICE_PENDING = "pending"
+INVOICE_READY = "ready"
+INVOICE_FAILED = "failed"
+
+
+def build_invoice_data(order) -> dict:
+    """
+    Собирает всё, что печатается в накладной, в простой словарь.
+    Подходит и для ORM-заказа (позиции с загруженными товарами), и для Pydantic-схемы заказа.
+    """
+    lines = []
+    for item in order.items:
+        product = item.product
+        image_path = None
+        image_url = pick_image_url(product.image_url, getattr(product, "image_variants", None), INVOICE_IMAGE_MIN_SIZE) if product else None
+        if image_url:
+            image_path = str(BASE_DIR / image_url.lstrip('/'))
+        lines.append({
+            "sku": product.sku if product else "N/A",
+            "name": product.name if product else "Товар не найден",
+            "image_path": image_path,
+            "quantity": item.quantity,
+            "price_per_item": item.price_per_item,
+            "comment": item.comment,
+        })
+
+    return {
+        "order_number": order.order_number,
+        "created_at": order.created_at,
+        "customer_name": order.customer_name,
+        "customer_phone": order.customer_phone,
+        "discount_percent": order.discount_percent or 0.0,
+        "lines": lines,
+    }
+
+
+# Версия оформления накладных. Увеличьте при изменении внешнего вида файлов -
+# тогда при следующем изменении заказа (или перезапуске с pending-накладными) файлы нарисуются заново.
+INVOICE_LAYOUT_VERSION = 1
+INVOICE_FORMATS = ("pdf", "xlsx")
+
+
+def invoice_content_hashes(data: dict) -> dict:
+    """
+    Хэш печатаемого содержимого накладной для каждого формата: {"pdf": ..., "xlsx": ...}.
+    В Excel нет фото товаров, поэтому смена фото меняет только хэш PDF.
+    """
+    hashes = {}
+    for file_format in INVOICE_FORMATS:
+        content = dict(data, layout=INVOICE_LAYOUT_VERSION, format=file_format)
+        if file_format == "xlsx":
+            content["lines"] = [{key: value for key, value in line.items() if key != "image_path"} for line in data["lines"]]
+        serialized = json.dumps(content, sort_keys=True, ensure_ascii=False, default=str)
+        hashes[file_format] = hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+    return hashes
+
+
+def invoice_paths(data: dict):
+    """Возвращает (папка, базовое имя файла, папка для веб-пути) для накладной заказа."""
+    date_str = data["created_at"].strftime("%Y-%m")
+    return INVOICE_DIR / date_str, f"order_{data['order_number']}", date_str
+
+
+def invoice_file_path(web_path: str) -> Path:
+    """Путь на диске по веб-пути накладной (/invoices/...)."""
+    return BASE_DIR / web_path.lstrip('/')
+
+
+def _write_atomically(target: Path, render):
+    """
+    Рисует файл во временный файл в той же папке и атомарно переименовывает его в target -
+    читатель никогда не увидит недописанную накладную.
+    """
+    tmp_path = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+    try:
+        render(str(tmp_path))
+        os.replace(tmp_path, target)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def render_invoice_files(data: dict, formats: dict):
+    """
+    Рисует накладную в форматах formats ({"pdf": хэш содержимого, ...}) по данным из build_invoice_data.
+    Хэш входит в имя файла, поэтому новая версия не перезаписывает старую, пока та кому-то нужна.
+    Возвращает {формат: веб-путь к файлу}.
+    """
+    folder_path, file_base_name, date_str = invoice_paths(data)
+    os.makedirs(folder_path, exist_ok=True)
+
+    renderers = {"pdf": render_invoice_pdf, "xlsx": render_invoice_xlsx}
+    web_paths = {}
+    for file_format, content_hash in formats.items():
+        file_name = f"{file_base_name}-{content_hash[:12]}.{file_format}"
+        _write_atomically(folder_path / file_name, partial(renderers[file_format], data))
+        # --- ИЗМЕНЕНИЕ: Возвращаем ВЕБ-ПУТЬ ---
+        web_paths[file_format] = f"/invoices/{date_str}/{file_name}"
+    return web_paths
+
+
+def _totals(data: dict):
+    subtotal = sum(line["quantity"] * line["price_per_item"] for line in data["lines"])
+    discount_amount = (subtotal * data["discount_percent"]) / 100
+    return subtotal, discount_amount, subtotal - discount_amount
+
+
+# Фото в PDF печатается 2x2 см: ~120 px - это 150 dpi, больше для печати не нужно
+INVOICE_THUMBNAIL_PX = int(os.getenv("INVOICE_THUMBNAIL_PX", "120"))
+# Сколько уменьшенных фото держать в памяти процесса рендера (каждое - несколько КБ JPEG)
+INVOICE_THUMBNAIL_CACHE_SIZE = int(os.getenv("INVOICE_THUMBNAIL_CACHE_SIZE", "512"))
+
+
+class InvoiceRenderer:
+    """
+    Рисует накладные по данным из build_invoice_data.
+    Стили, шаблоны таблиц и кэш уменьшенных фото создаются один раз на процесс
+    (см. invoice_renderer ниже), а не на каждую накладную.
+    """
+
+    PDF_HEADERS = ['№', 'Артикул', 'Фото', 'Наименование товара', 'Кол-во', 'Цена', 'Сумма']
+    PDF_COL_WIDTHS = [1*cm, 2.2*cm, 2.2*cm, 5.1*cm, 1.5*cm, 2.5*cm, 2.5*cm] # Слегка изменили ширину Артикула
+    XLSX_HEADERS = ["№", "Артикул", "Наименование", "Кол-во", "Цена за ед.", "Сумма"]
+
+    def __init__(self, thumbnail_cache_size: int = INVOICE_THUMBNAIL_CACHE_SIZE):
+        # Стиль для обычного текста в ячейке. wordWrap = 'CJK' позволяет переносить длинные строки без пробелов.
+        self.style_normal = ParagraphStyle(name='Normal', fontName='DejaVuSans', fontSize=9, wordWrap='CJK', alignment=1)
+        # Стиль для комментариев
+        self.style_comment = ParagraphStyle(name='Comment', parent=self.style_normal, fontName='DejaVuSans-Oblique', textColor=colors.grey)
+        # Стиль для правого выравнивания (цены, количество)
+        self.style_right = ParagraphStyle(name='Right', parent=self.style_normal, alignment=2)
+        self.table_style = TableStyle([
+            ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#f2f2f2')),
+            ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+            ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+            ('FONTNAME', (0,0), (-1,-1), 'DejaVuSans'),
+            ('GRID', (0,0), (-1,-1), 1, colors.grey),
+        ])
+
+        thin_border_side = Side(border_style="thin", color="000000")
+        self.xlsx_border = Border(top=thin_border_side, left=thin_border_side, right=thin_border_side, bottom=thin_border_side)
+        self.xlsx_name_alignment = Alignment(wrap_text=True, vertical='top')
+        self.xlsx_number_alignment = Alignment(horizontal='right', vertical='center')
+
+        # LRU-кэш на экземпляр: ключ - путь и время изменения файла
+        self._thumbnail = lru_cache(maxsize=thumbnail_cache_size)(self._load_thumbnail)
+
+    # --- Фото товаров ---
+
+    @staticmethod
+    def _load_thumbnail(image_path: str, mtime: float) -> bytes:
+        """Уменьшает фото до INVOICE_THUMBNAIL_PX и кодирует в JPEG - reportlab вставляет JPEG в PDF без перекодирования."""
+        with PILImage.open(image_path) as image:
+            image.thumbnail((INVOICE_THUMBNAIL_PX, INVOICE_THUMBNAIL_PX))
+            flattened = PILImage.new("RGB", image.size, "white")
+            image = image.convert("RGBA")
+            flattened.paste(image, mask=image.getchannel("A"))
+        buffer = io.BytesIO()
+        flattened.save(buffer, "JPEG", quality=85)
+        return buffer.getvalue()
+
+    def thumbnail(self, image_path):
+        """Уменьшенное фото для ячейки PDF (файловый объект) или None, если файла нет или он не читается."""
+        if not image_path:
+            return None
+        try:
+            return io.BytesIO(self._thumbnail(image_path, os.path.getmtime(image_path)))
+        except (OSError, ValueError):
+            return None
+
+    def clear_thumbnails(self):
+        self._thumbnail.cache_clear()
+
+    # --- PDF ---
+
+    def render_pdf(self, data: dict, target):
+        """Рисует PDF-накладную. target - путь к файлу или файловый объект."""
+        subtotal, discount_amount, final_total = _totals(data)
+        styleN, styleComment, styleR = self.style_normal, self.style_comment, self.style_right
+
+        c = canvas.Canvas(target, pagesize=A4)
+        width, height = A4
+        c.setFont('DejaVuSans', 14)
+        c.drawString(72, height - 50, f"Расходная накладная № {data['order_number']}")
+        c.setFont('DejaVuSans', 11)
+        c.drawString(72, height - 70, f"Дата: {data['created_at'].strftime('%d.%m.%Y %H:%M')}")
+        c.drawString(72, height - 90, f"Клиент: {data['customer_name']}, Телефон: {data['customer_phone']}")
+
+        # Заголовки таблицы оборачиваем в параграфы для единообразия
+        table_data = [[Paragraph(h, styleN) for h in self.PDF_HEADERS]]
+
+        for i, line in enumerate(data["lines"]):
+            item_sum = line["quantity"] * line["price_per_item"]
+
+            image_cell = ''
+            thumbnail = self.thumbnail(line["image_path"])
+            if thumbnail is not None:
+                image_cell = PlatypusImage(thumbnail, width=2*cm, height=2*cm)
+
+            # Оборачиваем содержимое каждой ячейки в Paragraph
+            name_cell_content = [Paragraph(line["name"], styleN)]
+            if line["comment"]:
+                name_cell_content.append(Paragraph(line["comment"], styleComment))
+
+            row = [
+                Paragraph(str(i + 1), styleN),
+                Paragraph(line["sku"], styleN), # Артикул теперь тоже Paragraph
+                image_cell,
+                name_cell_content,
+                Paragraph(str(line["quantity"]), styleR),
+                Paragraph(f"{line['price_per_item']:.2f}", styleR),
+                Paragraph(f"{item_sum:.2f}", styleR)
+            ]
+            table_data.append(row)
+
+        table = Table(table_data, colWidths=self.PDF_COL_WIDTHS)
+        table.setStyle(self.table_style)
+        table_height = table.wrapOn(c, width - 144, height)[1]
+        table.drawOn(c, 72, height - 100 - table_height)
+
+        y_pos = height - 110 - table_height - 20
+        c.setFont('DejaVuSans', 10)
+        c.drawRightString(width - 72, y_pos, f"Сумма: {subtotal:.2f}")
+        if data["discount_percent"] > 0:
+            y_pos -= 15
+            c.drawRightString(width - 72, y_pos, f"Скидка ({data['discount_percent']:.1f}%): -{discount_amount:.2f}")
+
+        c.setFont('DejaVuSans', 12)
+        c.drawRightString(width - 72, y_pos - 20, f"Итого к оплате: {final_total:.2f}") # Скорректировали отступ
+        c.save()
+
+    # --- Excel ---
+
+    def render_xlsx(self, data: dict, target):
+        """Формирует Excel-накладную. target - путь к файлу или файловый объект."""
+        subtotal, discount_amount, final_total = _totals(data)
+
+        wb = Workbook()
+        ws = wb.active
+        ws.title = f"Накладная {data['order_number']}"
+        ws.append(["Расходная накладная №", data["order_number"]])
+        ws.append(["Дата:", data["created_at"].strftime('%d.%m.%Y %H:%M')])
+        ws.append(["Клиент:", data["customer_name"], "Телефон:", data["customer_phone"]])
+        ws.append([])
+        ws.append(self.XLSX_HEADERS)
+        start_table_row = ws.max_row
+        for i, line in enumerate(data["lines"]):
+            item_sum = line["quantity"] * line["price_per_item"]
+            product_name = line["name"]
+            if line["comment"]:
+                product_name += f"\n(Комментарий: {line['comment']})"
+            ws.append([ i + 1, line["sku"], product_name, line["quantity"], line["price_per_item"], item_sum ])
+        ws.append([])
+        ws.append(["", "", "", "", "Сумма:", subtotal])
+        if data["discount_percent"] > 0:
+            ws.append(["", "", "", "", f"Скидка ({data['discount_percent']}%):", f"-{discount_amount}"])
+        ws.append(["", "", "", "", "Итого к оплате:", final_total])
+        for row in ws.iter_rows(min_row=start_table_row, max_row=ws.max_row, min_col=1, max_col=len(self.XLSX_HEADERS)):
+            for cell in row:
+                cell.border = self.xlsx_border
+                if cell.column == 3: cell.alignment = self.xlsx_name_alignment
+                elif cell.column > 3: cell.alignment = self.xlsx_number_alignment
+        wb.save(target)
+
+
+# Один экземпляр на процесс: создаётся при импорте модуля (в веб-процессе и в каждом процессе пула накладных)
+invoice_renderer = InvoiceRenderer()
+
+
+def render_invoice_pdf(data: dict, target):
+    """Рисует PDF-накладную. target - путь к файлу или файловый объект."""
+    invoice_renderer.render_pdf(data, target)
+
+
+def render_invoice_xlsx(data: dict, target):
+    """Формирует Excel-накладную. target - путь к файлу или файловый объект."""
+    invoice_renderer.render_xlsx(data, target)
+
+
+INVOICE_MEDIA_TYPES = {
+    "pdf": "application/pdf",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+def render_invoice_bytes(data: dict, file_format: str) -> bytes:
+    """Рисует накладную одного формата в память (для превью) - без файлов на диске и без путей заказа."""
+    renderers = {"pdf": invoice_renderer.render_pdf, "xlsx": invoice_renderer.render_xlsx}
+    buffer = io.BytesIO()
+    renderers[file_format](data, buffer)
+    return buffer.getvalue()
@@ -0,0 +1,44 @@
+# D:\globus-market\backend\app\logging_config.py
+#
+# Логирование приложения без блокировок в обработчиках запросов:
+# записи кладутся в очередь (QueueHandler), а в stdout их пишет отдельный поток (QueueListener).
+# Уровень задаётся переменной окружения LOG_LEVEL (по умолчанию INFO).
+
+import logging
+import logging.handlers
+import os
+import queue
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+
+_listener = None
+_queue_handler = None
+
+
+def setup_logging():
+    """Настраивает корневой логгер. Повторный вызов ничего не делает."""
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    _queue_handler = logging.handlers.QueueHandler(log_queue)
+    root.addHandler(_queue_handler)
+
+
+def shutdown_logging():
+    """Дописывает оставшиеся в очереди записи и останавливает поток логирования."""
+    global _listener, _queue_handler
+    if _listener is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _listener.stop()
+        _listener = None
+        _queue_handler = None
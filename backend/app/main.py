@@ -1,20 +1,33 @@
 # D:\globus-market\backend\app\main.py
 
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware # <-- НОВЫЙ ИМПОРТ
 from sqlalchemy.orm import Session
 from fastapi import Depends
 from app.dependencies import get_db 
+from app.cache import public_settings, get_settings_state
+from app.http_cache import ConditionalGet, make_etag
 
-from app.database import engine
+from app.database import engine, async_engine, add_missing_columns, DB_ASYNC
 from app import models
-from app.routers import products, orders, auth, admin, categories
+from app.routers import products, orders, auth, admin, categories, storefront, async_public
+from app.search import ensure_search_schema
+from app.inventory import ensure_reserved_stock
+from app.static_files import CachedStaticFiles
+from app.compression import CompressionMiddleware
+from app.logging_config import setup_logging, shutdown_logging
+
+setup_logging()
 
 models.Base.metadata.create_all(bind=engine)
+add_missing_columns(engine)
+ensure_search_schema(engine)
+ensure_reserved_stock(engine)
 
-app = FastAPI(title="Globus Market API")
+# JSON-ответы рендерит orjson: быстрее стандартного json и сам сериализует datetime
+app = FastAPI(title="Globus Market API", default_response_class=ORJSONResponse)
 
 # --- НОВЫЙ БЛОК: Настройка CORS ---
 # Этот блок должен идти до подключения роутеров
@@ -24,44 +37,75 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"], # Разрешаем все методы (GET, POST и т.д.)
     allow_headers=["*"], # Разрешаем все заголовки
+    expose_headers=["X-Total-Count", "X-Next-Cursor"], # Заголовки пагинации должны быть видны фронтенду
 )
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
-app.mount("/invoices", StaticFiles(directory="invoices"), name="invoices")
+# Сжатие (brotli/gzip) ответов от COMPRESSION_MINIMUM_SIZE байт, см. app/compression.py
+app.add_middleware(CompressionMiddleware)
+
+# Фото товаров имеют хэш в имени и кэшируются браузером "навсегда", остальное сверяется по ETag.
+# Накладные перезаписываются при изменении заказа и содержат данные клиента - только private.
+app.mount("/static", CachedStaticFiles(directory="static"), name="static")
+# Имена накладных содержат хэш содержимого (app/invoices.py) - новая версия всегда получает новый URL
+app.mount("/invoices", CachedStaticFiles(
+    directory="invoices",
+    cache_control="private, no-cache",
+    immutable_cache_control="private, max-age=31536000, immutable",
+), name="invoices")
+
+@app.on_event("startup")
+def requeue_invoices_on_startup():
+    # Накладные, которые не успели сформироваться до перезапуска, ставим в очередь заново
+    orders.requeue_pending_invoices()
+
+@app.on_event("shutdown")
+def stop_invoice_workers():
+    orders.shutdown_invoice_executor()
+    shutdown_logging()
+
+@app.on_event("shutdown")
+async def close_async_engine():
+    if async_engine is not None:
+        await async_engine.dispose()
+
+def _read_test_login_page() -> str:
+    with open("static/index.html", "r", encoding="utf-8") as f:
+        return f.read()
 
 @app.get("/test-login", response_class=HTMLResponse)
 async def get_test_login_page():
+    # Чтение файла - в пуле потоков, чтобы не блокировать event loop
     try:
-        with open("static/index.html", "r", encoding="utf-8") as f:
-            return HTMLResponse(content=f.read())
+        return HTMLResponse(content=await run_in_threadpool(_read_test_login_page))
     except FileNotFoundError:
         return HTMLResponse(content="<h1>Ошибка: файл static/index.html не найден!</h1>", status_code=404)
 
 
 # --- НОВЫЙ ЭНДПОИНТ ДЛЯ ПУБЛИЧНЫХ НАСТРОЕК ---
 @app.get("/settings/public", tags=["Public"])
-def get_public_settings(db: Session = Depends(get_db)):
+def get_public_settings(request: Request, response: Response, db: Session = Depends(get_db)):
     """
     Возвращает список публичных настроек (контакты).
+    Поддерживает условный GET (ETag / Last-Modified по версии настроек).
     """
 
-    public_keys = [
-        "contact_whatsapp", 
-        "contact_instagram_1", 
-        "contact_instagram_2", 
-        "contact_instagram_3", 
-        "contact_telegram", 
-        "contact_whatsapp_display" 
-    ]
-    settings = db.query(models.AppSettings).filter(models.AppSettings.key.in_(public_keys)).all()
-    # Преобразуем список объектов в словарь вида {"key": "value"}
-    return {s.key: s.value for s in settings}
+    # Настройки берём из кэша в памяти (см. app/cache.py)
+    settings_version, settings_modified = get_settings_state(db)
+    conditional = ConditionalGet(make_etag("public_settings", settings_version), settings_modified)
+    if conditional.is_fresh(request):
+        return conditional.not_modified()
+    conditional.apply(response)
+    return public_settings(db)
 
 
 
 # Подключаем роутеры
+if DB_ASYNC:
+    # Асинхронные версии горячих публичных маршрутов подключаются первыми и перекрывают синхронные
+    app.include_router(async_public.router, tags=["Public"])
 app.include_router(categories.router, prefix="/categories", tags=["Categories"])
 app.include_router(products.router, prefix="/products", tags=["Products"])
+app.include_router(storefront.router, prefix="/storefront", tags=["Public"])
 app.include_router(orders.router, prefix="/orders", tags=["Orders"])
 app.include_router(auth.router, prefix="/auth", tags=["Authentication"])
 app.include_router(admin.router, prefix="/admin", tags=["Admin"])
@@ -1,9 +1,18 @@
 # D:\globus-market\backend\app\models.py
 
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, func, Boolean
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, func, Boolean, Index, JSON, event, inspect
 from sqlalchemy.orm import relationship
 from .database import Base
 
+
+def normalize_search_text(value: str) -> str:
+    """
+    Приводит строку к виду для поиска: нижний регистр (в т.ч. кириллица),
+    "ё" -> "е", схлопнутые пробелы. Делаем это в Python, а не в БД,
+    потому что lower() в SQLite и в PostgreSQL с локалью "C" не понимает кириллицу.
+    """
+    return " ".join((value or "").casefold().replace("ё", "е").split())
+
 # --- НОВЫЙ КЛАСС: Категория ---
 class Category(Base):
     __tablename__ = "categories"
@@ -29,6 +38,8 @@ class User(Base):
     username = Column(String, unique=True, index=True)
     hashed_password = Column(String)
     is_admin = Column(Boolean, default=False)
+    # Увеличение версии отзывает все ранее выданные токены пользователя (см. auth.get_current_user)
+    token_version = Column(Integer, nullable=True, default=0)
 
 class Product(Base):
     __tablename__ = "products"
@@ -37,6 +48,8 @@ class Product(Base):
     name = Column(String, index=True)
     price = Column(Float)
     image_url = Column(String, nullable=True)
+    # Уменьшенные копии фото: {"160": url, "400": url, "800": url} (см. app/images.py)
+    image_variants = Column(JSON, nullable=True)
     stock = Column(Integer, default=0)
     is_visible = Column(Boolean, default=True, nullable=False)
     
@@ -44,6 +57,25 @@ class Product(Base):
     subcategory_id = Column(Integer, ForeignKey("subcategories.id"))
     subcategory = relationship("Subcategory", back_populates="products")
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    # Нормализованные "название + артикул" для поиска (заполняется автоматически, см. ниже)
+    search_text = Column(String, nullable=True)
+
+    # Составные индексы под курсорную пагинацию каталога (сортировка + id как "тай-брейкер")
+    __table_args__ = (
+        Index("ix_products_name_id", "name", "id"),
+        Index("ix_products_updated_at_id", "updated_at", "id"),
+    )
+
+@event.listens_for(Product, "before_insert")
+def _fill_product_search_text(mapper, connection, target):
+    target.search_text = normalize_search_text(f"{target.name or ''} {target.sku or ''}")
+
+@event.listens_for(Product, "before_update")
+def _refresh_product_search_text(mapper, connection, target):
+    # Пересчитываем только если менялись название или артикул (например, не при списании остатков)
+    state = inspect(target)
+    if state.attrs.name.history.has_changes() or state.attrs.sku.history.has_changes():
+        _fill_product_search_text(mapper, connection, target)
 
 class Order(Base):
     # ... (Этот класс без изменений)
@@ -55,7 +87,7 @@ class Order(Base):
     customer_name = Column(String)
     customer_phone = Column(String)
     customer_comment = Column(String, nullable=True) 
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
 
     # --- НОВЫЕ ПОЛЯ ДЛЯ ХРАНЕНИЯ ДАТ ---
     processed_at = Column(DateTime(timezone=True), nullable=True)
@@ -73,6 +105,13 @@ class Order(Base):
     discount_percent = Column(Float, default=0.0)
     invoice_path_pdf = Column(String, nullable=True)
     invoice_path_xlsx = Column(String, nullable=True)
+    # Статус фонового формирования накладной: pending / ready / failed (см. app/invoices.py)
+    invoice_status = Column(String, nullable=True)
+    # Хэши печатаемого содержимого, по которым нарисованы текущие файлы (см. invoices.invoice_content_hashes)
+    invoice_hash_pdf = Column(String, nullable=True)
+    invoice_hash_xlsx = Column(String, nullable=True)
+    # Когда накладную заново поставил в очередь один из воркеров при старте (см. orders.requeue_pending_invoices)
+    invoice_requeued_at = Column(DateTime(timezone=True), nullable=True)
     items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
 
 class OrderItem(Base):
@@ -96,4 +135,45 @@ class AppSettings(Base):
     __tablename__ = "app_settings"
     id = Column(Integer, primary_key=True)
     key = Column(String, unique=True, index=True, nullable=False)
-    value = Column(String, nullable=False)
\ No newline at end of file
+    value = Column(String, nullable=False)
+
+# --- Версии кэшируемых данных (общие для всех воркеров) ---
+# При изменении данных версия увеличивается в той же транзакции,
+# а воркеры периодически сверяют свою копию кэша с этой таблицей.
+class CacheVersion(Base):
+    __tablename__ = "cache_versions"
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    # Когда версия менялась последний раз (для Last-Modified ответов каталога)
+    updated_at = Column(DateTime(timezone=True), nullable=True)
+
+
+# --- Количество товара в незавершённых заказах (для страницы ревизии) ---
+# Поддерживается приращениями при создании/изменении/смене статуса/удалении заказа
+# (см. app/inventory.py), чтобы ревизии не приходилось пересчитывать всю историю заказов.
+class ReservedStock(Base):
+    __tablename__ = "reserved_stock"
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    new_qty = Column(Integer, nullable=False, default=0)
+    processed_qty = Column(Integer, nullable=False, default=0)
+
+
+# --- Счётчики номеров заказов (номер вида YYYY-MM-NNNNN, нумерация с начала каждого месяца) ---
+class OrderNumberCounter(Base):
+    __tablename__ = "order_number_counters"
+    period = Column(String, primary_key=True)  # "YYYY-MM"
+    last_value = Column(Integer, nullable=False)
+
+
+# --- Журнал движения остатков (только добавление записей) ---
+# Каждое изменение products.stock (заказ, возврат, ревизия, импорт, ручная правка) оставляет запись,
+# по которой можно восстановить историю остатка товара.
+class StockMovement(Base):
+    __tablename__ = "stock_movements"
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False, index=True)
+    order_id = Column(Integer, ForeignKey("orders.id"), nullable=True, index=True)
+    delta = Column(Integer, nullable=False)
+    stock_after = Column(Integer, nullable=True)
+    reason = Column(String, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
@@ -0,0 +1,288 @@
+# D:\globus-market\backend\app\product_import.py
+#
+# Импорт прайс-листа поставщика (CSV или XLSX) в товары.
+# Файл читается потоково, по IMPORT_CHUNK_SIZE строк: на каждую пачку - один запрос на поиск
+# существующих артикулов и один INSERT ... ON CONFLICT (sku) DO UPDATE.
+# Ошибки в отдельных строках не останавливают импорт - они собираются в отчёт.
+
+import codecs
+import csv
+import io
+import math
+
+from openpyxl import load_workbook
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app import models
+from app.cache import bump_catalog_version
+from app.database import upsert_insert
+from app.inventory import record_stock_movements, MOVEMENT_IMPORT
+from app.models import normalize_search_text
+
+IMPORT_CHUNK_SIZE = 1000
+# В ответ попадают только первые ошибки - чтобы полностью "битый" файл не превратился в огромный JSON
+IMPORT_MAX_REPORTED_ERRORS = 1000
+
+# Допустимые названия колонок (регистр не важен) -> поле товара
+COLUMN_ALIASES = {
+    "sku": "sku", "артикул": "sku",
+    "name": "name", "наименование": "name", "название": "name",
+    "price": "price", "цена": "price",
+    "stock": "stock", "остаток": "stock", "количество": "stock", "кол-во": "stock",
+    "subcategory_id": "subcategory_id", "подкатегория": "subcategory_id",
+    "is_visible": "is_visible", "видимость": "is_visible", "показывать": "is_visible",
+}
+TRUE_VALUES = {"1", "true", "yes", "да", "+"}
+FALSE_VALUES = {"0", "false", "no", "нет", "-"}
+
+
+class ImportFormatError(ValueError):
+    """Файл целиком не подходит для импорта (неизвестный формат, нет колонки с артикулом и т.п.)."""
+
+
+# --- Чтение файлов ---
+
+def _detect_text_encoding(stream) -> str:
+    """
+    UTF-8 (с BOM или без) или, если не подходит, cp1251 - так сохраняет CSV русский Excel.
+    Проверяется весь файл, а не начало: первая кириллица в прайс-листе может оказаться
+    где угодно, а ошибка декодирования посреди импорта оставила бы его сохранённым наполовину.
+    """
+    for encoding in ("utf-8-sig", "cp1251"):
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            for chunk in iter(lambda: stream.read(64 * 1024), b""):
+                decoder.decode(chunk)
+            decoder.decode(b"", final=True)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+        finally:
+            stream.seek(0)
+    raise ImportFormatError("Не удалось прочитать CSV: ожидается кодировка UTF-8 или Windows-1251")
+
+
+def iter_csv_rows(stream):
+    text = io.TextIOWrapper(stream, encoding=_detect_text_encoding(stream), newline="")
+    sample = text.read(16 * 1024)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    try:
+        yield from csv.reader(text, dialect)
+    finally:
+        text.detach()  # не закрываем файл загрузки вместе с обёрткой
+
+
+def iter_xlsx_rows(stream):
+    try:
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+    except Exception:
+        raise ImportFormatError("Не удалось прочитать файл Excel")
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield row
+    finally:
+        workbook.close()
+
+
+def iter_upload_rows(filename: str, stream):
+    name = (filename or "").lower()
+    if name.endswith(".csv"):
+        return iter_csv_rows(stream)
+    if name.endswith(".xlsx"):
+        return iter_xlsx_rows(stream)
+    raise ImportFormatError("Поддерживаются только файлы .csv и .xlsx")
+
+
+# --- Разбор значений ---
+
+def _text(value):
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)  # Excel хранит артикул "12345" как число 12345.0
+    value = str(value).strip()
+    return value or None
+
+
+def _number(value, cast):
+    if not isinstance(value, (int, float)):
+        value = float(_text(value).replace("\u00a0", "").replace(" ", "").replace(",", "."))
+    if not math.isfinite(value):
+        raise ValueError(value)  # float() понимает "nan" и "inf"
+    if cast is int and not float(value).is_integer():
+        raise ValueError(value)
+    return cast(value)
+
+
+def _bool(value):
+    if isinstance(value, bool):
+        return value
+    value = _text(value).lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ValueError(value)
+
+
+def _map_header(header_row) -> dict:
+    """Возвращает {поле товара: номер колонки}."""
+    columns = {}
+    for index, title in enumerate(header_row):
+        field = COLUMN_ALIASES.get((_text(title) or "").lower())
+        if field and field not in columns:
+            columns[field] = index
+    if "sku" not in columns:
+        raise ImportFormatError("В первой строке файла нет колонки 'sku' (или 'Артикул')")
+    return columns
+
+
+def parse_row(row, columns: dict) -> dict:
+    """Разбирает строку файла в словарь полей товара. Пустые ячейки - None (поле не меняется)."""
+    def cell(field):
+        index = columns.get(field)
+        if index is None or index >= len(row):
+            return None
+        return row[index] if _text(row[index]) is not None else None
+
+    sku = _text(cell("sku"))
+    if not sku:
+        raise ValueError("не указан артикул")
+
+    parsed = {"sku": sku, "name": _text(cell("name"))}
+    for field, cast, title in (("price", float, "цена"), ("stock", int, "остаток"), ("subcategory_id", int, "подкатегория")):
+        value = cell(field)
+        try:
+            parsed[field] = None if value is None else _number(value, cast)
+        except ValueError:
+            raise ValueError(f"некорректное значение в колонке '{title}': {value}")
+    if parsed["price"] is not None and parsed["price"] < 0:
+        raise ValueError("цена не может быть отрицательной")
+    if parsed["stock"] is not None and parsed["stock"] < 0:
+        raise ValueError("остаток не может быть отрицательным")
+
+    value = cell("is_visible")
+    try:
+        parsed["is_visible"] = None if value is None else _bool(value)
+    except ValueError:
+        raise ValueError(f"некорректное значение в колонке 'видимость': {value}")
+    return parsed
+
+
+# --- Запись в БД ---
+
+def _upsert_chunk(db: Session, chunk: list, subcategory_ids: set, report: dict):
+    """chunk - список (номер строки, поля). Дубликаты артикула внутри пачки: действует последняя строка."""
+    by_sku = {}
+    for line_number, fields in chunk:
+        if fields["sku"] in by_sku:
+            _add_error(report, by_sku[fields["sku"]][0], fields["sku"], f"артикул повторяется в строке {line_number}, строка пропущена")
+        by_sku[fields["sku"]] = (line_number, fields)
+
+    existing = {
+        row.sku: row for row in db.query(models.Product.sku, models.Product.name, models.Product.is_visible, models.Product.stock)
+        .filter(models.Product.sku.in_(list(by_sku))).all()
+    }
+
+    values, created, updated = [], 0, 0
+    for sku, (line_number, fields) in by_sku.items():
+        if fields["subcategory_id"] is not None and fields["subcategory_id"] not in subcategory_ids:
+            _add_error(report, line_number, sku, f"подкатегория {fields['subcategory_id']} не найдена")
+            continue
+        current = existing.get(sku)
+        if current is None:
+            if fields["name"] is None or fields["price"] is None or fields["subcategory_id"] is None:
+                _add_error(report, line_number, sku, "для нового товара обязательны название, цена и подкатегория")
+                continue
+            fields = {**fields, "stock": fields["stock"] or 0, "is_visible": True if fields["is_visible"] is None else fields["is_visible"]}
+            created += 1
+        else:
+            # is_visible - NOT NULL, а ограничение проверяется ещё до ON CONFLICT: подставляем текущее значение
+            if fields["is_visible"] is None:
+                fields = {**fields, "is_visible": current.is_visible}
+            updated += 1
+        name = fields["name"] if fields["name"] is not None else current.name
+        values.append({**fields, "search_text": normalize_search_text(f"{name or ''} {sku}")})
+
+    if not values:
+        return
+
+    insert = upsert_insert(db.get_bind())
+    statement = insert(models.Product.__table__).values(values)
+    products = models.Product.__table__
+    # Пустые ячейки в файле не затирают текущие значения товара
+    statement = statement.on_conflict_do_update(
+        index_elements=[products.c.sku],
+        set_={
+            **{
+                field: func.coalesce(statement.excluded[field], products.c[field])
+                for field in ("name", "price", "stock", "subcategory_id")
+            },
+            "is_visible": statement.excluded.is_visible,
+            "search_text": statement.excluded.search_text,
+            "updated_at": func.now(),
+        },
+    )
+    try:
+        saved = db.execute(statement.returning(products.c.id, products.c.sku, products.c.stock)).all()
+        record_stock_movements(db, [
+            {
+                "product_id": row.id, "stock_after": row.stock, "reason": MOVEMENT_IMPORT,
+                "delta": (row.stock or 0) - ((existing[row.sku].stock or 0) if row.sku in existing else 0),
+            }
+            for row in saved
+        ])
+        bump_catalog_version(db)
+        db.commit()
+    except SQLAlchemyError as e:
+        db.rollback()
+        first_line, last_line = chunk[0][0], chunk[-1][0]
+        _add_error(report, first_line, None, f"строки {first_line}-{last_line} не сохранены: ошибка БД ({e.__class__.__name__})")
+        return
+    report["created"] += created
+    report["updated"] += updated
+
+
+def _add_error(report: dict, line_number: int, sku, message: str):
+    report["errors_total"] += 1
+    if len(report["errors"]) < IMPORT_MAX_REPORTED_ERRORS:
+        report["errors"].append({"row": line_number, "sku": sku, "error": message})
+
+
+def import_products(db: Session, rows) -> dict:
+    """
+    Импортирует товары из последовательности строк (первая строка - заголовки).
+    Каждая пачка сохраняется отдельной транзакцией. Возвращает отчёт:
+    {"total_rows", "created", "updated", "errors_total", "errors": [{"row", "sku", "error"}]}.
+    """
+    rows = iter(rows)
+    try:
+        columns = _map_header(next(rows))
+    except StopIteration:
+        raise ImportFormatError("Файл пустой")
+
+    subcategory_ids = {row.id for row in db.query(models.Subcategory.id).all()}
+    report = {"total_rows": 0, "created": 0, "updated": 0, "errors_total": 0, "errors": []}
+    chunk = []
+    for line_number, row in enumerate(rows, start=2):
+        if not any(_text(value) is not None for value in row):
+            continue  # пустые строки в конце таблицы
+        report["total_rows"] += 1
+        try:
+            chunk.append((line_number, parse_row(row, columns)))
+        except ValueError as e:
+            sku_index = columns["sku"]
+            _add_error(report, line_number, _text(row[sku_index]) if sku_index < len(row) else None, str(e))
+        if len(chunk) >= IMPORT_CHUNK_SIZE:
+            _upsert_chunk(db, chunk, subcategory_ids, report)
+            chunk = []
+    if chunk:
+        _upsert_chunk(db, chunk, subcategory_ids, report)
+    report["errors"].sort(key=lambda error: error["row"])
+    return report
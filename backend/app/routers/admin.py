@@ -1,47 +1,54 @@
 # D:\globus-market\backend\app\routers\admin.py
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response, File, UploadFile
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from sqlalchemy import func, case 
+from sqlalchemy import func
 from typing import List, Optional
 
 from app import models, schemas
 from app.dependencies import get_db
-from app.routers.auth import get_current_user
-# Импортируем нашу функцию генерации накладных
-from app.routers.orders import generate_invoice_files 
+from app.database import get_pool_metrics
+from app.cache import (
+    bump_catalog_version, get_setting_bool, bump_cache_version, invalidate_settings, read_cache_version_state,
+    SETTINGS_VERSION_NAME, CATALOG_VERSION_NAME,
+)
+from app.routers.auth import get_current_user, invalidate_user_auth, TokenUser
+# Импортируем функции генерации накладных
+from app.routers.orders import schedule_invoice_generation, stale_invoice_formats, with_order_details, filter_by_date_range, ORDERS_MAX_PAGE_SIZE
+from app.invoices import build_invoice_data, render_invoice_bytes, INVOICE_MEDIA_TYPES, INVOICE_PENDING
+from app.inventory import (
+    apply_stock_updates, reserved_quantities, apply_reserved_change, change_stock, record_stock_movements,
+    MOVEMENT_ORDER_COMPLETED, MOVEMENT_ORDER_RETURNED, MOVEMENT_MANUAL,
+)
+from app.http_cache import ConditionalGet, make_etag, PRIVATE_REVALIDATE
+from app.serialization import serialize_list, json_response
+from app.invoice_export import iter_invoice_zip, parse_export_formats
+from app.product_import import import_products, iter_upload_rows, ImportFormatError
 from datetime import date
 
-from fastapi.responses import FileResponse
-import tempfile
+from fastapi.responses import StreamingResponse
+import logging
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
-# --- Новый "охранник", который пропускает только админов (ОТЛАДОЧНАЯ ВЕРСИЯ) ---
-def get_current_admin_user(current_user: models.User = Depends(get_current_user)):
-    print("\n--- НАЧАЛО ПРОВЕРКИ АДМИНА ---")
+# --- "Охранник", который пропускает только админов (проверка по токену, без запроса к БД) ---
+def get_current_admin_user(current_user: Optional[TokenUser] = Depends(get_current_user)):
     if not current_user:
-        print("ОШИБКА: Пользователь по токену не найден.")
+        logger.debug("Проверка админа: пользователь по токену не найден")
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to perform this action (user not found)",
         )
 
-    print(f"Найден пользователь: {current_user.username} (ID: {current_user.id})")
-    print(f"Значение поля is_admin из базы: {current_user.is_admin}")
-    print(f"Тип данных поля is_admin: {type(current_user.is_admin)}")
-
     if not current_user.is_admin:
-        print("ПРОВЕРКА ПРОВАЛЕНА: current_user.is_admin вернул False.")
-        print("--- КОНЕЦ ПРОВЕРКИ АДМИНА ---\n")
+        logger.warning("Отказано в доступе к админке пользователю %s", current_user.id)
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to perform this action",
         )
 
-    print("ПРОВЕРКА ПРОЙДЕНА: Пользователь является админом.")
-    print("--- КОНЕЦ ПРОВЕРКИ АДМИНА ---\n")
     return current_user
 
 
@@ -58,14 +65,27 @@ class OrderUpdate(BaseModel):
 # --- НОВЫЙ ЭНДПОИНТ для получения ВСЕХ товаров в админке ---
 @router.get("/products/all", response_model=List[schemas.Product])
 def get_all_products_for_admin(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     admin: models.User = Depends(get_current_admin_user)
 ):
     """
     Возвращает абсолютно все товары (включая скрытые) для Редактора товаров.
+    Поддерживает условный GET. Валидатор - версия каталога, прочитанная из БД на каждый запрос
+    (без задержки сверки, как у витрины), чтобы редактор сразу видел свои и чужие правки.
+    Каждая запись в товары и остатки поднимает эту версию в своей транзакции. Last-Modified не отдаём:
+    время изменения (now()) с точностью до секунды в SQLite и на начало транзакции в PostgreSQL
+    может пропустить правку, а версия - нет.
     """
+    catalog_version, _ = read_cache_version_state(db, CATALOG_VERSION_NAME)
+    conditional = ConditionalGet(make_etag("admin_products", catalog_version), None, PRIVATE_REVALIDATE)
+    if conditional.is_fresh(request):
+        return conditional.not_modified()
+    conditional.apply(response)
+
     all_products = db.query(models.Product).order_by(models.Product.name).all()
-    return all_products
+    return json_response(serialize_list(all_products, schemas.Product), response)
 
 # --- НОВЫЙ ЭНДПОИНТ для получения ОДНОГО заказа по ID ---
 @router.get("/orders/{order_id}", response_model=schemas.Order)
@@ -77,7 +97,7 @@ def get_order_by_id(
     """
     Возвращает один заказ по его ID, независимо от статуса (включая удалённые).
     """
-    db_order = db.query(models.Order).filter(models.Order.id == order_id).first()
+    db_order = with_order_details(db.query(models.Order)).filter(models.Order.id == order_id).first()
     if not db_order:
         raise HTTPException(status_code=404, detail="Заказ с таким ID не найден")
     return db_order
@@ -87,8 +107,13 @@ def get_order_by_id(
 
 @router.get("/orders", response_model=List[schemas.Order])
 def get_all_orders(
+    response: Response,
     date_str: Optional[str] = None,
     status: Optional[str] = None, # <-- Добавили новый фильтр по статусу
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    limit: Optional[int] = Query(None, ge=1, le=ORDERS_MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
     db: Session = Depends(get_db),
     admin: models.User = Depends(get_current_admin_user)
 ):
@@ -96,7 +121,9 @@ def get_all_orders(
     Получает список заказов.
     - Если передан 'status', фильтрует по нему.
     - Иначе, отдает все НЕ удалённые заказы.
-    - Фильтрует по дате, если она передана.
+    - Фильтрует по дате (date_str) или диапазону дат (date_from/date_to), если они переданы.
+    - limit/offset - постраничная выдача, общее количество - в заголовке X-Total-Count.
+    Позиции и товары подгружаются фиксированным числом запросов, независимо от числа заказов.
     """
     query = db.query(models.Order)
 
@@ -110,17 +137,21 @@ def get_all_orders(
     if date_str:
         try:
             filter_date = date.fromisoformat(date_str)
-            # В зависимости от статуса, фильтруем по разным датам
-            if status == 'deleted':
-                query = query.filter(func.date(models.Order.deleted_at) == filter_date)
-            else:
-                 query = query.filter(func.date(models.Order.created_at) == filter_date)
-
         except (ValueError, TypeError):
             raise HTTPException(status_code=400, detail="Неверный формат даты. Используйте YYYY-MM-DD.")
-    
-    orders = query.order_by(models.Order.id.asc()).all()
-    return orders
+        date_from = date_to = filter_date
+
+    # В зависимости от статуса, фильтруем по разным датам
+    date_column = models.Order.deleted_at if status == 'deleted' else models.Order.created_at
+    query = filter_by_date_range(query, date_column, date_from, date_to)
+
+    response.headers["X-Total-Count"] = str(query.count())
+
+    query = with_order_details(query).order_by(models.Order.id.asc()).offset(offset)
+    if limit is not None:
+        query = query.limit(limit)
+    orders = query.all()
+    return json_response(serialize_list(orders, schemas.Order), response)
 
 @router.patch("/orders/{order_id}", response_model=schemas.Order)
 def update_order(
@@ -131,9 +162,11 @@ def update_order(
 ):
     """Обновляет заказ: количество, удаляет позиции, меняет скидку. Доступно только админам."""
     
-    db_order = db.query(models.Order).filter(models.Order.id == order_id).first()
+    # Блокируем заказ до конца транзакции, чтобы параллельные правки не испортили учёт резерва
+    db_order = db.query(models.Order).filter(models.Order.id == order_id).with_for_update().first()
     if not db_order:
         raise HTTPException(status_code=404, detail="Order not found")
+    reserved_before = reserved_quantities(db_order)
 
     # Обновляем количество
     for item_id_str, item_data in order_update.items.items():
@@ -162,14 +195,20 @@ def update_order(
     if order_update.status is not None:
         db_order.status = order_update.status
     # --- КОНЕЦ ИСПРАВЛЕННОЙ ЛОГИКИ ---
+
+    apply_reserved_change(db, reserved_before, reserved_quantities(db_order, skip_items=db.deleted))
         
+    # ВАЖНО: Перегенерируем накладные, только если изменилось печатаемое содержимое
+    # (в фоне, см. schedule_invoice_generation). Смена одного статуса файлы не трогает.
+    db.flush()
+    db.expire(db_order, ["items"])
+    if db_order.invoice_status == INVOICE_PENDING or stale_invoice_formats(db_order):
+        db_order.invoice_status = INVOICE_PENDING
     db.commit()
     db.refresh(db_order)
 
-    # ВАЖНО: Перегенерируем накладные с новыми данными
-    generate_invoice_files(db_order, db)
-    db.commit() # Сохраняем пути к новым файлам
-    db.refresh(db_order)
+    if db_order.invoice_status == INVOICE_PENDING:
+        schedule_invoice_generation(db_order)
 
     return db_order
 
@@ -191,47 +230,51 @@ def update_order_status(
     - При статусе 'completed' - списывает товары со склада.
     - При статусе 'returned' - возвращает товары на склад.
     """
-    db_order = db.query(models.Order).filter(models.Order.id == order_id).first()
+    db_order = db.query(models.Order).filter(models.Order.id == order_id).with_for_update().first()
     if not db_order:
         raise HTTPException(status_code=404, detail="Order not found")
 
     new_status = status_update.status
     old_status = db_order.status
+    reserved_before = reserved_quantities(db_order)
 
     # --- НОВАЯ РАСШИРЕННАЯ ЛОГИКА ---
+    # Остатки всех товаров заказа меняются одним условным UPDATE (см. app/inventory.change_stock)
+    order_quantities = {}
+    for item in db_order.items:
+        order_quantities[item.product_id] = order_quantities.get(item.product_id, 0) + item.quantity
 
     # 1. СЦЕНАРИЙ: ЗАВЕРШЕНИЕ ЗАКАЗА (Списание остатков)
     if new_status == "completed" and old_status != "completed":
-        ignore_stock_setting = db.query(models.AppSettings).filter(models.AppSettings.key == "ignore_stock_limits").first()
-        ignore_stock = ignore_stock_setting.value == "true" if ignore_stock_setting else False
-        
-        for item in db_order.items:
-            product = db.query(models.Product).filter(models.Product.id == item.product_id).with_for_update().first()
-            
-            if not ignore_stock and product.stock < item.quantity:
-                db.rollback()
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Невозможно завершить заказ. Недостаточно товара '{product.name}' на складе. В наличии: {product.stock}, в заказе: {item.quantity}"
-                )
-            
-            product.stock -= item.quantity
+        ignore_stock = get_setting_bool(db, "ignore_stock_limits", False)
+
+        failed = change_stock(
+            db, {product_id: -quantity for product_id, quantity in order_quantities.items()},
+            MOVEMENT_ORDER_COMPLETED, order_id=db_order.id, check_available=not ignore_stock
+        )
+        if failed:
+            # Запрос списания - первое изменение в транзакции, откат ничего лишнего не отменяет
+            db.rollback()
+            product = db.query(models.Product).filter(models.Product.id == failed[0]).first()
+            if product is None:
+                detail = f"Невозможно завершить заказ. Товар с ID {failed[0]} не найден."
+            else:
+                detail = f"Невозможно завершить заказ. Недостаточно товара '{product.name}' на складе. В наличии: {product.stock}, в заказе: {order_quantities[failed[0]]}"
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
         
         db_order.completed_at = func.now()
 
     # 2. СЦЕНАРИЙ: ВОЗВРАТ ЗАКАЗА (Возврат остатков на склад)
     elif new_status == "returned" and old_status == "completed":
         # Возврат возможен только для УЖЕ ЗАВЕРШЕННОГО заказа
-        for item in db_order.items:
-            product = db.query(models.Product).filter(models.Product.id == item.product_id).with_for_update().first()
-            if product:
-                product.stock += item.quantity # Возвращаем товары на склад
+        change_stock(db, order_quantities, MOVEMENT_ORDER_RETURNED, order_id=db_order.id)
 
     # 3. СЦЕНАРИЙ: ОТМЕНА ЗАКАЗА (Никаких действий с остатками)
     # Этот сценарий не требует специального блока кода, так как остатки не списывались.
     # Мы просто меняем статус.
 
     db_order.status = new_status
+    apply_reserved_change(db, reserved_before, reserved_quantities(db_order))
     db.commit()
     db.refresh(db_order)
     return db_order
@@ -240,31 +283,62 @@ def update_order_status(
 class OrderPreview(schemas.Order):
     pass
 
-@router.post("/orders/preview/pdf", response_class=FileResponse)
+@router.get("/invoices/export")
+def export_invoices(
+    date_from: date,
+    date_to: date,
+    status: Optional[str] = None,
+    formats: str = "pdf,xlsx",
+    admin: models.User = Depends(get_current_admin_user)
+):
+    """
+    ZIP-архив накладных заказов за период [date_from, date_to] (например, за месяц для бухгалтерии).
+    - status - выгрузить только заказы в этом статусе (по умолчанию - все, кроме удалённых).
+    - formats - "pdf", "xlsx" или "pdf,xlsx".
+    Архив формируется потоково, недостающие накладные дорисовываются по ходу выгрузки.
+    """
+    try:
+        export_formats = parse_export_formats(formats)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Формат накладной должен быть pdf, xlsx или pdf,xlsx")
+    if date_to < date_from:
+        raise HTTPException(status_code=400, detail="Дата окончания периода раньше даты начала")
+
+    file_name = f"invoices_{date_from.isoformat()}_{date_to.isoformat()}.zip"
+    return StreamingResponse(
+        iter_invoice_zip(date_from, date_to, status, export_formats),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{file_name}"'},
+    )
+
+
+def _invoice_preview_response(order_data: OrderPreview, file_format: str) -> Response:
+    """Рисует накладную по присланным данным в память и отдаёт её. Постоянные файлы и пути заказа не трогаются."""
+    content = render_invoice_bytes(build_invoice_data(order_data), file_format)
+    return Response(
+        content=content,
+        media_type=INVOICE_MEDIA_TYPES[file_format],
+        headers={
+            "Content-Disposition": f'attachment; filename="preview_{order_data.order_number}.{file_format}"',
+            "Cache-Control": "no-store",
+        },
+    )
+
+@router.post("/orders/preview/pdf", response_class=Response)
 def get_pdf_preview(
     order_data: OrderPreview,
-    db: Session = Depends(get_db),
     admin: models.User = Depends(get_current_admin_user)
 ):
     """Генерирует PDF на лету на основе переданных данных и возвращает его как файл."""
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf", prefix="preview_") as tmp:
-        order_data.invoice_path_pdf = tmp.name
-        order_data.invoice_path_xlsx = ""
-        generate_invoice_files(order_data, db)
-        return FileResponse(tmp.name, media_type='application/pdf', filename=f"preview_{order_data.order_number}.pdf")
+    return _invoice_preview_response(order_data, "pdf")
 
-@router.post("/orders/preview/excel", response_class=FileResponse)
+@router.post("/orders/preview/excel", response_class=Response)
 def get_excel_preview(
     order_data: OrderPreview,
-    db: Session = Depends(get_db),
     admin: models.User = Depends(get_current_admin_user)
 ):
     """Генерирует Excel на лету и возвращает его как файл."""
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx", prefix="preview_") as tmp:
-        order_data.invoice_path_pdf = ""
-        order_data.invoice_path_xlsx = tmp.name
-        generate_invoice_files(order_data, db)
-        return FileResponse(tmp.name, media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', filename=f"preview_{order_data.order_number}.xlsx")
+    return _invoice_preview_response(order_data, "xlsx")
 
 
 # --- НОВЫЙ ЭНДПОИНТ для получения данных для страницы Ревизии ---
@@ -277,18 +351,13 @@ def get_revision_list(
     Возвращает полный список товаров с указанием текущих остатков
     и количества товаров в заказах, которые еще не завершены.
     """
-    reserved_stock_query = db.query(
-        models.OrderItem.product_id,
-        func.sum(case((models.Order.status == 'new', models.OrderItem.quantity), else_=0)).label('new'),
-        func.sum(case((models.Order.status == 'processed', models.OrderItem.quantity), else_=0)).label('processed')
-    ).join(models.Order).group_by(models.OrderItem.product_id).subquery()
-
+    # Резерв хранится в reserved_stock и обновляется вместе с заказами - здесь только простой JOIN
     products_with_reserved_stock = db.query(
         models.Product,
-        reserved_stock_query.c.new,
-        reserved_stock_query.c.processed
+        models.ReservedStock.new_qty,
+        models.ReservedStock.processed_qty
     ).outerjoin(
-        reserved_stock_query, models.Product.id == reserved_stock_query.c.product_id
+        models.ReservedStock, models.Product.id == models.ReservedStock.product_id
     ).order_by(models.Product.name).all()
 
     result = []
@@ -299,6 +368,7 @@ def get_revision_list(
             name=product.name,
             price=product.price,
             db_stock=product.stock,
+            updated_at=product.updated_at,
             reserved=schemas.ReservedStock(
                 new=new_qty or 0,
                 processed=processed_qty or 0
@@ -309,7 +379,7 @@ def get_revision_list(
 
     
 # --- НОВЫЙ ЭНДПОИНТ для обновления остатков после ревизии ---
-@router.post("/inventory/update", status_code=status.HTTP_200_OK)
+@router.post("/inventory/update", status_code=status.HTTP_200_OK, response_model=schemas.InventoryUpdateResult)
 def update_inventory(
     inventory_data: schemas.InventoryUpdate,
     db: Session = Depends(get_db),
@@ -317,25 +387,36 @@ def update_inventory(
 ):
     """
     Массово обновляет количество товаров на складе.
-    Принимает список ID товаров и их новые остатки.
+    Принимает список ID товаров и их новые остатки (и updated_at товара из списка ревизии).
+    Товары, изменённые после загрузки списка ревизии, не перезаписываются, а возвращаются в conflicts.
     """
-    updated_products = []
-    not_found_products = []
-    for item in inventory_data.updates:
-        product = db.query(models.Product).filter(models.Product.id == item.product_id).first()
-        if product:
-            product.stock = item.new_stock
-            updated_products.append(item.product_id)
-        else:
-            not_found_products.append(item.product_id)
-    if updated_products:
-        db.commit()
-    if not_found_products:
+    result = apply_stock_updates(db, inventory_data.updates)
+    db.commit()
+
+    requested_count = len({item.product_id for item in inventory_data.updates})
+    applied_count = requested_count - len(result["conflicts"]) - len(result["not_found"])
+    conflicts_note = ""
+    if result["conflicts"]:
+        skus = ", ".join(conflict["sku"] for conflict in result["conflicts"])
+        conflicts_note = f" Изменились после загрузки ревизии и не обновлены: {skus}."
+    if result["not_found"]:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Не удалось найти товары с ID: {not_found_products}. Остатки для остальных товаров обновлены."
+            detail=f"Не удалось найти товары с ID: {result['not_found']}. Остатки для остальных товаров обновлены.{conflicts_note}"
         )
-    return {"message": f"Остатки успешно обновлены для {len(updated_products)} товаров."}    
+    message = f"Остатки успешно обновлены для {applied_count} товаров.{conflicts_note}"
+    return {"message": message, "updated": applied_count, "conflicts": result["conflicts"]}
+
+
+# === МОНИТОРИНГ ===
+
+@router.get("/metrics/db-pool")
+def get_db_pool_metrics(admin: models.User = Depends(get_current_admin_user)):
+    """
+    Состояние пула соединений к БД: сколько соединений выдано, переполнение,
+    среднее/максимальное время ожидания соединения и число отказов по таймауту.
+    """
+    return get_pool_metrics()
 
 
 # === НОВЫЙ РАЗДЕЛ: УПРАВЛЕНИЕ НАСТРОЙКАМИ ===
@@ -361,11 +442,63 @@ def update_setting(
     if not db_setting:
         raise HTTPException(status_code=404, detail="Настройка не найдена")
     db_setting.value = setting_data.value
+    # Поднимаем версию настроек в той же транзакции - остальные воркеры увидят её и перечитают кэш
+    bump_cache_version(db, SETTINGS_VERSION_NAME)
     db.commit()
+    invalidate_settings()
     db.refresh(db_setting)
     return db_setting
 
 
+# === ПОЛЬЗОВАТЕЛИ: отзыв токенов и права администратора ===
+# Токен проверяется без запроса к БД (см. auth.get_current_user): состояние пользователя кэшируется
+# каждым воркером до AUTH_CACHE_TTL секунд. Этот воркер сбрасывает кэш сразу после commit,
+# остальные подхватят изменение не позже чем через AUTH_CACHE_TTL.
+
+def _bump_token_version(db: Session, user_id: int) -> models.User:
+    """Увеличивает users.token_version - все ранее выданные токены пользователя перестают действовать."""
+    user = db.query(models.User).filter(models.User.id == user_id).with_for_update().first()
+    if not user:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+    user.token_version = (user.token_version or 0) + 1
+    return user
+
+
+@router.post("/users/{user_id}/revoke-tokens")
+def revoke_user_tokens(
+    user_id: int,
+    db: Session = Depends(get_db),
+    admin: models.User = Depends(get_current_admin_user)
+):
+    """Отзывает все токены пользователя (например, при утечке пароля): ему придётся войти заново."""
+    _bump_token_version(db, user_id)
+    db.commit()
+    invalidate_user_auth(user_id)
+    logger.info("Администратор %s отозвал токены пользователя %s", admin.id, user_id)
+    return {"message": "Токены пользователя отозваны."}
+
+
+@router.put("/users/{user_id}/admin")
+def set_user_admin(
+    user_id: int,
+    update: schemas.UserAdminUpdate,
+    db: Session = Depends(get_db),
+    admin: models.User = Depends(get_current_admin_user)
+):
+    """
+    Выдаёт или снимает права администратора. Ранее выданные токены пользователя отзываются:
+    флаг администратора записан в токене, и новый токен с актуальным флагом выдаётся при следующем входе.
+    """
+    if user_id == admin.id and not update.is_admin:
+        raise HTTPException(status_code=400, detail="Нельзя снять права администратора с самого себя")
+    user = _bump_token_version(db, user_id)
+    user.is_admin = update.is_admin
+    db.commit()
+    invalidate_user_auth(user_id)
+    logger.info("Администратор %s изменил права пользователя %s: is_admin=%s", admin.id, user_id, update.is_admin)
+    return {"message": "Права пользователя обновлены."}
+
+
 # --- НОВЫЙ ЭНДПОИНТ для обработки частичных возвратов ---
 @router.post("/orders/{order_id}/return", response_model=schemas.Order)
 def process_order_return(
@@ -378,7 +511,7 @@ def process_order_return(
     Обрабатывает частичный или полный возврат товаров по заказу.
     Товары возвращаются на склад. Статус заказа меняется.
     """
-    db_order = db.query(models.Order).filter(models.Order.id == order_id).first()
+    db_order = db.query(models.Order).filter(models.Order.id == order_id).with_for_update().first()
     if not db_order:
         raise HTTPException(status_code=404, detail="Заказ не найден")
     if db_order.status != "completed":
@@ -387,31 +520,28 @@ def process_order_return(
             detail=f"Возврат можно оформить только для заказа со статусом 'completed'. Текущий статус: '{db_order.status}'"
         )
     total_items_in_order = len(db_order.items)
-    returned_items_count = 0
+    items_by_id = {item.id: item for item in db_order.items}
+
+    # Сначала проверяем все позиции, затем одним запросом возвращаем товары на склад
+    return_quantities = {}
+    requested_by_item = {}
     for item_to_return in return_data.items_to_return:
-        order_item = db.query(models.OrderItem).filter(
-            models.OrderItem.id == item_to_return.order_item_id,
-            models.OrderItem.order_id == order_id
-        ).first()
+        order_item = items_by_id.get(item_to_return.order_item_id)
         if not order_item:
-            db.rollback()
             raise HTTPException(status_code=404, detail=f"Позиция с ID {item_to_return.order_item_id} не найдена в этом заказе.")
         
         # Проверяем, что общее количество возвратов не превышает заказанное
-        if (order_item.returned_quantity + item_to_return.quantity) > order_item.quantity:
-            db.rollback()
+        already_requested = requested_by_item.get(order_item.id, 0)
+        if (order_item.returned_quantity + already_requested + item_to_return.quantity) > order_item.quantity:
             raise HTTPException(status_code=400, detail=f"Невозможно вернуть {item_to_return.quantity} ед. товара '{order_item.product.name}', так как общее количество возврата превысит заказанное.")
+        requested_by_item[order_item.id] = already_requested + item_to_return.quantity
+        return_quantities[order_item.product_id] = return_quantities.get(order_item.product_id, 0) + item_to_return.quantity
 
-        product = db.query(models.Product).filter(models.Product.id == order_item.product_id).with_for_update().first()
-        if product:
-            product.stock += item_to_return.quantity
-        
-        # --- ДОБАВЛЕНО ИЗМЕНЕНИЕ ---
+    change_stock(db, return_quantities, MOVEMENT_ORDER_RETURNED, order_id=db_order.id)
+
+    for item_id, quantity in requested_by_item.items():
         # Записываем, сколько единиц этой позиции было возвращено в этой операции
-        order_item.returned_quantity += item_to_return.quantity
-        
-        if order_item.returned_quantity == order_item.quantity:
-            returned_items_count += 1
+        items_by_id[item_id].returned_quantity += quantity
     
     # Считаем, сколько всего позиций в заказе было полностью возвращено
     total_fully_returned_items = sum(1 for item in db_order.items if item.quantity == item.returned_quantity)
@@ -445,6 +575,7 @@ def bulk_update_products(
     """
     updated_count = 0
     errors = []
+    stock_movements = []
 
     for item_update in bulk_data.updates:
         # Находим товар в базе по ID
@@ -471,7 +602,11 @@ def bulk_update_products(
             product.name = item_update.name
         if item_update.price is not None:
             product.price = item_update.price
-        if item_update.stock is not None:
+        if item_update.stock is not None and item_update.stock != product.stock:
+            stock_movements.append({
+                "product_id": product.id, "delta": item_update.stock - (product.stock or 0),
+                "stock_after": item_update.stock, "reason": MOVEMENT_MANUAL,
+            })
             product.stock = item_update.stock
         if item_update.is_visible is not None:
             product.is_visible = item_update.is_visible        
@@ -487,12 +622,33 @@ def bulk_update_products(
         )
 
     # Если ошибок не было, сохраняем все изменения
+    record_stock_movements(db, stock_movements)
+    bump_catalog_version(db)
     db.commit()
     
     return {"message": f"Успешно обновлено {updated_count} товаров."}
 
 
 
+# --- Импорт товаров из прайс-листа (CSV / XLSX) ---
+@router.post("/products/import", response_model=schemas.ProductImportReport)
+def import_products_file(
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    admin: models.User = Depends(get_current_admin_user)
+):
+    """
+    Создаёт и обновляет товары по артикулу из файла. Первая строка - заголовки:
+    sku/Артикул (обязательно), name/Наименование, price/Цена, stock/Остаток, subcategory_id, is_visible.
+    Для нового товара обязательны также название, цена и подкатегория.
+    Пустая ячейка не меняет значение у существующего товара. Строки с ошибками пропускаются и попадают в отчёт.
+    """
+    try:
+        return import_products(db, iter_upload_rows(file.filename, file.file))
+    except ImportFormatError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
 # Для удаления заказов
 class OrderDeleteRequest(BaseModel):
     reason: str
@@ -509,7 +665,7 @@ def delete_order(
     "Мягко" удаляет заказ, меняя его статус на 'deleted'.
     Доступно только для статусов 'new' и 'processed'.
     """
-    db_order = db.query(models.Order).filter(models.Order.id == order_id).first()
+    db_order = db.query(models.Order).filter(models.Order.id == order_id).with_for_update().first()
     if not db_order:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Заказ не найден")
 
@@ -519,8 +675,10 @@ def delete_order(
             detail=f"Нельзя удалить заказ со статусом '{db_order.status}'"
         )
 
+    reserved_before = reserved_quantities(db_order)
     db_order.status = "deleted"
     db_order.deleted_at = func.now() # Устанавливаем текущее время
     db_order.deletion_reason = delete_data.reason # Сохраняем причину
+    apply_reserved_change(db, reserved_before, {})
     db.commit()
     return
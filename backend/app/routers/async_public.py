@@ -0,0 +1,55 @@
+# D:\globus-market\backend\app\routers\async_public.py
+#
+# Горячие публичные маршруты на AsyncSession (режим DB_ASYNC=1, см. app/database.py).
+# Синхронные версии выполняются в общем пуле потоков и под нагрузкой ждут свободный поток;
+# здесь запросы к БД идут через асинхронный драйвер прямо в event loop.
+# Логика запросов общая с синхронными маршрутами: она выполняется через AsyncSession.run_sync,
+# где тот же код работает с обычной Session поверх асинхронного соединения.
+# Роутер подключается раньше синхронных и перекрывает их маршруты (в схеме OpenAPI остаются синхронные).
+
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import schemas
+from app.dependencies import get_async_db
+from app.routers.categories import list_categories
+from app.routers.orders import place_order, load_order_for_response, schedule_invoice_generation
+from app.routers.products import list_products, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+
+router = APIRouter()
+
+
+@router.get("/products/", response_model=List[schemas.Product], include_in_schema=False)
+async def get_products_async(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    search: Optional[str] = None,
+    subcategory_id: Optional[int] = None,
+    category_id: Optional[int] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    sort: Optional[str] = None
+):
+    return await db.run_sync(list_products, request, response, search, subcategory_id, category_id, limit, cursor, sort)
+
+
+@router.get("/categories/", response_model=List[schemas.Category], include_in_schema=False)
+async def get_categories_async(request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
+    return await db.run_sync(list_categories, request, response)
+
+
+@router.post("/orders/", response_model=schemas.Order, include_in_schema=False)
+async def create_order_async(order_data: schemas.OrderCreate, db: AsyncSession = Depends(get_async_db)):
+    order_id = await db.run_sync(place_order, order_data)
+    await db.commit()
+
+    # Как в синхронной версии после commit: заказ перечитывается целиком, с позициями и товарами
+    db.expire_all()
+    new_order = await db.run_sync(load_order_for_response, order_id)
+    # Первая постановка в очередь запускает процессы пула накладных - не в event loop
+    await run_in_threadpool(schedule_invoice_generation, new_order)
+    return new_order
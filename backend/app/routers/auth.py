@@ -1,6 +1,7 @@
 # D:\globus-market\backend\app\routers\auth.py
 
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
@@ -9,7 +10,10 @@ import hashlib
 import json
 import time
 from typing import Optional
+from dataclasses import dataclass
 import base64
+import logging
+import threading
 
 # --- ИЗМЕНЕНИЕ: Используем новую библиотеку PyJWT ---
 import jwt
@@ -17,10 +21,11 @@ import os
 
 from app import models, schemas
 from app.dependencies import get_db
-from app.security import verify_password
+from app.security import verify_and_update_password, run_password_task, PasswordHasherBusy
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 SECRET_KEY = "your-super-secret-key"
 ALGORITHM = "HS256"
@@ -28,6 +33,25 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 1440
 
 oauth2_scheme = HTTPBearer(auto_error=False)
 
+# --- Быстрая проверка токена без похода в БД ---
+# В токене лежат флаг администратора (adm) и версия токенов пользователя (ver).
+# Чтобы отзыв токенов (увеличение users.token_version) и снятие прав админа всё же работали,
+# состояние пользователя из БД кэшируется не дольше AUTH_CACHE_TTL секунд.
+# Отзыв и смена прав - в админке: POST /admin/users/{id}/revoke-tokens, PUT /admin/users/{id}/admin.
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "30"))
+
+_auth_cache_lock = threading.Lock()
+_auth_cache = {}  # user_id -> (время проверки, token_version, is_admin); None вместо кортежа - пользователя нет
+
+
+@dataclass(frozen=True)
+class TokenUser:
+    """Пользователь, восстановленный из проверенного токена (без загрузки из БД)."""
+    id: int
+    is_admin: bool
+    token_version: int
+
+
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = int(time.time()) + ACCESS_TOKEN_EXPIRE_MINUTES * 60
@@ -36,20 +60,68 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+
+def create_user_access_token(user: models.User):
+    return create_access_token(data={
+        "sub": str(user.id),
+        "adm": bool(user.is_admin),
+        "ver": user.token_version or 0,
+    })
+
+
+def _get_user_auth_state(db: Session, user_id: int):
+    """Возвращает (token_version, is_admin) пользователя из кэша или из БД; None - пользователя нет."""
+    now = time.monotonic()
+    entry = _auth_cache.get(user_id)
+    if entry is not None and now - entry[0] < AUTH_CACHE_TTL:
+        return entry[1]
+
+    row = db.query(models.User.token_version, models.User.is_admin).filter(models.User.id == user_id).first()
+    state = (row.token_version or 0, bool(row.is_admin)) if row else None
+    with _auth_cache_lock:
+        _auth_cache[user_id] = (now, state)
+    return state
+
+
+def invalidate_user_auth(user_id: int):
+    """Сбрасывает закэшированное состояние пользователя (вызывать после изменения is_admin/token_version)."""
+    with _auth_cache_lock:
+        _auth_cache.pop(user_id, None)
+
+
 @router.post("/login")
-def login_for_access_token(db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
-    user = db.query(models.User).filter(models.User.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
+    # Запросы к БД - в общем пуле потоков, проверка пароля - в отдельном пуле bcrypt (app/security.py)
+    user = await run_in_threadpool(
+        lambda: db.query(models.User).filter(models.User.username == form_data.username).first()
+    )
+    is_valid, new_hash = False, None
+    if user and user.hashed_password:
+        try:
+            is_valid, new_hash = await run_password_task(verify_and_update_password, form_data.password, user.hashed_password)
+        except PasswordHasherBusy:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many login attempts, try again later",
+                headers={"Retry-After": "1"},
+            )
+    if not is_valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = create_access_token(data={"sub": str(user.id)})
+    access_token = create_user_access_token(user)
+    if new_hash:
+        # Хэш посчитан с устаревшими параметрами - сохраняем пересчитанный
+        user.hashed_password = new_hash
+        await run_in_threadpool(db.commit)
     return {"access_token": access_token, "token_type": "bearer"}
 
 # --- ФИНАЛЬНАЯ ИСПРАВЛЕННАЯ ВЕРСИЯ ---
-async def get_current_user(token: Optional[HTTPAuthorizationCredentials] = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+# Обычная (не async) функция: если состояние пользователя нужно перечитать из БД,
+# запрос выполнится в пуле потоков, а не в event loop.
+def get_current_user(token: Optional[HTTPAuthorizationCredentials] = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     if token is None:
         return None
 
@@ -61,14 +133,21 @@ async def get_current_user(token: Optional[HTTPAuthorizationCredentials] = Depen
     try:
         # Используем "очищенный" токен для расшифровки
         payload = jwt.decode(token_data, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            return None
-    except jwt.PyJWTError:
+        user_id = int(payload.get("sub"))
+    except (jwt.PyJWTError, TypeError, ValueError):
+        return None
+
+    state = _get_user_auth_state(db, user_id)
+    if state is None:
+        return None
+    token_version, is_admin = state
+    if payload.get("ver", 0) != token_version:
+        logger.info("Отклонён отозванный токен пользователя %s", user_id)
         return None
 
-    user = db.query(models.User).filter(models.User.id == int(user_id)).first()
-    return user
+    # Старые токены (выданные до появления claim "adm") проверяем по состоянию из БД
+    token_is_admin = payload.get("adm", is_admin)
+    return TokenUser(id=user_id, is_admin=bool(token_is_admin and is_admin), token_version=token_version)
 
 
 
@@ -97,5 +176,5 @@ def login_via_telegram(login_data: TelegramLoginData, db: Session = Depends(get_
         user = models.User(telegram_id=login_data.id, first_name=login_data.first_name); db.add(user); db.commit(); db.refresh(user)
     else:
         db.refresh(user)
-    access_token = create_access_token(data={"sub": str(user.id)})
+    access_token = create_user_access_token(user)
     return {"access_token": access_token, "token_type": "bearer", "user": schemas.User.from_orm(user)}
\ No newline at end of file
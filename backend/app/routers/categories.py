@@ -1,34 +1,75 @@
 # D:\globus-market\backend\app\routers\categories.py
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 from typing import List
 
 from app import models, schemas
 from app.dependencies import get_db
+from app.cache import get_catalog_cached, get_catalog_state, bump_catalog_version
+from app.http_cache import ConditionalGet, make_etag
 # Импортируем "охранника" для админов
 from app.routers.admin import get_current_admin_user
 
 router = APIRouter()
 
+def build_category_tree(db: Session) -> List[dict]:
+    """
+    Строит дерево категорий одним запросом: категории + подкатегории +
+    количество видимых товаров в каждой подкатегории (через GROUP BY).
+    """
+    product_counts = db.query(
+        models.Product.subcategory_id.label("subcategory_id"),
+        func.count(models.Product.id).label("product_count")
+    ).filter(
+        models.Product.is_visible == True
+    ).group_by(models.Product.subcategory_id).subquery()
+
+    rows = db.query(
+        models.Category.id,
+        models.Category.name,
+        models.Subcategory.id,
+        models.Subcategory.name,
+        product_counts.c.product_count
+    ).outerjoin(
+        models.Subcategory, models.Subcategory.category_id == models.Category.id
+    ).outerjoin(
+        product_counts, product_counts.c.subcategory_id == models.Subcategory.id
+    ).order_by(models.Category.id, models.Subcategory.id).all()
+
+    categories = {}
+    for cat_id, cat_name, sub_id, sub_name, product_count in rows:
+        category = categories.setdefault(cat_id, {"id": cat_id, "name": cat_name, "subcategories": []})
+        if sub_id is not None:
+            category["subcategories"].append({
+                "id": sub_id,
+                "name": sub_name,
+                "product_count": product_count or 0,
+            })
+    return list(categories.values())
+
+
 @router.get("/", response_model=List[schemas.Category])
-def get_categories(db: Session = Depends(get_db)):
+def get_categories(request: Request, response: Response, db: Session = Depends(get_db)):
     """
     Возвращает полное дерево категорий с подкатегориями
     и посчитанным количеством товаров в каждой.
+    Дерево кэшируется в памяти и сбрасывается при изменении товаров/категорий.
+    Поддерживает условный GET (ETag / Last-Modified по версии каталога).
     """
-    categories = db.query(models.Category).all()
-    
-    for cat in categories:
-        for subcat in cat.subcategories:
-            count = db.query(func.count(models.Product.id)).filter(
-                models.Product.subcategory_id == subcat.id, 
-                models.Product.is_visible == True
-            ).scalar()
-            subcat.product_count = count
-            
-    return categories
+    return list_categories(db, request, response)
+
+
+def list_categories(db: Session, request: Request, response: Response):
+    """Дерево категорий для GET /categories/ (синхронного и асинхронного) или 304."""
+    catalog_version, catalog_modified = get_catalog_state(db)
+    conditional = ConditionalGet(make_etag("categories", catalog_version), catalog_modified)
+    if conditional.is_fresh(request):
+        return conditional.not_modified()
+    conditional.apply(response)
+
+    return get_catalog_cached(db, "category_tree", lambda: build_category_tree(db))
 
 # --- НОВЫЙ ЭНДПОИНТ для создания категории ---
 @router.post("/", response_model=schemas.Category, status_code=status.HTTP_201_CREATED)
@@ -44,6 +85,7 @@ def create_category(
     
     new_category = models.Category(name=category.name)
     db.add(new_category)
+    bump_catalog_version(db)
     db.commit()
     db.refresh(new_category)
     return new_category
@@ -71,6 +113,7 @@ def create_subcategory(
 
     new_subcategory = models.Subcategory(name=subcategory.name, category_id=subcategory.category_id)
     db.add(new_subcategory)
+    bump_catalog_version(db)
     db.commit()
     db.refresh(new_subcategory)
     # Дополняем поле product_count для консистентности ответа
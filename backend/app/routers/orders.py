@@ -1,229 +1,399 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import Integer, cast, func, insert, or_, update
+from datetime import date, datetime, time, timedelta, timezone
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import asyncio
+import logging
+import multiprocessing
 import os
+import threading
 from typing import List, Optional
-from pathlib import Path
 import secrets  # <-- Убедитесь, что этот импорт есть
 
 from app import models, schemas
 from app.dependencies import get_db
+from app.cache import get_setting_bool
+from app.inventory import apply_reserved_change, RESERVED_STATUS_COLUMNS
 from app.routers.auth import get_current_user
 
-# Импорты для PDF и Excel
-from reportlab.platypus import Table, TableStyle, Paragraph, Image as PlatypusImage
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib import colors
-from reportlab.lib.units import cm
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfbase import pdfmetrics
-from openpyxl import Workbook
-from openpyxl.styles import Alignment, Border, Side
+from app.database import SessionLocal, upsert_insert
+from app.invoices import (
+    build_invoice_data, render_invoice_files, invoice_content_hashes, invoice_file_path,
+    INVOICE_PENDING, INVOICE_READY, INVOICE_FAILED,
+)
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-BASE_DIR = Path(__file__).resolve().parent.parent.parent
-INVOICE_DIR = BASE_DIR / "invoices"
-FONT_PATH = BASE_DIR / "DejaVuSans.ttf"
-pdfmetrics.registerFont(TTFont('DejaVuSans', str(FONT_PATH)))
-pdfmetrics.registerFont(TTFont('DejaVuSans-Oblique', str(BASE_DIR / "DejaVuSans-Oblique.ttf")))
-
-
-def generate_invoice_files(order: models.Order, db: Session):
-    date_str = order.created_at.strftime("%Y-%m")
-    folder_path = INVOICE_DIR / date_str
-    os.makedirs(folder_path, exist_ok=True)
-
-    file_base_name = f"order_{order.order_number}"
-    pdf_path = folder_path / f"{file_base_name}.pdf"
-    xlsx_path = folder_path / f"{file_base_name}.xlsx"
-
-    subtotal = sum(item.quantity * item.price_per_item for item in order.items)
-    discount_amount = (subtotal * order.discount_percent) / 100
-    final_total = subtotal - discount_amount
-
-    # --- Генерация PDF ---
-    c = canvas.Canvas(str(pdf_path), pagesize=A4)
-    width, height = A4
-    c.setFont('DejaVuSans', 14)
-    c.drawString(72, height - 50, f"Расходная накладная № {order.order_number}")
-    c.setFont('DejaVuSans', 11)
-    c.drawString(72, height - 70, f"Дата: {order.created_at.strftime('%d.%m.%Y %H:%M')}")
-    c.drawString(72, height - 90, f"Клиент: {order.customer_name}, Телефон: {order.customer_phone}")
-    
-    # --- ИЗМЕНЕНИЕ НАЧАЛО ---
-    # Определяем стили для ячеек
-    styles = getSampleStyleSheet()
-    # Стиль для обычного текста в ячейке. wordWrap = 'CJK' позволяет переносить длинные строки без пробелов.
-    styleN = ParagraphStyle(name='Normal', fontName='DejaVuSans', fontSize=9, wordWrap='CJK', alignment=1)
-    # Стиль для комментариев
-    styleComment = ParagraphStyle(name='Comment', parent=styleN, fontName='DejaVuSans-Oblique', textColor=colors.grey)
-    # Стиль для правого выравнивания (цены, количество)
-    styleR = ParagraphStyle(name='Right', parent=styleN, alignment=2)
-
-    # Заголовки таблицы оборачиваем в параграфы для единообразия
-    headers = [Paragraph(h, styleN) for h in ['№', 'Артикул', 'Фото', 'Наименование товара', 'Кол-во', 'Цена', 'Сумма']]
-    data = [headers]
-    
-    for i, item in enumerate(order.items):
-        product = db.query(models.Product).filter(models.Product.id == item.product_id).first()
-        item_sum = item.quantity * item.price_per_item
-        product_name = product.name if product else "Товар не найден"
-        
-        image_cell = ''
-        if product and product.image_url:
-            image_path = BASE_DIR / product.image_url.lstrip('/')
-            if image_path.exists():
-                img = PlatypusImage(image_path, width=2*cm, height=2*cm)
-                image_cell = img
-        
-        # Оборачиваем содержимое каждой ячейки в Paragraph
-        name_cell_content = [Paragraph(product_name, styleN)]
-        if item.comment:
-            name_cell_content.append(Paragraph(item.comment, styleComment))
-
-        row = [
-            Paragraph(str(i + 1), styleN),
-            Paragraph(product.sku if product else "N/A", styleN), # Артикул теперь тоже Paragraph
-            image_cell,
-            name_cell_content,
-            Paragraph(str(item.quantity), styleR),
-            Paragraph(f"{item.price_per_item:.2f}", styleR),
-            Paragraph(f"{item_sum:.2f}", styleR)
-        ]
-        data.append(row)
-    # --- ИЗМЕНЕНИЕ КОНЕЦ ---
-
-    col_widths = [1*cm, 2.2*cm, 2.2*cm, 5.1*cm, 1.5*cm, 2.5*cm, 2.5*cm] # Слегка изменили ширину Артикула
-    table = Table(data, colWidths=col_widths)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#f2f2f2')),
-        ('ALIGN', (0,0), (-1,-1), 'CENTER'),
-        ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-        ('FONTNAME', (0,0), (-1,-1), 'DejaVuSans'),
-        ('GRID', (0,0), (-1,-1), 1, colors.grey),
-    ]))
-    table_height = table.wrapOn(c, width - 144, height)[1]
-    table.drawOn(c, 72, height - 100 - table_height)
-    
-    y_pos = height - 110 - table_height - 20
-    c.setFont('DejaVuSans', 10)
-    c.drawRightString(width - 72, y_pos, f"Сумма: {subtotal:.2f}")
-    if order.discount_percent > 0:
-        y_pos -= 15
-        c.drawRightString(width - 72, y_pos, f"Скидка ({order.discount_percent:.1f}%): -{discount_amount:.2f}")
-    
-    c.setFont('DejaVuSans', 12)
-    c.drawRightString(width - 72, y_pos - 20, f"Итого к оплате: {final_total:.2f}") # Скорректировали отступ
-    c.save()
-
-    # --- Генерация Excel ---
-    wb = Workbook()
-    ws = wb.active
-    ws.title = f"Накладная {order.order_number}"
-    ws.append(["Расходная накладная №", order.order_number])
-    ws.append(["Дата:", order.created_at.strftime('%d.%m.%Y %H:%M')])
-    ws.append(["Клиент:", order.customer_name, "Телефон:", order.customer_phone])
-    ws.append([])
-    headers_row = ["№", "Артикул", "Наименование", "Кол-во", "Цена за ед.", "Сумма"]
-    ws.append(headers_row)
-    start_table_row = ws.max_row
-    for i, item in enumerate(order.items):
-        product = db.query(models.Product).filter(models.Product.id == item.product_id).first()
-        item_sum = item.quantity * item.price_per_item
-        product_name = product.name if product else "Товар не найден"
-        if item.comment:
-            product_name += f"\n(Комментарий: {item.comment})"
-        ws.append([ i + 1, product.sku if product else "N/A", product_name, item.quantity, item.price_per_item, item_sum ])
-    ws.append([])
-    ws.append(["", "", "", "", "Сумма:", subtotal])
-    if order.discount_percent > 0:
-        ws.append(["", "", "", "", f"Скидка ({order.discount_percent}%):", f"-{discount_amount}"])
-    ws.append(["", "", "", "", "Итого к оплате:", final_total])
-    thin_border_side = Side(border_style="thin", color="000000")
-    full_border = Border(top=thin_border_side, left=thin_border_side, right=thin_border_side, bottom=thin_border_side)
-    for row in ws.iter_rows(min_row=start_table_row, max_row=ws.max_row, min_col=1, max_col=len(headers_row)):
-        for cell in row:
-            cell.border = full_border
-            if cell.column == 3: cell.alignment = Alignment(wrap_text=True, vertical='top')
-            elif cell.column > 3: cell.alignment = Alignment(horizontal='right', vertical='center')
-    wb.save(str(xlsx_path))
-
-    # --- ИЗМЕНЕНИЕ: Возвращаем ВЕБ-ПУТЬ ---
-    pdf_url_path = f"/invoices/{date_str}/{file_base_name}.pdf"
-    xlsx_url_path = f"/invoices/{date_str}/{file_base_name}.xlsx"
-    
-    return pdf_url_path, xlsx_url_path
+# --- Фоновое формирование накладных ---
+# PDF/Excel рисуются в отдельных процессах, чтобы не держать запрос, сессию БД и поток воркера.
+# Используем "spawn": форк процесса с открытыми соединениями к БД и потоками небезопасен.
+INVOICE_WORKERS = int(os.getenv("INVOICE_WORKERS", "2"))
+# Сколько секунд эндпоинт скачивания ждёт готовности накладной, прежде чем ответить 202
+INVOICE_WAIT_SECONDS = float(os.getenv("INVOICE_WAIT_SECONDS", "10"))
+# Сколько секунд накладную, переставленную в очередь при старте одним воркером, не трогают остальные.
+# Должно покрывать разброс старта воркеров одного запуска; после настоящего перезапуска позже - переставится снова
+INVOICE_REQUEUE_CLAIM_SECONDS = float(os.getenv("INVOICE_REQUEUE_CLAIM_SECONDS", "60"))
+
+_invoice_executor = None
+_invoice_executor_lock = threading.Lock()
+
+
+def get_invoice_executor() -> ProcessPoolExecutor:
+    global _invoice_executor
+    with _invoice_executor_lock:
+        if _invoice_executor is None:
+            _invoice_executor = ProcessPoolExecutor(
+                max_workers=INVOICE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _invoice_executor
+
+
+def shutdown_invoice_executor():
+    global _invoice_executor
+    with _invoice_executor_lock:
+        if _invoice_executor is not None:
+            _invoice_executor.shutdown(wait=True)
+            _invoice_executor = None
+
+
+def stale_invoice_formats(order: models.Order) -> dict:
+    """
+    Форматы накладной, которые нужно нарисовать заново: {формат: хэш нового содержимого}.
+    Формат не устарел, если хэш печатаемого содержимого не изменился и файл на месте.
+    """
+    hashes = invoice_content_hashes(build_invoice_data(order))
+    stale = {}
+    for file_format, content_hash in hashes.items():
+        path = getattr(order, f"invoice_path_{file_format}")
+        if getattr(order, f"invoice_hash_{file_format}") != content_hash or not path or not invoice_file_path(path).exists():
+            stale[file_format] = content_hash
+    return stale
+
+
+def schedule_invoice_generation(order: models.Order):
+    """
+    Ставит формирование устаревших форматов накладной заказа в очередь процессов.
+    Заказ должен быть уже сохранён (commit) и иметь invoice_status = pending;
+    когда файлы будут готовы, пути к ним, хэши и статус запишутся отдельной сессией.
+    """
+    data = build_invoice_data(order)
+    formats = stale_invoice_formats(order)
+    if not formats:
+        # Печатаемое содержимое не изменилось - файлы актуальны
+        _save_invoice_result(order.id, {}, None)
+        return
+    try:
+        future = get_invoice_executor().submit(render_invoice_files, data, formats)
+    except Exception as e:
+        logger.exception("Не удалось поставить накладную заказа %s в очередь", order.id)
+        _save_invoice_result(order.id, None, e)
+        return
+    future.add_done_callback(partial(_on_invoice_rendered, order.id, formats))
+
+
+def _on_invoice_rendered(order_id: int, formats: dict, future):
+    try:
+        web_paths, error = future.result(), None
+    except Exception as e:
+        web_paths, error = None, e
+    rendered = {file_format: (web_paths[file_format], formats[file_format]) for file_format in web_paths or {}}
+    _save_invoice_result(order_id, rendered, error)
+
+
+def _remove_invoice_files(web_paths):
+    for web_path in web_paths:
+        try:
+            os.remove(invoice_file_path(web_path))
+        except OSError:
+            pass
+
+
+def _save_invoice_result(order_id: int, rendered, error):
+    """
+    Записывает результат рендера: rendered = {формат: (веб-путь, хэш содержимого)}.
+    Если пока файл рисовался заказ снова изменился, результат не сохраняется - следующий рендер уже в очереди.
+    Файлы прошлых версий удаляются после commit.
+    """
+    if error is not None:
+        logger.error("Ошибка формирования накладной заказа %s: %s", order_id, error)
+    files_to_remove = []
+    db = SessionLocal()
+    try:
+        order = with_order_details(db.query(models.Order)).filter(models.Order.id == order_id).first()
+        if not order:
+            _remove_invoice_files(path for path, _ in (rendered or {}).values())
+            return
+        if error is not None:
+            order.invoice_status = INVOICE_FAILED
+        else:
+            current_hashes = invoice_content_hashes(build_invoice_data(order))
+            for file_format, (web_path, content_hash) in rendered.items():
+                old_path = getattr(order, f"invoice_path_{file_format}")
+                if current_hashes[file_format] != content_hash:
+                    files_to_remove.append(web_path)  # устарел, пока рисовался
+                    continue
+                if old_path and old_path != web_path:
+                    files_to_remove.append(old_path)
+                setattr(order, f"invoice_path_{file_format}", web_path)
+                setattr(order, f"invoice_hash_{file_format}", content_hash)
+            if all(getattr(order, f"invoice_hash_{file_format}") == content_hash for file_format, content_hash in current_hashes.items()):
+                order.invoice_status = INVOICE_READY
+        db.commit()
+    finally:
+        db.close()
+    _remove_invoice_files(files_to_remove)
+
+
+def claim_pending_invoices(db: Session) -> list:
+    """
+    Забирает заказы с накладной в статусе pending, которые ещё никто не переставил в очередь
+    за последние INVOICE_REQUEUE_CLAIM_SECONDS секунд, одним UPDATE ... RETURNING. Возвращает их id.
+    Воркеры стартуют одновременно и вызывают это параллельно: строку получит только один из них -
+    в PostgreSQL второй UPDATE дождётся блокировки строки и перепроверит условие, в SQLite записи идут по очереди.
+    """
+    now = datetime.now(timezone.utc)
+    orders = models.Order.__table__
+    claimed = db.execute(
+        update(orders)
+        .where(
+            orders.c.invoice_status == INVOICE_PENDING,
+            or_(
+                orders.c.invoice_requeued_at.is_(None),
+                orders.c.invoice_requeued_at < now - timedelta(seconds=INVOICE_REQUEUE_CLAIM_SECONDS),
+            ),
+        )
+        .values(invoice_requeued_at=now)
+        .returning(orders.c.id)
+    ).scalars().all()
+    db.commit()
+    return claimed
+
+
+def requeue_pending_invoices():
+    """
+    При старте приложения заново ставит в очередь накладные, которые не успели сформироваться до перезапуска.
+    Каждый заказ переставляет только один воркер (см. claim_pending_invoices).
+    """
+    db = SessionLocal()
+    try:
+        order_ids = claim_pending_invoices(db)
+        if not order_ids:
+            return
+        pending_orders = with_order_details(db.query(models.Order)).filter(models.Order.id.in_(order_ids)).all()
+        for order in pending_orders:
+            schedule_invoice_generation(order)
+    finally:
+        db.close()
+
+
+ORDERS_DEFAULT_PAGE_SIZE = 50
+ORDERS_MAX_PAGE_SIZE = 500
+
+
+def with_order_details(query):
+    """
+    Подгружает позиции и их товары заранее двумя запросами SELECT ... IN (selectinload),
+    чтобы сериализация списка заказов не делала отдельный запрос на каждую позицию.
+    """
+    return query.options(selectinload(models.Order.items).selectinload(models.OrderItem.product))
+
+
+def filter_by_date_range(query, column, date_from: Optional[date], date_to: Optional[date]):
+    """Фильтр по диапазону дат [date_from, date_to] включительно. Сравнение по диапазону, а не func.date(), работает по индексу."""
+    if date_from:
+        query = query.filter(column >= datetime.combine(date_from, time.min))
+    if date_to:
+        query = query.filter(column < datetime.combine(date_to + timedelta(days=1), time.min))
+    return query
+
+
+def allocate_order_number(db: Session) -> str:
+    """
+    Выдаёт следующий номер заказа текущего месяца (YYYY-MM-NNNNN) одним UPDATE ... RETURNING.
+    Строка счётчика блокируется до конца транзакции заказа, поэтому параллельные оформления
+    (в том числе в разных воркерах) номер не повторят. Если транзакция откатится, номер
+    вернётся в счётчик; пропуски в нумерации допустимы.
+    """
+    period = datetime.now().strftime('%Y-%m')
+    counters = models.OrderNumberCounter.__table__
+    value = db.execute(
+        update(counters)
+        .where(counters.c.period == period)
+        .values(last_value=counters.c.last_value + 1)
+        .returning(counters.c.last_value)
+    ).scalar()
+
+    if value is None:
+        # Первый заказ месяца (или первый запуск со счётчиками): продолжаем после уже выданных номеров.
+        # ON CONFLICT - на случай, если строку месяца одновременно создаёт другой запрос.
+        issued = db.query(
+            func.max(cast(func.substr(models.Order.order_number, len(period) + 2), Integer))
+        ).filter(models.Order.order_number.like(f"{period}-%")).scalar() or 0
+        statement = upsert_insert(db.get_bind())(counters).values(period=period, last_value=issued + 1)
+        value = db.execute(
+            statement.on_conflict_do_update(
+                index_elements=[counters.c.period],
+                set_={"last_value": counters.c.last_value + 1},
+            ).returning(counters.c.last_value)
+        ).scalar()
+
+    return f"{period}-{value:05d}"
+
+
+def load_order_for_response(db: Session, order_id: int) -> models.Order:
+    """Загружает заказ вместе с позициями и товарами фиксированным числом запросов (без N+1 при сериализации)."""
+    return with_order_details(db.query(models.Order)).filter(models.Order.id == order_id).one()
 
 
 @router.post("/", response_model=schemas.Order)
 def create_order(order_data: schemas.OrderCreate, db: Session = Depends(get_db)):
+    """
+    Создаёт заказ одной транзакцией и постоянным числом запросов к БД,
+    независимо от количества позиций.
+    """
+    order_id = place_order(db, order_data)
+    db.commit()
+
+    new_order = load_order_for_response(db, order_id)
+    schedule_invoice_generation(new_order)
     
-    # --- ИЗМЕНЕНИЕ НАЧАЛО ---
+    return new_order
+
+
+def place_order(db: Session, order_data: schemas.OrderCreate) -> int:
+    """
+    Проверяет остатки и записывает заказ с позициями и резервом (без commit).
+    Общая часть POST /orders/ (синхронного и асинхронного). Возвращает id заказа.
+    """
     # 1. Сразу получаем настройку игнорирования остатков
-    ignore_stock_setting = db.query(models.AppSettings).filter(models.AppSettings.key == "ignore_stock_limits").first()
-    ignore_stock = ignore_stock_setting.value == "true" if ignore_stock_setting else False
+    ignore_stock = get_setting_bool(db, "ignore_stock_limits", False)
+
+    # 2. Суммарное количество по каждому товару (один товар может прийти несколькими строками)
+    requested_quantities = {}
+    for item_data in order_data.items:
+        requested_quantities[item_data.product_id] = requested_quantities.get(item_data.product_id, 0) + item_data.quantity
 
-    # 2. Сначала проверяем все товары в корзине, ПЕРЕД созданием заказа
+    # 3. Все товары корзины одним запросом. Строки блокируются до конца транзакции (FOR UPDATE),
+    # чтобы остаток не изменился между проверкой и сохранением заказа; порядок по id исключает взаимоблокировки.
+    products = db.query(models.Product).filter(
+        models.Product.id.in_(requested_quantities)
+    ).order_by(models.Product.id).with_for_update().all()
+    products_by_id = {product.id: product for product in products}
+
+    # 4. Проверяем все товары в памяти, ПЕРЕД созданием заказа
     for item_data in order_data.items:
-        product = db.query(models.Product).filter(models.Product.id == item_data.product_id).first()
-        if not product:
+        if item_data.product_id not in products_by_id:
             # Если хоть один товар не найден, заказ не создаем
             raise HTTPException(status_code=404, detail=f"Товар с ID {item_data.product_id} не найден.")
-        
-        # 3. Выполняем проверку остатков, если настройка выключена
-        if not ignore_stock and product.stock < item_data.quantity:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Недостаточно товара '{product.name}' на складе. Доступно: {product.stock}, в заказе: {item_data.quantity}."
-            )
-    # --- ИЗМЕНЕНИЕ КОНЕЦ ---
 
-    # Если все проверки пройдены, создаем заказ как обычно
+    if not ignore_stock:
+        for product_id, quantity in requested_quantities.items():
+            product = products_by_id[product_id]
+            if product.stock < quantity:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Недостаточно товара '{product.name}' на складе. Доступно: {product.stock}, в заказе: {quantity}."
+                )
+
+    # 5. Создаём заказ сразу с номером (счётчик месяца, см. allocate_order_number).
+    # flush() выполняет INSERT и возвращает id без отдельного коммита
     new_order = models.Order(
+        order_number=allocate_order_number(db),
         customer_name=order_data.customer_name,
         customer_phone=order_data.customer_phone,
         customer_comment=order_data.customer_comment,
-        private_key=secrets.token_urlsafe(16)
+        private_key=secrets.token_urlsafe(16),
+        # Накладная формируется в фоне: заказ сразу уходит клиенту со статусом накладной "pending"
+        invoice_status=INVOICE_PENDING
     )
     db.add(new_order)
-    db.commit()
-    db.refresh(new_order)
+    db.flush()
 
-    new_order.order_number = f"{datetime.now().strftime('%Y-%m')}-{new_order.id:05d}"
-    
-    for item_data in order_data.items:
-        product = db.query(models.Product).filter(models.Product.id == item_data.product_id).first()
-        # Повторная проверка на продукт здесь уже для безопасности, но основная логика выше
-        if not product:
-            db.rollback()
-            raise HTTPException(status_code=404, detail=f"Product with id {item_data.product_id} not found")
-        
-        order_item = models.OrderItem(
-            order_id=new_order.id, 
-            product_id=item_data.product_id, 
-            quantity=item_data.quantity, 
-            price_per_item=product.price, 
-            comment=item_data.comment
-        )
-        db.add(order_item)
-    
-    db.commit()
-    db.refresh(new_order)
-    
-    pdf_path, xlsx_path = generate_invoice_files(new_order, db)
-    new_order.invoice_path_pdf = pdf_path
-    new_order.invoice_path_xlsx = xlsx_path
-    db.commit()
-    db.refresh(new_order)
-    
-    return new_order
+    # 6. Все позиции - одним пакетным INSERT, цена фиксируется по текущей цене товара
+    db.execute(insert(models.OrderItem), [
+        {
+            "order_id": new_order.id,
+            "product_id": item_data.product_id,
+            "quantity": item_data.quantity,
+            "price_per_item": products_by_id[item_data.product_id].price,
+            "comment": item_data.comment,
+        }
+        for item_data in order_data.items
+    ])
+    # Новый заказ резервирует товар (для страницы ревизии, см. app/inventory.py)
+    apply_reserved_change(db, {}, {
+        (product_id, RESERVED_STATUS_COLUMNS["new"]): quantity for product_id, quantity in requested_quantities.items()
+    })
+    return new_order.id
 
 
 @router.get("/", response_model=List[schemas.Order])
-def get_orders(db: Session = Depends(get_db)):
-    orders = db.query(models.Order).order_by(models.Order.id.desc()).all()
-    return orders
\ No newline at end of file
+def get_orders(
+    response: Response,
+    db: Session = Depends(get_db),
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    limit: int = Query(ORDERS_DEFAULT_PAGE_SIZE, ge=1, le=ORDERS_MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0)
+):
+    """
+    Возвращает страницу заказов (новые сверху) с фильтром по дате создания.
+    Общее количество заказов под фильтром - в заголовке X-Total-Count.
+    """
+    query = filter_by_date_range(db.query(models.Order), models.Order.created_at, date_from, date_to)
+    response.headers["X-Total-Count"] = str(query.count())
+
+    orders = with_order_details(query).order_by(models.Order.id.desc()).offset(offset).limit(limit).all()
+    return orders
+
+
+def _get_invoice_state(order_id: int):
+    db = SessionLocal()
+    try:
+        return db.query(
+            models.Order.invoice_status,
+            models.Order.invoice_path_pdf,
+            models.Order.invoice_path_xlsx
+        ).filter(models.Order.id == order_id).first()
+    finally:
+        db.close()
+
+
+@router.get("/{order_id}/invoice/{file_format}")
+async def get_order_invoice(order_id: int, file_format: str):
+    """
+    Отдаёт накладную заказа (file_format: pdf или xlsx).
+    Если файл ещё формируется - ждёт до INVOICE_WAIT_SECONDS и перенаправляет на готовый файл,
+    иначе отвечает 202 с текущим статусом (клиент повторяет запрос через Retry-After секунд).
+    """
+    if file_format not in ("pdf", "xlsx"):
+        raise HTTPException(status_code=404, detail="Формат накладной должен быть pdf или xlsx")
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + INVOICE_WAIT_SECONDS
+    while True:
+        state = await run_in_threadpool(_get_invoice_state, order_id)
+        if state is None:
+            raise HTTPException(status_code=404, detail="Заказ не найден")
+
+        invoice_status, pdf_path, xlsx_path = state
+        path = pdf_path if file_format == "pdf" else xlsx_path
+        # Для старых заказов (до появления статуса) достаточно наличия пути к файлу
+        if invoice_status in (INVOICE_READY, None) and path:
+            return RedirectResponse(url=path, status_code=status.HTTP_303_SEE_OTHER)
+        if invoice_status == INVOICE_FAILED:
+            raise HTTPException(status_code=500, detail="Не удалось сформировать накладную")
+        if loop.time() >= deadline:
+            return JSONResponse(
+                status_code=status.HTTP_202_ACCEPTED,
+                content={"invoice_status": invoice_status},
+                headers={"Retry-After": "2"}
+            )
+        await asyncio.sleep(0.5)
@@ -1,52 +1,136 @@
 # D:\globus-market\backend\app\routers\products.py
 
-from fastapi import APIRouter, Depends, HTTPException, File, UploadFile
+from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Query, Request, Response
 from sqlalchemy.orm import Session
 from typing import List, Optional # <-- Добавили Optional
-from sqlalchemy import func, or_
-from pathlib import Path
-from PIL import Image
+from sqlalchemy import func, tuple_
+import base64
+import json
 
 from app import models, schemas
 from app.dependencies import get_db
+from app.cache import bump_catalog_version, get_setting_bool, get_catalog_state, get_settings_state
+from app.http_cache import ConditionalGet, make_etag, latest
+from app.serialization import serialize_list, json_response
+from app.search import apply_product_search
+from app.inventory import record_stock_movements, MOVEMENT_PRODUCT_CREATED
+from app.images import image_executor, process_product_image, remove_image_variants, IMAGE_SIZES
 
 router = APIRouter()
 
-BASE_DIR = Path(__file__).resolve().parent.parent.parent
-IMAGE_DIR = BASE_DIR / "static" / "images"
+# --- Варианты сортировки для постраничной выдачи (keyset по колонке + id) ---
+# Значение: (колонка, по убыванию?)
+PRODUCT_SORT_OPTIONS = {
+    "name": (models.Product.name, False),
+    "-name": (models.Product.name, True),
+    "updated_at": (models.Product.updated_at, False),
+    "-updated_at": (models.Product.updated_at, True),
+}
+RELEVANCE_SORT = "relevance"  # доступна только вместе с search
+DEFAULT_PAGE_SIZE = 48
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(values: list) -> str:
+    """Упаковывает значения ключа последней строки страницы в непрозрачную строку-курсор."""
+    # Даты сохраняем в виде str(): этот формат БД одинаково понимает и в PostgreSQL, и в SQLite
+    raw = json.dumps(values, default=str, ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+    except (ValueError, UnicodeError):
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+    if not isinstance(values, list) or len(values) != 2:
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+    return values
+
+
+def _is_int(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def apply_keyset(query, sort_column, descending: bool, cursor: Optional[str]):
+    """
+    Добавляет к запросу стабильную сортировку (колонка, id) и,
+    если передан курсор, условие "после последней строки предыдущей страницы".
+    """
+    if cursor:
+        last_value, last_id = decode_cursor(cursor)
+        # Курсор приходит от клиента: id - целое, значение колонки сортировки - строка
+        # (так encode_cursor пишет и название, и дату) или null. Иное в SQL не пускаем
+        if not _is_int(last_id) or not (last_value is None or isinstance(last_value, str)):
+            raise HTTPException(status_code=400, detail="Некорректный курсор")
+        key = tuple_(sort_column, models.Product.id)
+        query = query.filter(key < (last_value, last_id) if descending else key > (last_value, last_id))
+
+    if descending:
+        return query.order_by(sort_column.desc(), models.Product.id.desc())
+    return query.order_by(sort_column.asc(), models.Product.id.asc())
+
 
 # --- Эндпоинт для получения товаров (ОБНОВЛЁН) ---
 @router.get("/", response_model=List[schemas.Product])
 def get_products(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db), 
     search: Optional[str] = None, 
     subcategory_id: Optional[int] = None,
-    category_id: Optional[int] = None
+    category_id: Optional[int] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    sort: Optional[str] = None
 ):
     """
-    Получает список товаров.
-    Поддерживает поиск по названию/артикулу (с учетом регистра) и фильтрацию.
+    Получает страницу товаров.
+    Поддерживает поиск по названию/артикулу (без учета регистра) и фильтрацию.
+    Пагинация курсорная: следующую страницу запрашиваем с cursor из заголовка X-Next-Cursor,
+    общее количество найденных товаров - в заголовке X-Total-Count.
+    При поиске без явного sort товары идут по релевантности.
+    Поддерживает условный GET: ETag зависит от версии каталога, настроек и параметров запроса.
     """
-    show_stock_setting = db.query(models.AppSettings).filter(models.AppSettings.key == "show_stock_publicly").first()
-    show_stock = show_stock_setting.value == "true" if show_stock_setting else True
+    return list_products(db, request, response, search, subcategory_id, category_id, limit, cursor, sort)
+
+
+def list_products(db: Session, request: Request, response: Response, search: Optional[str], subcategory_id: Optional[int],
+                  category_id: Optional[int], limit: int, cursor: Optional[str], sort: Optional[str]):
+    """
+    Страница товаров для GET /products/ (синхронного и асинхронного, см. app/routers/async_public.py).
+    Возвращает готовый ответ (или 304).
+    """
+    if sort is None:
+        sort = RELEVANCE_SORT if search else "name"
+    if sort != RELEVANCE_SORT and sort not in PRODUCT_SORT_OPTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Неизвестная сортировка '{sort}'. Допустимые значения: {', '.join(PRODUCT_SORT_OPTIONS)}, {RELEVANCE_SORT}"
+        )
+
+    # Ответ меняется только вместе с каталогом или настройками (показ остатков) - проверяем до выборки
+    catalog_version, catalog_modified = get_catalog_state(db)
+    settings_version, settings_modified = get_settings_state(db)
+    conditional = ConditionalGet(
+        make_etag("products", catalog_version, settings_version, sorted(request.query_params.multi_items())),
+        latest(catalog_modified, settings_modified),
+    )
+    if conditional.is_fresh(request):
+        return conditional.not_modified()
+    conditional.apply(response)
+
+    show_stock = get_setting_bool(db, "show_stock_publicly", True)
 
     query = db.query(models.Product)
     
     # Показываем только видимые товары
     query = query.filter(models.Product.is_visible == True)
     
-    # --- НАЧАЛО УПРОЩЕННОЙ ЛОГИКИ ПОИСКА ---
+    # Поиск: регистронезависимый, с быстрыми путями для артикула (см. app/search.py)
+    search_order = []
     if search:
-        # Убираем все преобразования в нижний регистр.
-        # Поиск будет прямым и чувствительным к регистру.
-        search_pattern = f"%{search}%"
-        query = query.filter(
-            or_(
-                models.Product.name.like(search_pattern),
-                models.Product.sku.like(search_pattern)
-            )
-        )
-    # --- КОНЕЦ УПРОЩЕННОЙ ЛОГИКИ ПОИСКА ---
+        query, search_order = apply_product_search(query, db, search)
         
     if subcategory_id:
         query = query.filter(models.Product.subcategory_id == subcategory_id)
@@ -56,14 +140,40 @@ def get_products(
         subcategory_ids = [id[0] for id in subcategory_ids]
         if subcategory_ids:
             query = query.filter(models.Product.subcategory_id.in_(subcategory_ids))
-        
-    products = query.all()
 
+    # Общее количество считаем до применения курсора, чтобы оно не менялось от страницы к странице
+    response.headers["X-Total-Count"] = str(query.order_by(None).count())
+
+    if sort == RELEVANCE_SORT:
+        # Порядок по релевантности вычисляемый, поэтому здесь курсор хранит смещение.
+        # Результаты поиска невелики, так что OFFSET тут дешёвый.
+        offset = 0
+        if cursor:
+            marker, offset = decode_cursor(cursor)
+            if marker != RELEVANCE_SORT or not _is_int(offset) or offset < 0:
+                raise HTTPException(status_code=400, detail="Некорректный курсор")
+        query = query.order_by(*(search_order or [models.Product.name, models.Product.id])).offset(offset)
+    else:
+        sort_column, descending = PRODUCT_SORT_OPTIONS[sort]
+        query = apply_keyset(query, sort_column, descending, cursor)
+
+    # Берём на одну строку больше, чтобы понять, есть ли следующая страница
+    products = query.limit(limit + 1).all()
+    if len(products) > limit:
+        products = products[:limit]
+        last = products[-1]
+        if sort == RELEVANCE_SORT:
+            response.headers["X-Next-Cursor"] = encode_cursor([RELEVANCE_SORT, offset + limit])
+        else:
+            response.headers["X-Next-Cursor"] = encode_cursor([getattr(last, sort_column.key), last.id])
+
+    # Большие страницы - без построения объектов Pydantic (см. app/serialization.py)
+    items = serialize_list(products, schemas.Product)
     if not show_stock:
-        for product in products:
-            product.stock = None
-            
-    return products
+        for item in items:
+            item["stock"] = None
+
+    return json_response(items, response)
 
 # --- Остальные эндпоинты без изменений ---
 
@@ -75,33 +185,46 @@ def create_product(product: schemas.ProductCreate, db: Session = Depends(get_db)
     
     new_product = models.Product(**product.dict())
     db.add(new_product)
+    db.flush()
+    record_stock_movements(db, [{
+        "product_id": new_product.id, "delta": new_product.stock or 0,
+        "stock_after": new_product.stock, "reason": MOVEMENT_PRODUCT_CREATED,
+    }])
+    bump_catalog_version(db)
     db.commit()
     db.refresh(new_product)
     return new_product
 
 @router.post("/{id}/image", response_model=schemas.Product)
-async def upload_product_image(id: int, db: Session = Depends(get_db), file: UploadFile = File(...)):
+def upload_product_image(id: int, db: Session = Depends(get_db), file: UploadFile = File(...)):
+    """
+    Загружает фото товара и сохраняет его в нескольких размерах (IMAGE_SIZES).
+    Обычная (не async) функция: FastAPI выполнит её в пуле потоков и не заблокирует event loop,
+    а сама обработка изображения идёт в отдельном ограниченном пуле (app/images.py).
+    """
     product = db.query(models.Product).filter(models.Product.id == id).first()
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
-    filename = f"{product.sku}.webp"
-    file_path = IMAGE_DIR / filename
-    
+    data = file.file.read()
     try:
-        image = Image.open(file.file)
-        image.thumbnail((800, 800))
-        image.save(file_path, 'webp')
+        variants = image_executor.submit(process_product_image, data, product.sku).result()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to process and save image: {e}")
 
-    url_path = f"/static/images/{filename}"
-    product.image_url = url_path
+    old_variants = product.image_variants
+    # image_url оставляем на самом большом варианте - его используют админка и старые клиенты
+    product.image_url = variants[str(max(IMAGE_SIZES))]
+    product.image_variants = variants
     
     # --- КЛЮЧЕВОЕ ИСПРАВЛЕНИЕ: Явно обновляем время изменения товара ---
     product.updated_at = func.now()
     
+    bump_catalog_version(db)
     db.commit()
     db.refresh(product)
+    remove_image_variants(old_variants, keep=variants)
     
-    return product
\ No newline at end of file
+    return product
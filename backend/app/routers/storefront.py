@@ -0,0 +1,68 @@
+# D:\globus-market\backend\app\routers\storefront.py
+#
+# Всё, что нужно витрине при первой загрузке, одним ответом: публичные настройки,
+# дерево категорий с количеством товаров и первая страница товаров.
+# Ответ строится один раз на версию каталога и настроек (см. app/cache.py) и хранится
+# в памяти уже сериализованным, поэтому обычный запрос не обращается к БД.
+
+import hashlib
+import json
+
+from fastapi import APIRouter, Depends, Request, Response
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.orm import Session
+
+from app import models, schemas
+from app.cache import get_catalog_cached, get_catalog_state, get_settings_state, get_setting_bool, public_settings
+from app.dependencies import get_db
+from app.http_cache import ConditionalGet, latest
+from app.routers.categories import build_category_tree
+from app.routers.products import apply_keyset, encode_cursor, DEFAULT_PAGE_SIZE
+
+router = APIRouter()
+
+
+def build_first_products_page(db: Session, show_stock: bool) -> dict:
+    """Первая страница видимых товаров в порядке по умолчанию (по названию), как отдаёт GET /products/."""
+    query = db.query(models.Product).filter(models.Product.is_visible == True)
+    total = query.count()
+    products = apply_keyset(query, models.Product.name, False, None).limit(DEFAULT_PAGE_SIZE + 1).all()
+
+    next_cursor = None
+    if len(products) > DEFAULT_PAGE_SIZE:
+        products = products[:DEFAULT_PAGE_SIZE]
+        next_cursor = encode_cursor([products[-1].name, products[-1].id])
+
+    items = [schemas.Product.from_orm(product).dict() for product in products]
+    if not show_stock:
+        for item in items:
+            item["stock"] = None
+    return {"items": items, "next_cursor": next_cursor, "total": total}
+
+
+def build_snapshot(db: Session):
+    """Собирает снимок витрины и сериализует его. Возвращает (тело ответа, ETag)."""
+    payload = {
+        "settings": public_settings(db),
+        "categories": build_category_tree(db),
+        "products": build_first_products_page(db, get_setting_bool(db, "show_stock_publicly", True)),
+    }
+    body = json.dumps(jsonable_encoder(payload), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    etag = f'W/"{hashlib.sha256(body).hexdigest()[:32]}"'
+    return body, etag
+
+
+@router.get("/snapshot")
+def get_storefront_snapshot(request: Request, db: Session = Depends(get_db)):
+    """
+    Снимок витрины: {"settings": {...}, "categories": [...], "products": {"items", "next_cursor", "total"}}.
+    С If-None-Match / If-Modified-Since отвечает 304, если снимок не изменился.
+    """
+    # Снимок зависит и от каталога, и от настроек (контакты, показ остатков)
+    settings_version, settings_modified = get_settings_state(db)
+    body, etag = get_catalog_cached(db, f"storefront_snapshot:{settings_version}", lambda: build_snapshot(db))
+
+    conditional = ConditionalGet(etag, latest(get_catalog_state(db)[1], settings_modified))
+    if conditional.is_fresh(request):
+        return conditional.not_modified()
+    return Response(content=body, media_type="application/json", headers=conditional.headers)
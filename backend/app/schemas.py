@@ -1,7 +1,7 @@
 # D:\globus-market\backend\app\schemas.py
 
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 
 # --- Схемы для Пользователей ---
@@ -33,6 +33,7 @@ class ProductCreate(ProductBase):
 class Product(ProductBase):
     id: int
     image_url: Optional[str] = None
+    image_variants: Optional[Dict[str, str]] = None
     subcategory_id: int 
     updated_at: Optional[datetime] = None
     is_visible: bool    
@@ -118,6 +119,7 @@ class Order(BaseModel):
     customer_comment: Optional[str] = None    
     invoice_path_pdf: Optional[str] = None
     invoice_path_xlsx: Optional[str] = None
+    invoice_status: Optional[str] = None
     private_key: str
     class Config:
         orm_mode = True
@@ -127,12 +129,27 @@ class Order(BaseModel):
 class StockUpdate(BaseModel):
     product_id: int
     new_stock: int
+    # updated_at товара на момент загрузки списка ревизии. Если товар с тех пор изменился - остаток не перезаписываем.
+    expected_updated_at: Optional[datetime] = None
 
 class InventoryUpdate(BaseModel):
     updates: List[StockUpdate]
     
 
 # --- НОВЫЕ СХЕМЫ для ответа от эндпоинта Ревизии ---
+class StockConflict(BaseModel):
+    product_id: int
+    sku: str
+    current_stock: int
+    updated_at: Optional[datetime] = None
+
+
+class InventoryUpdateResult(BaseModel):
+    message: str
+    updated: int
+    conflicts: List[StockConflict] = []
+
+
 class ReservedStock(BaseModel):
     new: int = 0
     processed: int = 0
@@ -144,6 +161,7 @@ class RevisionProduct(BaseModel):
     name: str
     price: float
     db_stock: int
+    updated_at: Optional[datetime] = None
     reserved: ReservedStock
 
     class Config:
@@ -158,6 +176,10 @@ class AppSetting(BaseModel):
 
 class AppSettingUpdate(BaseModel):
     value: str
+
+
+class UserAdminUpdate(BaseModel):
+    is_admin: bool
     
     
 # --- НОВЫЕ СХЕМЫ для частичного возврата ---
@@ -183,4 +205,17 @@ class ProductUpdate(BaseModel):
     is_visible: Optional[bool] = None 
 
 class ProductBulkUpdate(BaseModel):
-    updates: List[ProductUpdate]
\ No newline at end of file
+    updates: List[ProductUpdate]
+
+class ProductImportError(BaseModel):
+    row: int
+    sku: Optional[str] = None
+    error: str
+
+
+class ProductImportReport(BaseModel):
+    total_rows: int
+    created: int
+    updated: int
+    errors_total: int
+    errors: List[ProductImportError]
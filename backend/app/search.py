@@ -0,0 +1,112 @@
+# D:\globus-market\backend\app\search.py
+
+import logging
+import re
+
+from sqlalchemy import and_, case, func, or_, text
+from sqlalchemy.orm import Query, Session
+
+from app import models
+from app.models import normalize_search_text
+
+logger = logging.getLogger(__name__)
+
+# Похоже на артикул: одно "слово" из цифр/латиницы/дефисов с хотя бы одной цифрой (например, 01-0004)
+SKU_LIKE_PATTERN = re.compile(r"^[0-9A-Za-z][0-9A-Za-z.\-_/]*$")
+BACKFILL_BATCH_SIZE = 1000
+
+# Выставляется в ensure_search_schema(), если в PostgreSQL доступно расширение pg_trgm
+_trigram_available = False
+
+
+def escape_like(value: str) -> str:
+    """Экранирует спецсимволы LIKE, чтобы '%' и '_' в запросе искались буквально."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _looks_like_sku(term: str) -> bool:
+    return bool(SKU_LIKE_PATTERN.match(term)) and any(ch.isdigit() for ch in term)
+
+
+def apply_product_search(query: Query, db: Session, term: str):
+    """
+    Добавляет к запросу товаров условие поиска и возвращает (query, order_by) -
+    сортировку по релевантности для этого поиска.
+
+    1. Точное совпадение артикула - отдаём только этот товар (уникальный индекс).
+    2. Иначе - регистронезависимый поиск всех слов запроса в search_text
+       (в PostgreSQL ускоряется триграммным GIN-индексом) с ранжированием.
+       Запрос, похожий на артикул, дополнительно ищется как префикс артикула ("01-00",
+       индекс по sku с pattern_ops): такие товары идут первыми, а совпадения по названию
+       ("Бумага A4" для запроса "A4") остаются в выдаче следом за ними.
+    """
+    raw = term.strip()
+    folded = normalize_search_text(raw)
+    if not folded:
+        return query, []
+
+    if _looks_like_sku(raw):
+        exact_match = query.filter(models.Product.sku == raw)
+        if db.query(exact_match.exists()).scalar():
+            return exact_match, [models.Product.id]
+
+        sku_prefix = models.Product.sku.like(f"{escape_like(raw)}%", escape="\\")
+    else:
+        sku_prefix = None
+
+    words = folded.split()
+    condition = and_(*[
+        models.Product.search_text.like(f"%{escape_like(word)}%", escape="\\") for word in words
+    ])
+    query = query.filter(condition if sku_prefix is None else or_(sku_prefix, condition))
+
+    # Чем меньше "корзина", тем выше товар в выдаче
+    buckets = [
+        (models.Product.search_text.like(f"{escape_like(folded)}%", escape="\\"), 1),
+        (models.Product.search_text.like(f"% {escape_like(folded)}%", escape="\\"), 2),
+    ]
+    if sku_prefix is not None:
+        buckets.insert(0, (sku_prefix, 0))
+    rank = case(*buckets, else_=3)
+    order_by = [rank]
+    if _trigram_available:
+        # Внутри корзины - по триграммной похожести на весь запрос
+        order_by.append(func.similarity(models.Product.search_text, folded).desc())
+    order_by += [models.Product.name, models.Product.id]
+    return query, order_by
+
+
+def ensure_search_schema(engine):
+    """
+    Готовит БД к поиску при старте приложения (после add_missing_columns):
+    - заполняет products.search_text для старых товаров;
+    - в PostgreSQL включает pg_trgm и создаёт триграммный индекс и индекс для префикса артикула.
+    """
+    with engine.begin() as conn:
+        rows = conn.execute(text("SELECT id, name, sku FROM products WHERE search_text IS NULL")).all()
+        for start in range(0, len(rows), BACKFILL_BATCH_SIZE):
+            batch = rows[start:start + BACKFILL_BATCH_SIZE]
+            conn.execute(
+                text("UPDATE products SET search_text = :search_text WHERE id = :id"),
+                [{"id": row.id, "search_text": normalize_search_text(f"{row.name or ''} {row.sku or ''}")} for row in batch]
+            )
+
+    if engine.dialect.name != "postgresql":
+        return
+
+    global _trigram_available
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_products_search_text_trgm "
+                "ON products USING gin (search_text gin_trgm_ops)"
+            ))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_products_sku_pattern "
+                "ON products (sku varchar_pattern_ops)"
+            ))
+        _trigram_available = True
+    except Exception as e:
+        # Без расширения поиск продолжит работать, просто медленнее (последовательное сканирование)
+        logger.warning("Не удалось создать поисковые индексы: %s", e)
@@ -1,14 +1,63 @@
 # D:\globus-market\backend\app\security.py
 
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 from passlib.context import CryptContext
 
+# Стоимость bcrypt. Хэши с другим числом раундов пересчитываются при следующем успешном входе.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
 # Создаём объект для хэширования. Он будет использовать алгоритм bcrypt.
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+# --- Отдельный ограниченный пул для bcrypt ---
+# Проверка пароля занимает сотни миллисекунд CPU. Выполняем её в своём небольшом пуле,
+# чтобы всплеск входов (или перебор паролей) не занимал общий пул потоков FastAPI.
+# Если в пуле и очереди уже PASSWORD_HASH_MAX_PENDING задач - сразу отказываем (PasswordHasherBusy).
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "8"))
+
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_pending_slots = threading.BoundedSemaphore(PASSWORD_HASH_MAX_PENDING)
+
+
+class PasswordHasherBusy(Exception):
+    """Очередь проверки паролей переполнена."""
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Проверяет, соответствует ли обычный пароль хэшированному."""
     return pwd_context.verify(plain_password, hashed_password)
 
+def verify_and_update_password(plain_password: str, hashed_password: str):
+    """
+    Проверяет пароль и возвращает (верен ли пароль, новый хэш или None).
+    Новый хэш возвращается, если старый был посчитан с устаревшими параметрами (другим BCRYPT_ROUNDS).
+    """
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
 def get_password_hash(password: str) -> str:
     """Создаёт хэш из обычного пароля."""
-    return pwd_context.hash(password)
\ No newline at end of file
+    return pwd_context.hash(password)
+
+
+async def run_password_task(func, *args):
+    """Выполняет func(*args) в пуле bcrypt, не блокируя event loop. Бросает PasswordHasherBusy при перегрузке."""
+    if not _pending_slots.acquire(blocking=False):
+        raise PasswordHasherBusy()
+    try:
+        future = password_executor.submit(func, *args)
+    except BaseException:
+        _pending_slots.release()
+        raise
+    future.add_done_callback(lambda _: _pending_slots.release())
+    return await asyncio.wrap_future(future)
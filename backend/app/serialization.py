@@ -0,0 +1,53 @@
+# D:\globus-market\backend\app\serialization.py
+#
+# Быстрая сериализация больших списков (каталог, редактор товаров, список заказов).
+# Обычный путь FastAPI с response_model: объект Pydantic на каждую строку (с валидацией),
+# затем jsonable_encoder и json.dumps - на тысячах товаров это большая часть времени ответа.
+# Здесь строки ORM сразу превращаются в словари по полям той же схемы (без валидации - данные из своей БД),
+# а в JSON их переводит orjson (ORJSONResponse), который сам умеет datetime.
+# Состав и порядок полей берутся из схемы, поэтому ответ совпадает с обычным путём.
+
+from functools import lru_cache
+
+from fastapi import Response
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+from pydantic.fields import SHAPE_LIST
+
+
+@lru_cache(maxsize=None)
+def _field_plan(schema) -> tuple:
+    """Поля схемы: (имя, значение по умолчанию, допускает None?, вложенная схема или None, список?). Считается один раз."""
+    plan = []
+    for name, field in schema.__fields__.items():
+        nested = field.type_ if isinstance(field.type_, type) and issubclass(field.type_, BaseModel) else None
+        plan.append((name, field.default, field.allow_none, nested, field.shape == SHAPE_LIST))
+    return tuple(plan)
+
+
+def orm_to_dict(obj, schema) -> dict:
+    """Объект ORM -> словарь по полям схемы Pydantic (как schema.from_orm(obj).dict(), но без валидации)."""
+    result = {}
+    for name, default, allow_none, nested, is_list in _field_plan(schema):
+        value = getattr(obj, name, default)
+        if value is None:
+            # Колонки, добавленные позже (add_missing_columns), в старых строках пустые
+            value = None if allow_none else default
+        elif nested is not None:
+            value = [orm_to_dict(item, nested) for item in value] if is_list else orm_to_dict(value, nested)
+        result[name] = value
+    return result
+
+
+def serialize_list(rows, schema) -> list:
+    """Список объектов ORM -> список словарей по схеме (для ORJSONResponse)."""
+    return [orm_to_dict(row, schema) for row in rows]
+
+
+def json_response(content, response: Response = None) -> ORJSONResponse:
+    """
+    Ответ orjson в обход response_model.
+    response - объект Response эндпоинта: заголовки, выставленные в него (X-Total-Count, ETag...), переносятся в ответ.
+    """
+    headers = dict(response.headers) if response is not None else None
+    return ORJSONResponse(content=content, headers=headers)
@@ -0,0 +1,154 @@
+# D:\globus-market\backend\app\static_files.py
+#
+# Раздача статики с правильным кэшированием:
+# - сильный ETag по содержимому файла (304 Not Modified на повторный запрос);
+# - Cache-Control: immutable на год для файлов с хэшем в имени (фото товаров) и ссылок с ?v=...;
+# - остальное - "no-cache": браузер хранит файл, но каждый раз сверяет ETag;
+# - если рядом лежит заранее сжатый файл (.br / .gz, см. build_static.py) и клиент его принимает,
+#   отдаём его вместо исходного.
+
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+
+# Хэш содержимого в имени файла - только в тех местах, куда его ставят app/images.py и app/invoices.py:
+# фото "01-0004-1631b9616d91-400.webp" (артикул-хэш-размер), накладная "order_2024-01-00001-0123456789ab.pdf".
+# Старые фото вида "02-00001125.webp" хэша не содержат и сверяются по ETag.
+HASHED_NAME_PATTERN = re.compile(r"-[0-9a-f]{12}(?:-\d+\.webp|\.pdf|\.xlsx)$")
+
+# Заранее сжатые варианты в порядке предпочтения: (суффикс файла, Content-Encoding)
+PRECOMPRESSED_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+_etag_lock = threading.Lock()
+_etag_cache = {}  # путь -> (mtime_ns, размер, etag)
+
+
+def content_etag(full_path, stat_result: os.stat_result) -> str:
+    """Сильный ETag по содержимому файла. Хэш считается один раз, пока файл не изменится."""
+    key = str(full_path)
+    entry = _etag_cache.get(key)
+    if entry is not None and entry[0] == stat_result.st_mtime_ns and entry[1] == stat_result.st_size:
+        return entry[2]
+
+    digest = hashlib.sha256()
+    with open(full_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    etag = f'"{digest.hexdigest()[:32]}"'
+    with _etag_lock:
+        _etag_cache[key] = (stat_result.st_mtime_ns, stat_result.st_size, etag)
+    return etag
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    If-None-Match может содержать список ETag'ов и слабые (W/) варианты - сравниваем по каждому
+    (слабое сравнение, как положено для GET: W/"x" и "x" совпадают).
+    """
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag is not None and etag.removeprefix("W/") in candidates
+
+
+def accepted_encodings(request_headers: Headers) -> set:
+    """Кодировки из Accept-Encoding, кроме явно запрещённых (q=0)."""
+    accepted = set()
+    for part in request_headers.get("accept-encoding", "").split(","):
+        name, *params = [value.strip() for value in part.split(";")]
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name and quality > 0:
+            accepted.add(name.lower())
+    return accepted
+
+
+class CachedStaticFiles(StaticFiles):
+    """
+    StaticFiles с ETag по содержимому, заголовками Cache-Control и поддержкой .br/.gz.
+    cache_control - заголовок для файлов без хэша в имени и без ?v= (по умолчанию - всегда сверять ETag).
+    immutable_cache_control - заголовок для файлов с хэшем в имени или с ?v=.
+    """
+
+    def __init__(self, *args, cache_control: str = REVALIDATE_CACHE_CONTROL,
+                 immutable_cache_control: str = IMMUTABLE_CACHE_CONTROL, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_control = cache_control
+        self.immutable_cache_control = immutable_cache_control
+
+    def is_versioned(self, full_path, scope) -> bool:
+        if HASHED_NAME_PATTERN.search(os.path.basename(full_path)):
+            return True
+        query = scope.get("query_string", b"").decode("latin-1")
+        return any(param.startswith("v=") for param in query.split("&"))
+
+    def find_precompressed(self, full_path, stat_result: os.stat_result, request_headers: Headers):
+        """Возвращает (путь, stat, Content-Encoding) сжатого варианта файла или None."""
+        accepted = accepted_encodings(request_headers)
+        for encoding, suffix in PRECOMPRESSED_ENCODINGS:
+            if encoding not in accepted:
+                continue
+            try:
+                compressed_stat = os.stat(f"{full_path}{suffix}")
+            except OSError:
+                continue
+            # build_static.py ставит сжатой копии время изменения исходника. Если они разошлись,
+            # исходник правили без пересборки - копия устарела, отдаём исходный файл
+            if compressed_stat.st_mtime_ns != stat_result.st_mtime_ns:
+                continue
+            return f"{full_path}{suffix}", compressed_stat, encoding
+        return None
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        media_type = mimetypes.guess_type(str(full_path))[0] or "text/plain"
+        headers = {
+            "Cache-Control": self.immutable_cache_control if self.is_versioned(full_path, scope) else self.cache_control,
+        }
+
+        serve_path, serve_stat, encoding = full_path, stat_result, None
+        precompressed = self.find_precompressed(full_path, stat_result, request_headers)
+        if precompressed:
+            serve_path, serve_stat, encoding = precompressed
+            headers["Content-Encoding"] = encoding
+        if any(os.path.exists(f"{full_path}{suffix}") for _, suffix in PRECOMPRESSED_ENCODINGS):
+            # Ответ зависит от Accept-Encoding - об этом нужно сказать кэшам (CDN, прокси)
+            headers["Vary"] = "Accept-Encoding"
+
+        response = FileResponse(
+            serve_path,
+            status_code=status_code,
+            headers=headers,
+            media_type=media_type,
+            stat_result=serve_stat,
+            method=scope["method"],
+        )
+        # FileResponse ставит ETag по времени изменения и размеру - заменяем на ETag по содержимому.
+        # Для сжатого варианта ETag свой: это другой набор байт.
+        etag = content_etag(full_path, stat_result)
+        if encoding:
+            etag = f'{etag[:-1]}-{encoding}"'
+        response.headers["etag"] = etag
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+    def is_not_modified(self, response_headers: Headers, request_headers: Headers) -> bool:
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            return etag_matches(if_none_match, response_headers.get("etag"))
+        return super().is_not_modified(response_headers, request_headers)
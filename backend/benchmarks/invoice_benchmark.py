@@ -0,0 +1,106 @@
+# D:\globus-market\backend\benchmarks\invoice_benchmark.py
+#
+# Бенчмарк рендера накладных (app/invoices.py): время и пиковая память
+# для заказов из 1, 50 и 500 позиций, PDF и Excel по отдельности.
+# Для PDF замеряются два случая: "холодный" кэш фото (первая накладная после запуска процесса)
+# и "тёплый" (фото товаров уже уменьшены и лежат в кэше InvoiceRenderer).
+#
+# Запуск из папки backend:
+#   python -m benchmarks.invoice_benchmark
+#   BENCH_LINES=1,50,500,2000 BENCH_REPEATS=10 python -m benchmarks.invoice_benchmark
+#
+# БД не нужна: накладная рисуется по готовому словарю, как в процессе пула накладных.
+
+import io
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from PIL import Image
+
+from app.invoices import InvoiceRenderer
+
+LINES = [int(value) for value in os.getenv("BENCH_LINES", "1,50,500").split(",")]
+REPEATS = int(os.getenv("BENCH_REPEATS", "5"))
+# Сколько разных фото в "каталоге" - позиции заказа ссылаются на них случайно
+DISTINCT_IMAGES = int(os.getenv("BENCH_IMAGES", "50"))
+
+
+def make_images(folder: str) -> list:
+    """Фото как у товаров на витрине: WebP 800x800 (вариант, который раньше шёл в накладную)."""
+    paths = []
+    for index in range(DISTINCT_IMAGES):
+        image = Image.effect_noise((800, 800), 40 + index).convert("RGB")
+        path = os.path.join(folder, f"product-{index}-800.webp")
+        image.save(path, "WEBP", quality=80)
+        paths.append(path)
+    return paths
+
+
+def make_invoice_data(line_count: int, images: list) -> dict:
+    return {
+        "order_number": "2024-01-00001",
+        "created_at": datetime(2024, 1, 15, 12, 30),
+        "customer_name": "Тестовый клиент",
+        "customer_phone": "+7 700 000 00 00",
+        "discount_percent": 5.0,
+        "lines": [
+            {
+                "sku": f"00-{index:05d}",
+                "name": f"Товар номер {index} с достаточно длинным названием для переноса строки",
+                "image_path": random.choice(images),
+                "quantity": random.randint(1, 20),
+                "price_per_item": round(random.uniform(100, 5000), 2),
+                "comment": "Комментарий к позиции" if index % 5 == 0 else None,
+            }
+            for index in range(line_count)
+        ],
+    }
+
+
+def measure(render, data, before_each=None):
+    """Возвращает (медиана времени в мс, пиковая память в МБ, размер файла в КБ)."""
+    timings, size = [], 0
+    for _ in range(REPEATS):
+        if before_each:
+            before_each()
+        buffer = io.BytesIO()
+        started = time.perf_counter()
+        render(data, buffer)
+        timings.append((time.perf_counter() - started) * 1000)
+        size = buffer.tell()
+
+    if before_each:
+        before_each()
+    tracemalloc.start()
+    render(data, io.BytesIO())
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(timings), peak / 1024 / 1024, size / 1024
+
+
+def main():
+    random.seed(42)
+    renderer = InvoiceRenderer()
+    with tempfile.TemporaryDirectory() as folder:
+        images = make_images(folder)
+        print(f"Повторов: {REPEATS}, разных фото: {DISTINCT_IMAGES}\n")
+        print(f"{'позиций':>8}  {'вариант':<20} {'время, мс':>10} {'пик памяти, МБ':>15} {'файл, КБ':>9}")
+        for line_count in LINES:
+            data = make_invoice_data(line_count, images)
+            cases = (
+                ("PDF, холодный кэш", renderer.render_pdf, renderer.clear_thumbnails),
+                ("PDF, тёплый кэш", renderer.render_pdf, None),
+                ("Excel", renderer.render_xlsx, None),
+            )
+            for title, render, before_each in cases:
+                elapsed, peak, size = measure(render, data, before_each)
+                print(f"{line_count:>8}  {title:<20} {elapsed:>10.1f} {peak:>15.1f} {size:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# D:\globus-market\backend\benchmarks\login_benchmark.py
+#
+# Нагрузочный тест входа: сколько стоит вход под нагрузкой и как он влияет на остальные запросы.
+# 1. Замеряет задержку каталога (/products/) без нагрузки.
+# 2. Запускает BENCH_LOGIN_CONCURRENCY параллельных потоков, которые непрерывно логинятся,
+#    и одновременно снова замеряет каталог.
+# Печатает p50/p99 входа, число отказов 503 (переполнена очередь bcrypt) и задержку каталога.
+#
+# Сервер должен быть запущен отдельно, например:
+#   uvicorn app.main:app --port 8000
+# Запуск из папки backend:
+#   python -m benchmarks.login_benchmark
+#   BENCH_BASE_URL=http://127.0.0.1:8000 BENCH_LOGIN_CONCURRENCY=32 python -m benchmarks.login_benchmark
+
+import json
+import os
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_URL = os.getenv("BENCH_BASE_URL", "http://127.0.0.1:8000").rstrip("/")
+USERNAME = os.getenv("BENCH_USERNAME", "admin")
+PASSWORD = os.getenv("BENCH_PASSWORD", "admin")
+LOGIN_CONCURRENCY = int(os.getenv("BENCH_LOGIN_CONCURRENCY", "16"))
+DURATION = float(os.getenv("BENCH_DURATION", "10"))
+CATALOG_INTERVAL = 0.05
+
+
+def percentile(values, fraction):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def timed_request(request):
+    """Выполняет запрос, возвращает (HTTP-статус, время в мс)."""
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return status, (time.perf_counter() - started) * 1000
+
+
+def login_request():
+    body = urllib.parse.urlencode({"username": USERNAME, "password": PASSWORD}).encode()
+    return urllib.request.Request(f"{BASE_URL}/auth/login", data=body, method="POST")
+
+
+def catalog_request():
+    return urllib.request.Request(f"{BASE_URL}/products/?limit=48")
+
+
+def measure_catalog(stop_event, timings):
+    while not stop_event.is_set():
+        status, elapsed = timed_request(catalog_request())
+        if status == 200:
+            timings.append(elapsed)
+        time.sleep(CATALOG_INTERVAL)
+
+
+def login_worker(stop_event, timings, statuses):
+    while not stop_event.is_set():
+        status, elapsed = timed_request(login_request())
+        statuses.append(status)
+        if status == 200:
+            timings.append(elapsed)
+        elif status == 503:
+            time.sleep(0.1)  # как и клиент, уважаем Retry-After, но не ждём целую секунду
+
+
+def run_phase(with_logins: bool):
+    stop_event = threading.Event()
+    catalog_timings, login_timings, login_statuses = [], [], []
+    workers = LOGIN_CONCURRENCY if with_logins else 0
+    with ThreadPoolExecutor(max_workers=workers + 1) as pool:
+        pool.submit(measure_catalog, stop_event, catalog_timings)
+        for _ in range(workers):
+            pool.submit(login_worker, stop_event, login_timings, login_statuses)
+        time.sleep(DURATION)
+        stop_event.set()
+    return catalog_timings, login_timings, login_statuses
+
+
+def report(title, timings):
+    if not timings:
+        print(f"{title:<28} нет успешных запросов")
+        return
+    print(
+        f"{title:<28} n={len(timings):<6} p50={statistics.median(timings):8.1f} мс"
+        f"  p99={percentile(timings, 0.99):8.1f} мс"
+    )
+
+
+def main():
+    status, _ = timed_request(login_request())
+    if status != 200:
+        raise SystemExit(f"Не удалось войти как {USERNAME!r} (HTTP {status}) - проверьте BENCH_USERNAME/BENCH_PASSWORD")
+    print(f"Сервер: {BASE_URL}, потоков входа: {LOGIN_CONCURRENCY}, длительность фазы: {DURATION:.0f} с\n")
+
+    catalog_idle, _, _ = run_phase(with_logins=False)
+    report("каталог без нагрузки", catalog_idle)
+
+    catalog_busy, login_timings, login_statuses = run_phase(with_logins=True)
+    report("каталог при входах", catalog_busy)
+    report("вход (успешные)", login_timings)
+    counts = {code: login_statuses.count(code) for code in sorted(set(login_statuses))}
+    print(f"{'ответы на вход':<28} {json.dumps(counts)}")
+
+
+if __name__ == "__main__":
+    main()
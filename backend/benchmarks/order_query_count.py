@@ -0,0 +1,140 @@
+# D:\globus-market\backend\benchmarks\order_query_count.py
+#
+# Проверка, что списки заказов не делают N+1 запросов (with_order_details в app/routers/orders.py):
+# число SQL-запросов GET /orders/ и GET /admin/orders вместе с сериализацией ответа
+# одинаково для 2 заказов и для BENCH_ORDERS заказов по BENCH_LINES позиций.
+# Запросы считаются слушателем before_cursor_execute на engine.
+#
+# Запуск из папки backend:
+#   python -m benchmarks.order_query_count
+#   BENCH_ORDERS=1000 BENCH_LINES=10 python -m benchmarks.order_query_count
+#
+# ВНИМАНИЕ: скрипт пересоздаёт таблицы в базе BENCH_DATABASE_URL - не указывайте рабочую базу.
+
+import os
+import secrets
+import tempfile
+
+BENCH_DATABASE_URL = os.getenv(
+    "BENCH_DATABASE_URL",
+    f"sqlite:///{os.path.join(tempfile.gettempdir(), 'globus_order_query_count.db')}"
+)
+# app.database читает DATABASE_URL при импорте, поэтому подменяем его до импорта приложения
+os.environ["DATABASE_URL"] = BENCH_DATABASE_URL
+
+from fastapi import Response
+from sqlalchemy import event, insert
+
+from app import models, schemas
+from app.database import SessionLocal, engine
+from app.routers.admin import get_all_orders
+from app.routers.orders import get_orders, ORDERS_MAX_PAGE_SIZE
+
+ORDERS = min(int(os.getenv("BENCH_ORDERS", "200")), ORDERS_MAX_PAGE_SIZE)  # все заказы - на одной странице
+LINES = int(os.getenv("BENCH_LINES", "5"))
+SMALL_ORDERS = 2
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __enter__(self):
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+
+def prepare_database() -> list:
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        category = models.Category(name="Категория")
+        db.add(category)
+        db.flush()
+        subcategory = models.Subcategory(name="Подкатегория", category_id=category.id)
+        db.add(subcategory)
+        db.flush()
+        products = [
+            models.Product(sku=f"00-{index:05d}", name=f"Товар {index}", price=100 + index, stock=1000,
+                           is_visible=True, subcategory_id=subcategory.id)
+            for index in range(LINES * 4)
+        ]
+        db.add_all(products)
+        db.commit()
+        return [product.id for product in products]
+    finally:
+        db.close()
+
+
+def add_orders(count: int, product_ids: list, start: int):
+    db = SessionLocal()
+    try:
+        for index in range(start, start + count):
+            order = models.Order(
+                order_number=f"2024-01-{index + 1:05d}",
+                customer_name="Клиент",
+                customer_phone="0",
+                private_key=secrets.token_urlsafe(16),
+            )
+            db.add(order)
+            db.flush()
+            db.execute(insert(models.OrderItem), [
+                {"order_id": order.id, "product_id": product_ids[(index + line) % len(product_ids)],
+                 "quantity": line + 1, "price_per_item": 100.0}
+                for line in range(LINES)
+            ])
+        db.commit()
+    finally:
+        db.close()
+
+
+def count_queries() -> dict:
+    """Число запросов каждого эндпоинта - в новой сессии, чтобы ничего не бралось из identity map."""
+    counts = {}
+    db = SessionLocal()
+    try:
+        with QueryCounter() as counter:
+            orders = get_orders(Response(), db, date_from=None, date_to=None, limit=ORDERS_MAX_PAGE_SIZE, offset=0)
+            # Как response_model: ленивые загрузки, если они есть, случились бы здесь
+            [schemas.Order.from_orm(order).dict() for order in orders]
+        counts["GET /orders/"] = (counter.count, len(orders))
+    finally:
+        db.close()
+
+    db = SessionLocal()
+    try:
+        with QueryCounter() as counter:
+            response = get_all_orders(Response(), date_str=None, status=None, date_from=None, date_to=None,
+                                      limit=None, offset=0, db=db, admin=None)
+        counts["GET /admin/orders"] = (counter.count, int(response.headers["x-total-count"]))
+    finally:
+        db.close()
+    return counts
+
+
+def main():
+    print(f"База: {engine.url} ({engine.dialect.name}), позиций в заказе: {LINES}")
+    product_ids = prepare_database()
+    add_orders(SMALL_ORDERS, product_ids, 0)
+    small = count_queries()
+    add_orders(ORDERS - SMALL_ORDERS, product_ids, SMALL_ORDERS)
+    large = count_queries()
+
+    ok = True
+    for endpoint in small:
+        (small_queries, small_orders), (large_queries, large_orders) = small[endpoint], large[endpoint]
+        print(f"{endpoint:<18} {small_orders} заказов: {small_queries} запросов, {large_orders} заказов: {large_queries} запросов")
+        ok = ok and small_queries == large_queries and large_orders == ORDERS
+    print("OK" if ok else "ОШИБКА: число запросов растёт с числом заказов")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+# D:\globus-market\backend\benchmarks\serialization_benchmark.py
+#
+# Бенчмарк сериализации больших списков (app/serialization.py, app/compression.py):
+# время (общее и CPU) и размер ответа для списка товаров и списка заказов.
+# Сравниваются три пути:
+#   - "Pydantic + json": как было - объект схемы на строку, jsonable_encoder, стандартный json (JSONResponse);
+#   - "Pydantic + orjson": то же, но рендер ORJSONResponse (что даёт одна смена default_response_class);
+#   - "быстрый путь": строки ORM сразу в словари по полям схемы + orjson.
+# Для тела ответа дополнительно замеряется сжатие gzip и brotli (если установлен brotli) с настройками мидлвари.
+#
+# Запуск из папки backend:
+#   python -m benchmarks.serialization_benchmark
+#   BENCH_PRODUCTS=50000 BENCH_ORDERS=5000 BENCH_REPEATS=10 python -m benchmarks.serialization_benchmark
+#
+# БД не нужна: объекты ORM создаются в памяти, сериализатору всё равно, откуда они взялись.
+
+import os
+import random
+import statistics
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from app import models, schemas
+from app.compression import brotli, BROTLI_QUALITY, GZIP_COMPRESS_LEVEL
+from app.serialization import serialize_list
+
+PRODUCTS = int(os.getenv("BENCH_PRODUCTS", "10000"))
+ORDERS = int(os.getenv("BENCH_ORDERS", "1000"))
+ITEMS_PER_ORDER = int(os.getenv("BENCH_ITEMS_PER_ORDER", "5"))
+REPEATS = int(os.getenv("BENCH_REPEATS", "5"))
+
+
+def make_products(count: int) -> list:
+    started = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    products = []
+    for index in range(count):
+        image = f"/static/images/products/00-{index:05d}-1631b9616d91"
+        products.append(models.Product(
+            id=index + 1,
+            sku=f"00-{index:05d}",
+            name=f"Товар номер {index} с достаточно длинным названием",
+            price=round(random.uniform(100, 5000), 2),
+            image_url=f"{image}-800.webp",
+            image_variants={str(size): f"{image}-{size}.webp" for size in (200, 400, 800)},
+            stock=random.randint(0, 500),
+            is_visible=True,
+            subcategory_id=random.randint(1, 40),
+            updated_at=started + timedelta(seconds=index),
+        ))
+    return products
+
+
+def make_orders(count: int, products: list) -> list:
+    started = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    orders = []
+    for index in range(count):
+        items = [
+            models.OrderItem(
+                id=index * ITEMS_PER_ORDER + line,
+                quantity=random.randint(1, 20),
+                price_per_item=product.price,
+                product=product,
+                comment="Комментарий к позиции" if line == 0 else None,
+                returned_quantity=0,
+            )
+            for line, product in enumerate(random.sample(products, ITEMS_PER_ORDER))
+        ]
+        orders.append(models.Order(
+            id=index + 1,
+            order_number=f"2024-01-{index + 1:05d}",
+            status="new",
+            created_at=started + timedelta(minutes=index),
+            return_processed_without_discount=False,
+            discount_percent=5.0,
+            customer_name="Тестовый клиент",
+            customer_phone="+7 700 000 00 00",
+            invoice_status="ready",
+            invoice_path_pdf=f"/invoices/order_2024-01-{index + 1:05d}-0123456789ab.pdf",
+            invoice_path_xlsx=f"/invoices/order_2024-01-{index + 1:05d}-0123456789ab.xlsx",
+            private_key="k" * 22,
+            items=items,
+        ))
+    return orders
+
+
+def pydantic_json(rows, schema) -> bytes:
+    return JSONResponse(jsonable_encoder([schema.from_orm(row) for row in rows])).body
+
+
+def pydantic_orjson(rows, schema) -> bytes:
+    return ORJSONResponse(jsonable_encoder([schema.from_orm(row) for row in rows])).body
+
+
+def fast_path(rows, schema) -> bytes:
+    return ORJSONResponse(serialize_list(rows, schema)).body
+
+
+def measure(function, *args):
+    """Возвращает (медиана времени в мс, медиана CPU в мс, результат последнего вызова)."""
+    wall, cpu, result = [], [], None
+    for _ in range(REPEATS):
+        started, started_cpu = time.perf_counter(), time.process_time()
+        result = function(*args)
+        wall.append((time.perf_counter() - started) * 1000)
+        cpu.append((time.process_time() - started_cpu) * 1000)
+    return statistics.median(wall), statistics.median(cpu), result
+
+
+def gzip_body(body: bytes) -> bytes:
+    compressor = zlib.compressobj(GZIP_COMPRESS_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(body) + compressor.flush()
+
+
+def brotli_body(body: bytes) -> bytes:
+    return brotli.compress(body, quality=BROTLI_QUALITY)
+
+
+def main():
+    random.seed(42)
+    products = make_products(PRODUCTS)
+    orders = make_orders(ORDERS, products)
+    print(f"Повторов: {REPEATS}, товаров: {PRODUCTS}, заказов: {ORDERS} по {ITEMS_PER_ORDER} позиций\n")
+
+    for title, rows, schema in (("товары", products, schemas.Product), ("заказы", orders, schemas.Order)):
+        print(f"{title}:")
+        print(f"  {'вариант':<20} {'время, мс':>10} {'CPU, мс':>9} {'тело, КБ':>9}")
+        bodies = []
+        for variant, function in (
+            ("Pydantic + json", pydantic_json),
+            ("Pydantic + orjson", pydantic_orjson),
+            ("быстрый путь", fast_path),
+        ):
+            elapsed, cpu, body = measure(function, rows, schema)
+            bodies.append(body)
+            print(f"  {variant:<20} {elapsed:>10.1f} {cpu:>9.1f} {len(body) / 1024:>9.0f}")
+        if len(set(bodies[1:])) != 1:
+            print("  ВНИМАНИЕ: быстрый путь отдаёт не то же самое, что Pydantic")
+
+        body = bodies[-1]
+        codecs = [(f"gzip (уровень {GZIP_COMPRESS_LEVEL})", gzip_body)]
+        if brotli is not None:
+            codecs.append((f"brotli (качество {BROTLI_QUALITY})", brotli_body))
+        else:
+            print("  brotli не установлен (pip install brotli) - только gzip")
+        for codec, function in codecs:
+            elapsed, cpu, compressed = measure(function, body)
+            print(f"  {codec:<20} {elapsed:>10.1f} {cpu:>9.1f} {len(compressed) / 1024:>9.0f}"
+                  f"  ({len(compressed) / len(body):.0%} от тела)")
+        print()
+
+
+if __name__ == "__main__":
+    main()
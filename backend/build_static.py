@@ -0,0 +1,86 @@
+# D:\globus-market\backend\build_static.py
+#
+# Шаг сборки: создаёт рядом с текстовыми статическими файлами заранее сжатые копии
+# (file.js -> file.js.gz и file.js.br), чтобы сервер не тратил CPU на сжатие при каждом запросе.
+# CachedStaticFiles (app/static_files.py) отдаёт эти копии клиентам, которые их принимают.
+#
+# Запуск из папки backend (по умолчанию обрабатывает ../frontend и static):
+#   python build_static.py
+#   python build_static.py ../frontend
+#
+# Brotli (.br) создаётся, только если установлен пакет brotli (pip install brotli), иначе - только .gz.
+
+import gzip
+import os
+import sys
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BASE_DIR = Path(__file__).resolve().parent
+DEFAULT_DIRECTORIES = [BASE_DIR.parent / "frontend", BASE_DIR / "static"]
+
+# Сжимаем только текст: картинки (webp/png/jpg) уже сжаты, повторное сжатие ничего не даёт
+COMPRESSIBLE_EXTENSIONS = {".html", ".js", ".css", ".svg", ".json", ".webmanifest", ".txt", ".xml", ".ico"}
+# Совсем маленькие файлы не сжимаем: выигрыш меньше накладных расходов
+MIN_SIZE = 512
+
+
+def write_if_smaller(target: Path, original_size: int, data: bytes) -> bool:
+    """Записывает сжатую копию, только если она действительно меньше исходного файла."""
+    if len(data) >= original_size:
+        if target.exists():
+            target.unlink()
+        return False
+    tmp_path = target.with_name(f".{target.name}.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, target)
+    # Время изменения как у исходника - удобно проверять, что копия не устарела
+    stat_result = target.with_suffix("").stat()
+    os.utime(target, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns))
+    return True
+
+
+def precompress_file(path: Path):
+    data = path.read_bytes()
+    written = []
+    # mtime=0 - одинаковый файл на выходе при одинаковом входе (не меняется ETag при пересборке)
+    if write_if_smaller(path.with_name(path.name + ".gz"), len(data), gzip.compress(data, compresslevel=9, mtime=0)):
+        written.append("gz")
+    if brotli is not None:
+        if write_if_smaller(path.with_name(path.name + ".br"), len(data), brotli.compress(data, quality=11)):
+            written.append("br")
+    return written
+
+
+def precompress_directory(directory: Path):
+    total = 0
+    for path in sorted(directory.rglob("*")):
+        if not path.is_file() or path.suffix.lower() not in COMPRESSIBLE_EXTENSIONS:
+            continue
+        if path.stat().st_size < MIN_SIZE:
+            continue
+        written = precompress_file(path)
+        if written:
+            total += 1
+            print(f"  {path.relative_to(directory)}: {', '.join(written)}")
+    return total
+
+
+def main(argv):
+    directories = [Path(arg).resolve() for arg in argv] or DEFAULT_DIRECTORIES
+    if brotli is None:
+        print("Пакет brotli не установлен - создаются только .gz")
+    for directory in directories:
+        if not directory.is_dir():
+            print(f"Папка {directory} не найдена, пропускаем")
+            continue
+        print(f"{directory}:")
+        print(f"Сжато файлов: {precompress_directory(directory)}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
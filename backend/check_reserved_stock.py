@@ -0,0 +1,40 @@
+# D:\globus-market\backend\check_reserved_stock.py
+#
+# Проверка таблицы reserved_stock (товар в незавершённых заказах) по самим заказам.
+#   python check_reserved_stock.py          - только показать расхождения
+#   python check_reserved_stock.py --fix    - пересобрать таблицу, если есть расхождения
+
+import sys
+
+from app.database import SessionLocal
+from app.inventory import verify_reserved_stock, rebuild_reserved_stock
+
+
+def main(fix: bool):
+    db = SessionLocal()
+    try:
+        mismatches = verify_reserved_stock(db)
+        if not mismatches:
+            print("Расхождений нет.")
+            return 0
+
+        print(f"Найдено расхождений: {len(mismatches)}")
+        for mismatch in mismatches[:50]:
+            print(
+                f"  товар {mismatch['product_id']}: в таблице (новые, обработанные) = {mismatch['stored']}, "
+                f"по заказам = {mismatch['expected']}"
+            )
+        if not fix:
+            print("Для исправления запустите с ключом --fix")
+            return 1
+
+        rebuild_reserved_stock(db)
+        db.commit()
+        print("Таблица reserved_stock пересобрана.")
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main("--fix" in sys.argv[1:]))
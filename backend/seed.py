@@ -21,6 +21,9 @@ def seed_data():
         # При первом запуске эти команды ничего не сделают, это нормально
         db.query(models.OrderItem).delete()
         db.query(models.Order).delete()
+        db.query(models.OrderNumberCounter).delete()
+        db.query(models.ReservedStock).delete()
+        db.query(models.StockMovement).delete()
         db.query(models.Product).delete()
         db.query(models.Subcategory).delete()
         db.query(models.Category).delete()
@@ -305,10 +305,16 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
 
+    // Накладные формируются на сервере в фоне, поэтому ссылаемся не на файл напрямую,
+    // а на эндпоинт, который дождётся готовности и перенаправит на свежий файл.
+    function invoiceUrl(order, format) {
+        return `${API_BASE_URL}/orders/${order.id}/invoice/${format}`;
+    }
+
     function generateActionButtons(order) {
         const editUrl = `edit_order.html?id=${order.id}`;
-        const pdfUrl = `${API_BASE_URL}${order.invoice_path_pdf}`;
-        const excelUrl = `${API_BASE_URL}${order.invoice_path_xlsx}`;
+        const pdfUrl = invoiceUrl(order, 'pdf');
+        const excelUrl = invoiceUrl(order, 'xlsx');
         
         const pdfLink = `<a href="${pdfUrl}" class="action-link pdf" download>PDF</a>`;
         const excelLink = `<a href="${excelUrl}" class="action-link excel" download>Excel</a>`;
@@ -336,8 +342,8 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
     function generateMobileActionButtons(order) {
-        const pdfUrl = `${API_BASE_URL}${order.invoice_path_pdf}`;
-        const excelUrl = `${API_BASE_URL}${order.invoice_path_xlsx}`;
+        const pdfUrl = invoiceUrl(order, 'pdf');
+        const excelUrl = invoiceUrl(order, 'xlsx');
         
         const pdfBtn = `<a href="${pdfUrl}" class="order-btn pdf" download>PDF</a>`;
         const excelBtn = `<a href="${excelUrl}" class="order-btn excel" download>Excel</a>`;
@@ -969,7 +975,7 @@ document.addEventListener('DOMContentLoaded', () => {
         else if (target.matches('#editor-btn-cancel-return')) toggleMobileReturnMode(false);
         else if (target.matches('#editor-btn-confirm-return')) processMobileReturn();
         else if (target.matches('#editor-btn-copy')) {
-            const pdfUrl = `${API_BASE_URL}${mobileCurrentOrderData.invoice_path_pdf}`;
+            const pdfUrl = invoiceUrl(mobileCurrentOrderData, 'pdf');
             const shareText = `Здравствуйте! Ваша накладная по заказу №${mobileCurrentOrderData.order_number}:\n${pdfUrl}`;
             navigator.clipboard.writeText(shareText).then(() => alert('Текст с ссылкой на PDF скопирован!'));
         }
@@ -19,6 +19,12 @@ document.addEventListener('DOMContentLoaded', () => {
     loadOrderDetails(orderId, token);
 });
 
+// Клиенту отдаём постоянную ссылку на эндпоинт накладной: файл после каждого изменения заказа
+// получает новое имя (а старый удаляется), эндпоинт же всегда перенаправит на актуальный.
+function invoiceUrl(order, format) {
+    return `${API_BASE_URL}/orders/${order.id}/invoice/${format}`;
+}
+
 async function loadOrderDetails(orderId, token) {
     const container = document.getElementById('edit-form-container');
     container.innerHTML = '<p>Загрузка данных заказа...</p>';
@@ -314,7 +320,7 @@ function renderEditForm(order, token) {
     });
     
     document.getElementById('share-btn').addEventListener('click', () => {
-        const pdfUrl = `${API_BASE_URL}${currentOrderData.invoice_path_pdf}`;
+        const pdfUrl = invoiceUrl(currentOrderData, 'pdf');
         const shareText = `Здравствуйте! Ваша накладная по заказу №${currentOrderData.order_number}:\n${pdfUrl}`;
         navigator.clipboard.writeText(shareText).then(() => alert('Текст с ссылкой на PDF скопирован!'));
     });
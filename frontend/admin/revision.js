@@ -47,6 +47,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 const tr = document.createElement('tr');
                 tr.dataset.productId = p.product_id;
                 tr.dataset.dbStock = p.db_stock;
+                tr.dataset.updatedAt = p.updated_at || '';
 
                 tr.innerHTML = `
                     <td>${p.sku}</td>
@@ -66,6 +67,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 const tr = document.createElement('tr');
                 tr.dataset.productId = p.product_id;
                 tr.dataset.dbStock = p.db_stock;
+                tr.dataset.updatedAt = p.updated_at || '';
                 tr.innerHTML = `
                     <td class="card-cell">
                         <div class="revision-card-mobile">
@@ -142,7 +144,9 @@ document.addEventListener('DOMContentLoaded', () => {
                 const tr = input.closest('tr');
                 updates.push({
                     product_id: parseInt(tr.dataset.productId),
-                    new_stock: parseInt(input.value)
+                    new_stock: parseInt(input.value),
+                    // Сервер не перезапишет остаток, если товар изменился после загрузки ревизии
+                    expected_updated_at: tr.dataset.updatedAt || null
                 });
             }
         });
@@ -172,7 +176,11 @@ document.addEventListener('DOMContentLoaded', () => {
             }
 
             const result = await response.json();
-            alert(result.message);
+            if (result.conflicts && result.conflicts.length > 0) {
+                alert(`${result.message}\n\nПересчитайте эти товары заново - таблица будет обновлена.`);
+            } else {
+                alert(result.message);
+            }
             loadRevisionData(); // Обновляем данные на странице
 
         } catch (error) {
@@ -4,7 +4,7 @@ const API_BASE_URL = "https://globus-market-backend.onrender.com";
 const PLACEHOLDER_IMAGE = "https://placehold.co/600x400?text=No+Image";
 
 let cart = []; // Глобальная переменная для корзины
-let products = []; // Глобальная переменная для всех загруженных товаров
+let products = []; // Глобальная переменная для загруженных (на текущий момент) товаров
 
 // --- Ссылки на DOM-элементы ---
 const cartModal = document.getElementById('cart-modal');
@@ -26,49 +26,54 @@ async function loadContacts() {
     try {
         const response = await fetch(`${API_BASE_URL}/settings/public`);
         if (!response.ok) return;
+        renderContacts(await response.json());
+    } catch (error) {
+        console.error('Не удалось загрузить контакты:', error);
+    }
+}
 
-        const settings = await response.json();
-        const contactBar = document.getElementById('contact-bar');
-        if (!contactBar) return;
-        
-        let contactsHTML = '';
-
-        // WhatsApp
-        if (settings.contact_whatsapp && settings.contact_whatsapp_display) {
-            contactsHTML += `
-                <a href="${settings.contact_whatsapp}" target="_blank">
-                    <img src="https://upload.wikimedia.org/wikipedia/commons/6/6b/WhatsApp.svg" class="contact-icon" alt="WhatsApp"> 
-                    ${settings.contact_whatsapp_display}
-                </a>`;
-        }
-        
-        // --- НАЧАЛО ИЗМЕНЕНИЙ ---
-        // Instagram (проверяем все 3 ссылки)
-        [1, 2, 3].forEach(i => {
-            const key = `contact_instagram_${i}`;
-            if (settings[key]) {
-                contactsHTML += `
-                    <a href="${settings[key]}" target="_blank">
-                        <img src="https://upload.wikimedia.org/wikipedia/commons/a/a5/Instagram_icon.png" class="contact-icon" alt="Instagram">
-                        Instagram ${i}
-                    </a>`;
-            }
-        });
-        // --- КОНЕЦ ИЗМЕНЕНИЙ ---
-
-        // Telegram
-        if (settings.contact_telegram) {
+/**
+ * Отображает контакты из публичных настроек
+ */
+function renderContacts(settings) {
+    const contactBar = document.getElementById('contact-bar');
+    if (!contactBar) return;
+    
+    let contactsHTML = '';
+
+    // WhatsApp
+    if (settings.contact_whatsapp && settings.contact_whatsapp_display) {
+        contactsHTML += `
+            <a href="${settings.contact_whatsapp}" target="_blank">
+                <img src="https://upload.wikimedia.org/wikipedia/commons/6/6b/WhatsApp.svg" class="contact-icon" alt="WhatsApp"> 
+                ${settings.contact_whatsapp_display}
+            </a>`;
+    }
+    
+    // --- НАЧАЛО ИЗМЕНЕНИЙ ---
+    // Instagram (проверяем все 3 ссылки)
+    [1, 2, 3].forEach(i => {
+        const key = `contact_instagram_${i}`;
+        if (settings[key]) {
             contactsHTML += `
-                <a href="${settings.contact_telegram}" target="_blank">
-                    <img src="https://upload.wikimedia.org/wikipedia/commons/8/82/Telegram_logo.svg" class="contact-icon" alt="Telegram">
-                    Telegram
+                <a href="${settings[key]}" target="_blank">
+                    <img src="https://upload.wikimedia.org/wikipedia/commons/a/a5/Instagram_icon.png" class="contact-icon" alt="Instagram">
+                    Instagram ${i}
                 </a>`;
         }
-
-        contactBar.innerHTML = contactsHTML;
-    } catch (error) {
-        console.error('Не удалось загрузить контакты:', error);
+    });
+    // --- КОНЕЦ ИЗМЕНЕНИЙ ---
+
+    // Telegram
+    if (settings.contact_telegram) {
+        contactsHTML += `
+            <a href="${settings.contact_telegram}" target="_blank">
+                <img src="https://upload.wikimedia.org/wikipedia/commons/8/82/Telegram_logo.svg" class="contact-icon" alt="Telegram">
+                Telegram
+            </a>`;
     }
+
+    contactBar.innerHTML = contactsHTML;
 }
 
 /**
@@ -81,97 +86,104 @@ async function loadCategories() {
     try {
         const response = await fetch(`${API_BASE_URL}/categories`);
         if (!response.ok) throw new Error('Ошибка сети');
-        const categories = await response.json();
+        renderCategories(await response.json());
+    } catch (error) {
+        console.error("Не удалось загрузить категории:", error);
+        desktopContainer.innerHTML = '<p>Не удалось загрузить категории.</p>';
+        mobileNavContainer.innerHTML = '<p>Не удалось загрузить категории.</p>';
+    }
+}
 
-        // --- 1. ГЕНЕРАЦИЯ ДЛЯ ДЕСКТОПНОГО САЙДБАРА ---
-        let desktopHTML = `<h2>Категории</h2><ul>
-            <li><a href="#" class="category-link all-products-link active">Все товары</a></li>
-        `;
-        categories.forEach(cat => {
-            desktopHTML += `<li class="category-item">
-                <span class="category-link" data-category-id="${cat.id}">${cat.name}</span>`;
-            if (cat.subcategories && cat.subcategories.length > 0) {
-                desktopHTML += '<ul>';
-                cat.subcategories.forEach(sub => {
-                    desktopHTML += `<li>
-                        <a href="#" class="subcategory-link" data-subcategory-id="${sub.id}">
-                            ${sub.name} (${sub.product_count})
-                        </a>
-                    </li>`;
-                });
-                desktopHTML += '</ul>';
-            }
-            desktopHTML += '</li>';
-        });
-        desktopHTML += '</ul>';
-        desktopContainer.innerHTML = desktopHTML;
-
-        // --- 2. ГЕНЕРАЦИЯ ДЛЯ МОБИЛЬНОЙ НАВИГАЦИИ ---
-        mobileNavContainer.innerHTML = '';
-        const mainTabsContainer = document.createElement('div');
-        mainTabsContainer.className = 'main-categories';
-        const subTabsContainer = document.createElement('div');
-        subTabsContainer.className = 'sub-categories';
-
-        const allProductsTab = document.createElement('button');
-        allProductsTab.className = 'main-category-tab active';
-        allProductsTab.textContent = 'Все товары';
-        allProductsTab.onclick = () => {
-            loadProducts();
-            setActiveTab(allProductsTab, '.main-category-tab');
-            subTabsContainer.innerHTML = '';
-        };
-        mainTabsContainer.appendChild(allProductsTab);
-
-        const renderSubTabs = (category) => {
-            subTabsContainer.innerHTML = '';
-            const allSubTab = document.createElement('button');
-            allSubTab.className = 'sub-category-tab active';
-            allSubTab.textContent = `Все в "${category.name}"`;
-            allSubTab.onclick = () => {
-                loadProducts(null, null, category.id);
-                setActiveTab(allSubTab, '.sub-category-tab');
-            };
-            subTabsContainer.appendChild(allSubTab);
-
-            category.subcategories.forEach(sub => {
-                const subTab = document.createElement('button');
-                subTab.className = 'sub-category-tab';
-                subTab.textContent = `${sub.name} (${sub.product_count})`;
-                subTab.onclick = () => {
-                    loadProducts(null, sub.id);
-                    setActiveTab(subTab, '.sub-category-tab');
-                };
-                subTabsContainer.appendChild(subTab);
+/**
+ * Отображает дерево категорий в сайдбаре и мобильной навигации
+ */
+function renderCategories(categories) {
+    const desktopContainer = document.getElementById('categories-container');
+    const mobileNavContainer = document.getElementById('category-navigation');
+
+    // --- 1. ГЕНЕРАЦИЯ ДЛЯ ДЕСКТОПНОГО САЙДБАРА ---
+    let desktopHTML = `<h2>Категории</h2><ul>
+        <li><a href="#" class="category-link all-products-link active">Все товары</a></li>
+    `;
+    categories.forEach(cat => {
+        desktopHTML += `<li class="category-item">
+            <span class="category-link" data-category-id="${cat.id}">${cat.name}</span>`;
+        if (cat.subcategories && cat.subcategories.length > 0) {
+            desktopHTML += '<ul>';
+            cat.subcategories.forEach(sub => {
+                desktopHTML += `<li>
+                    <a href="#" class="subcategory-link" data-subcategory-id="${sub.id}">
+                        ${sub.name} (${sub.product_count})
+                    </a>
+                </li>`;
             });
+            desktopHTML += '</ul>';
+        }
+        desktopHTML += '</li>';
+    });
+    desktopHTML += '</ul>';
+    desktopContainer.innerHTML = desktopHTML;
+
+    // --- 2. ГЕНЕРАЦИЯ ДЛЯ МОБИЛЬНОЙ НАВИГАЦИИ ---
+    mobileNavContainer.innerHTML = '';
+    const mainTabsContainer = document.createElement('div');
+    mainTabsContainer.className = 'main-categories';
+    const subTabsContainer = document.createElement('div');
+    subTabsContainer.className = 'sub-categories';
+
+    const allProductsTab = document.createElement('button');
+    allProductsTab.className = 'main-category-tab active';
+    allProductsTab.textContent = 'Все товары';
+    allProductsTab.onclick = () => {
+        loadProducts();
+        setActiveTab(allProductsTab, '.main-category-tab');
+        subTabsContainer.innerHTML = '';
+    };
+    mainTabsContainer.appendChild(allProductsTab);
+
+    const renderSubTabs = (category) => {
+        subTabsContainer.innerHTML = '';
+        const allSubTab = document.createElement('button');
+        allSubTab.className = 'sub-category-tab active';
+        allSubTab.textContent = `Все в "${category.name}"`;
+        allSubTab.onclick = () => {
+            loadProducts(null, null, category.id);
+            setActiveTab(allSubTab, '.sub-category-tab');
         };
-
-        categories.forEach((cat, index) => {
-            const mainTab = document.createElement('button');
-            mainTab.className = 'main-category-tab';
-            mainTab.textContent = cat.name;
-            mainTab.onclick = () => {
-                renderSubTabs(cat);
-                setActiveTab(mainTab, '.main-category-tab');
-                // --- ВОТ ИСПРАВЛЕНИЕ --- 
-                // Загружаем товары для всей родительской категории при клике на неё
-                loadProducts(null, null, cat.id); 
+        subTabsContainer.appendChild(allSubTab);
+
+        category.subcategories.forEach(sub => {
+            const subTab = document.createElement('button');
+            subTab.className = 'sub-category-tab';
+            subTab.textContent = `${sub.name} (${sub.product_count})`;
+            subTab.onclick = () => {
+                loadProducts(null, sub.id);
+                setActiveTab(subTab, '.sub-category-tab');
             };
-            mainTabsContainer.appendChild(mainTab);
-
-            if (index === 0 && categories.length > 0) {
-                renderSubTabs(categories[0]);
-            }
+            subTabsContainer.appendChild(subTab);
         });
+    };
 
-        mobileNavContainer.appendChild(mainTabsContainer);
-        mobileNavContainer.appendChild(subTabsContainer);
+    categories.forEach((cat, index) => {
+        const mainTab = document.createElement('button');
+        mainTab.className = 'main-category-tab';
+        mainTab.textContent = cat.name;
+        mainTab.onclick = () => {
+            renderSubTabs(cat);
+            setActiveTab(mainTab, '.main-category-tab');
+            // --- ВОТ ИСПРАВЛЕНИЕ --- 
+            // Загружаем товары для всей родительской категории при клике на неё
+            loadProducts(null, null, cat.id); 
+        };
+        mainTabsContainer.appendChild(mainTab);
 
-    } catch (error) {
-        console.error("Не удалось загрузить категории:", error);
-        desktopContainer.innerHTML = '<p>Не удалось загрузить категории.</p>';
-        mobileNavContainer.innerHTML = '<p>Не удалось загрузить категории.</p>';
-    }
+        if (index === 0 && categories.length > 0) {
+            renderSubTabs(categories[0]);
+        }
+    });
+
+    mobileNavContainer.appendChild(mainTabsContainer);
+    mobileNavContainer.appendChild(subTabsContainer);
 }
 
 // ДОБАВЬ ЭТУ НОВУЮ ФУНКЦИЮ ПОД loadCategories
@@ -185,12 +197,103 @@ function setActiveTab(activeButton, tabSelector) {
 }
 
 /**
- * Загружает и отображает товары с учетом фильтров
+ * Создаёт карточку товара
+ */
+function createProductCard(product) {
+    const card = document.createElement('div');
+    card.className = 'product-card';
+    
+    const itemInCart = cart.find(item => item.id === product.id);
+    const escapedProductName = product.name.replace(/"/g, '&quot;');
+    let imageUrl = product.image_url ? `${API_BASE_URL}${product.image_url}` : PLACEHOLDER_IMAGE;
+    let srcsetAttrs = '';
+    if (product.image_variants) {
+        // Уменьшенные копии: браузер сам выберет подходящий размер под ширину карточки.
+        // В имени файла уже есть хэш содержимого, поэтому ?v= не нужен.
+        const sizes = Object.keys(product.image_variants).map(Number).sort((a, b) => a - b);
+        imageUrl = `${API_BASE_URL}${product.image_variants[String(sizes[Math.min(1, sizes.length - 1)])]}`;
+        const srcset = sizes.map(size => `${API_BASE_URL}${product.image_variants[String(size)]} ${size}w`).join(', ');
+        srcsetAttrs = `srcset="${srcset}" sizes="(max-width: 600px) 50vw, 250px"`;
+    } else if (product.image_url && product.updated_at) {
+        imageUrl += `?v=${new Date(product.updated_at).getTime()}`;
+    }
+    
+    let stockHTML = product.stock !== null ? `<p class="product-stock">В наличии: ${product.stock} шт.</p>` : '';
+    const maxStock = product.stock !== null ? product.stock : 999;
+
+    // --- ОБНОВЛЕННЫЙ БЛОК ДЛЯ КНОПКИ/СЧЁТЧИКА ---
+    let actionBlockHTML = '';
+    if (itemInCart) {
+        // Если товар в корзине, показываем счётчик
+        actionBlockHTML = `
+            <div class="product-quantity-controls active" data-id="${product.id}">
+                <button class="quantity-btn quantity-decrease" aria-label="Уменьшить">-</button>
+                <input type="number" class="quantity-input" value="${itemInCart.quantity}" min="0" max="${maxStock}" readonly>
+                <button class="quantity-btn quantity-increase" aria-label="Увеличить">+</button>
+            </div>
+        `;
+    } else {
+        // Если товара нет в корзине, показываем кнопку
+        actionBlockHTML = `
+            <button class="add-to-cart-btn" data-id="${product.id}" data-name="${escapedProductName}" data-price="${product.price}">
+                В корзину
+            </button>
+        `;
+    }
+
+    card.innerHTML = `
+        <img src="${imageUrl}" ${srcsetAttrs} alt="${escapedProductName}" loading="lazy">
+        <p class="product-name">${product.name}</p>
+        <p class="product-price">${product.price} ₸</p>
+        ${stockHTML}
+        <div class="product-action-area">
+            ${actionBlockHTML}
+        </div>
+    `;
+    return card;
+}
+
+// --- Состояние постраничной загрузки каталога ---
+const PRODUCTS_PAGE_SIZE = 48;
+let productsQuery = null;      // текущие фильтры
+let productsNextCursor = null; // курсор следующей страницы (null - страниц больше нет)
+let productsLoading = false;
+let productsRequestId = 0;     // защищает от ответов на устаревшие запросы при смене фильтра
+const productsSentinel = document.createElement('div');
+productsSentinel.className = 'products-sentinel';
+const productsObserver = new IntersectionObserver((entries) => {
+    if (entries.some(entry => entry.isIntersecting)) {
+        loadNextProductsPage();
+    }
+}, { rootMargin: '600px' });
+
+/**
+ * Загружает и отображает товары с учетом фильтров (первую страницу)
  */
 async function loadProducts(searchQuery = null, subcategoryId = null, categoryId = null) {
     const grid = document.getElementById('products-grid');
     grid.innerHTML = '<p>Загрузка товаров...</p>';
+    productsObserver.unobserve(productsSentinel);
+    productsQuery = { searchQuery, subcategoryId, categoryId };
+    productsNextCursor = null;
+    productsLoading = false;
+    products = [];
+    await loadNextProductsPage(true);
+}
+
+/**
+ * Догружает следующую страницу товаров, когда пользователь доскроллил до конца списка
+ */
+async function loadNextProductsPage(firstPage = false) {
+    if (productsLoading || (!firstPage && !productsNextCursor)) return;
+    productsLoading = true;
+    const requestId = ++productsRequestId;
+
+    const grid = document.getElementById('products-grid');
+    const { searchQuery, subcategoryId, categoryId } = productsQuery;
     let url = new URL(`${API_BASE_URL}/products`);
+    url.searchParams.append('limit', PRODUCTS_PAGE_SIZE);
+    if (productsNextCursor) url.searchParams.append('cursor', productsNextCursor);
     if (searchQuery) url.searchParams.append('search', searchQuery);
     if (subcategoryId) url.searchParams.append('subcategory_id', subcategoryId);
     if (categoryId) url.searchParams.append('category_id', categoryId);
@@ -198,61 +301,62 @@ async function loadProducts(searchQuery = null, subcategoryId = null, categoryId
     try {
         const response = await fetch(url);
         if (!response.ok) throw new Error('Ошибка сети');
-        products = await response.json();
+        const page = await response.json();
+        if (requestId !== productsRequestId) return; // фильтр уже сменился
+
+        renderProductsPage(page, response.headers.get('X-Next-Cursor'), firstPage);
+    } catch (error) {
+        console.error("Не удалось загрузить товары:", error);
+        if (firstPage) grid.innerHTML = '<p>Не удалось загрузить товары.</p>';
+    } finally {
+        if (requestId === productsRequestId) productsLoading = false;
+    }
+}
+
+/**
+ * Добавляет страницу товаров в сетку и запоминает курсор следующей страницы
+ */
+function renderProductsPage(page, nextCursor, firstPage) {
+    const grid = document.getElementById('products-grid');
+    productsNextCursor = nextCursor;
+    products = products.concat(page);
+    if (firstPage) {
         grid.innerHTML = '';
-        if (products.length === 0) {
+        if (page.length === 0) {
             grid.innerHTML = '<p>Товары не найдены.</p>';
             return;
         }
+    }
 
-        products.forEach(product => {
-            const card = document.createElement('div');
-            card.className = 'product-card';
-            
-            const itemInCart = cart.find(item => item.id === product.id);
-            const escapedProductName = product.name.replace(/"/g, '&quot;');
-            let imageUrl = product.image_url ? `${API_BASE_URL}${product.image_url}` : PLACEHOLDER_IMAGE;
-            if (product.image_url && product.updated_at) {
-                imageUrl += `?v=${new Date(product.updated_at).getTime()}`;
-            }
-            
-            let stockHTML = product.stock !== null ? `<p class="product-stock">В наличии: ${product.stock} шт.</p>` : '';
-            const maxStock = product.stock !== null ? product.stock : 999;
-
-            // --- ОБНОВЛЕННЫЙ БЛОК ДЛЯ КНОПКИ/СЧЁТЧИКА ---
-            let actionBlockHTML = '';
-            if (itemInCart) {
-                // Если товар в корзине, показываем счётчик
-                actionBlockHTML = `
-                    <div class="product-quantity-controls active" data-id="${product.id}">
-                        <button class="quantity-btn quantity-decrease" aria-label="Уменьшить">-</button>
-                        <input type="number" class="quantity-input" value="${itemInCart.quantity}" min="0" max="${maxStock}" readonly>
-                        <button class="quantity-btn quantity-increase" aria-label="Увеличить">+</button>
-                    </div>
-                `;
-            } else {
-                // Если товара нет в корзине, показываем кнопку
-                actionBlockHTML = `
-                    <button class="add-to-cart-btn" data-id="${product.id}" data-name="${escapedProductName}" data-price="${product.price}">
-                        В корзину
-                    </button>
-                `;
-            }
+    page.forEach(product => grid.appendChild(createProductCard(product)));
 
-            card.innerHTML = `
-                <img src="${imageUrl}" alt="${escapedProductName}">
-                <p class="product-name">${product.name}</p>
-                <p class="product-price">${product.price} ₸</p>
-                ${stockHTML}
-                <div class="product-action-area">
-                    ${actionBlockHTML}
-                </div>
-            `;
-            grid.appendChild(card);
-        });
+    // Сторож в конце списка: когда он попадает в область видимости, грузим следующую страницу
+    // Переподписка нужна, чтобы наблюдатель заново проверил видимость сторожа после вставки карточек
+    grid.appendChild(productsSentinel);
+    productsObserver.unobserve(productsSentinel);
+    if (productsNextCursor) productsObserver.observe(productsSentinel);
+}
+
+/**
+ * Первая загрузка витрины одним запросом: контакты, категории и первая страница товаров.
+ * Если снимок недоступен - загружаем всё по отдельности, как раньше.
+ */
+async function loadStorefront() {
+    try {
+        const response = await fetch(`${API_BASE_URL}/storefront/snapshot`);
+        if (!response.ok) throw new Error('Ошибка сети');
+        const snapshot = await response.json();
+
+        renderContacts(snapshot.settings);
+        renderCategories(snapshot.categories);
+        productsQuery = { searchQuery: null, subcategoryId: null, categoryId: null };
+        products = [];
+        renderProductsPage(snapshot.products.items, snapshot.products.next_cursor, true);
     } catch (error) {
-        console.error("Не удалось загрузить товары:", error);
-        grid.innerHTML = '<p>Не удалось загрузить товары.</p>';
+        console.error('Не удалось загрузить снимок витрины:', error);
+        loadContacts();
+        loadCategories();
+        loadProducts();
     }
 }
 
@@ -376,10 +480,8 @@ function renderFullCart() {
 
 
 document.addEventListener('DOMContentLoaded', () => {
-    // Первоначальная загрузка данных
-    loadContacts();
-    loadCategories();
-    loadProducts();
+    // Первоначальная загрузка данных (одним запросом)
+    loadStorefront();
 
     // Поиск с задержкой
     const searchInput = document.getElementById('searchInput');